@@ -0,0 +1,37 @@
+"""Compares the two DB read paths of etl.database, pandas.read_sql_* and COPY TO STDOUT parsed by pyarrow, on the largest reads of the pipelines
+and checks that both return the same rows. Needs the warehouse DB of credentials.py with loaded data.
+
+Run from the repository root with: python -m benchmarks.db_read
+"""
+import time
+import pandas as pd
+from sqlalchemy import text
+import etl.database as db
+import etl.dtypes as dt
+from credentials import DB_CONNECTION_PARAMS
+
+READS={
+    'dim_sentence': 'select * from public.dim_sentence',
+    'fact_entity_detection': 'select * from public.fact_entity_detection',
+    'aggregation input': 'select paper_pk, heading, paragraph_type, sentence_type, entity_count, entity_label, entity_name from wide_sentence_entity'
+}
+
+
+def _read_sql(engine, querystring):
+    """The former read path of load_full_table() and load_df_from_query()."""
+    with engine.connect() as connection:
+        return dt.cast_keys(pd.read_sql_query(text(querystring), connection))
+
+if __name__ == "__main__":
+    engine=db.initialize_engine(connection_params=DB_CONNECTION_PARAMS)
+    for name, querystring in READS.items():
+        start=time.perf_counter()
+        expected=_read_sql(engine, querystring)
+        read_sql_seconds=time.perf_counter()-start
+        start=time.perf_counter()
+        result=db.copy_query_to_df(engine, querystring)
+        copy_seconds=time.perf_counter()-start
+        #the COPY path keeps integers nullable and dates as datetime64, so the values are compared without the dtypes
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        print('{}: {} rows, read_sql {:.2f}s, COPY {:.2f}s, speedup {:.1f}x, results identical'.format(
+            name, len(expected.index), read_sql_seconds, copy_seconds, read_sql_seconds/copy_seconds))
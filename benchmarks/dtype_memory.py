@@ -0,0 +1,61 @@
+"""Memory report of the dtype policy on a large synthetic dataset shaped like the sentence, paragraph, fact and aggregation frames.
+
+Run from the repository root with: python -m benchmarks.dtype_memory
+"""
+import numpy as np
+import pandas as pd
+import etl.dtypes as dt
+
+N_SENTENCES=2000000
+N_PARAGRAPHS=200000
+N_FACTS=3000000
+rng=np.random.default_rng(0)
+
+
+def _strings(values, size):
+    """Draws size strings from values, as Python objects like they come from read_csv."""
+    return pd.Series(rng.choice(np.array(values, dtype=object), size=size))
+
+def _keys_after_left_merge(size, high):
+    """Draws keys with 1% missing values, as they are after a left merge (float64 with NaN)."""
+    keys=pd.Series(rng.integers(1, high, size=size), dtype='float64')
+    keys[rng.random(size)<0.01]=np.nan
+    return keys
+
+if __name__ == "__main__":
+    sentence_types=['SENTENCE', 'ABSTRACT', 'HEADER', 'CAPTION', 'REFERENCE', 'MISSING']
+    paragraph_types=['TEXT', 'ABSTRACT', 'LIST', 'MISSING']
+    headings=['Introduction', 'Method', 'Data collection', 'Results', 'Discussion', 'Conclusion', 'Limitations', 'MISSING']+['Section {}'.format(i) for i in range(500)]
+    entity_labels=['MODEL_ELEMENT', 'LEVEL', 'PARTICIPANTS', 'COLLECTION_METHOD', 'SAMPLING', 'ANALYSIS_METHOD', 'SECTOR', 'REGION', 'METRIC', 'TOPIC', 'THEORY']
+    entity_names=['entity {}'.format(i) for i in range(5000)]
+
+    sentences=pd.DataFrame({
+        'sentence_id': ['s{}'.format(i) for i in range(N_SENTENCES)],
+        'sentence': _strings(['A sentence of average length about some topic {}.'.format(i) for i in range(1000)], N_SENTENCES),
+        'sentence_type': _strings(sentence_types, N_SENTENCES),
+        'paper_pk': _keys_after_left_merge(N_SENTENCES, 20000),
+        'paragraph_pk': _keys_after_left_merge(N_SENTENCES, N_PARAGRAPHS)})
+    paragraphs=pd.DataFrame({
+        'para_id': ['p{}'.format(i) for i in range(N_PARAGRAPHS)],
+        'last_section_title': _strings(headings, N_PARAGRAPHS),
+        'last_subsection_title': _strings(headings, N_PARAGRAPHS),
+        'paragraph_type': _strings(paragraph_types, N_PARAGRAPHS),
+        'paper_pk': _keys_after_left_merge(N_PARAGRAPHS, 20000)})
+    facts=pd.DataFrame({
+        'entity_pk': pd.Series(rng.integers(1, len(entity_names), size=N_FACTS)),
+        'sentence_pk': pd.Series(rng.integers(1, N_SENTENCES, size=N_FACTS)),
+        'entity_count': pd.Series(rng.integers(1, 4, size=N_FACTS))})
+    aggregation_input=pd.DataFrame({
+        'paper_pk': _keys_after_left_merge(N_FACTS, 20000),
+        'heading': _strings(headings, N_FACTS),
+        'paragraph_type': _strings(paragraph_types, N_FACTS),
+        'sentence_type': _strings(sentence_types, N_FACTS),
+        'entity_count': pd.Series(rng.integers(1, 4, size=N_FACTS)),
+        'entity_label': _strings(entity_labels, N_FACTS),
+        'entity_name': _strings(entity_names, N_FACTS)})
+
+    dt.memory_report({
+        'transformed sentences': (sentences, dt.apply_dtype_policy(sentences)),
+        'transformed paragraphs': (paragraphs, dt.apply_dtype_policy(paragraphs)),
+        'transformed facts': (facts, dt.apply_dtype_policy(facts)),
+        'aggregation input': (aggregation_input, dt.apply_dtype_policy(aggregation_input, categorical_columns=['heading', 'paragraph_type', 'sentence_type', 'entity_label']))})
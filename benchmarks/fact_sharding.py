@@ -0,0 +1,48 @@
+"""Timing of the key lookup of the Fact ETL, serial vs split into shards in a process pool as the Sentence ETL does it with --shards.
+The Fact ETL is not sharded, as the lookup by direct indexing is faster than sending its arrays to the worker processes.
+
+Run from the repository root with: python -m benchmarks.fact_sharding
+"""
+import time
+import numpy as np
+import etl.fact_entity_detection as fact
+import etl.sharding as sh
+
+N_SENTENCES=5000000
+N_ENTITIES=50000
+N_FACTS=10000000
+SHARD_COUNTS=[2, 4, 8]
+rng=np.random.default_rng(0)
+
+
+def _timed(func, *args):
+    """Runs func and returns its result and the elapsed seconds."""
+    start=time.perf_counter()
+    result=func(*args)
+    return result, time.perf_counter()-start
+
+def _lookup_shard(entity_codes, sentence_codes, entity_counts):
+    """Looks up the keys of the facts of one shard in a worker process."""
+    return fact._lookup_fact_keys(entity_codes, sentence_codes, entity_counts, sh.get_shared('entity_codes'), sh.get_shared('entity_pks'), sh.get_shared('sentence_codes'), sh.get_shared('sentence_pks'))
+
+def _lookup_sharded(entity_codes, sentence_codes, entity_counts, shared, shard_count):
+    """The key lookup of the Fact ETL split by sentence into shards, like the sharded Sentence ETL."""
+    shards=sh.shard_ids(sentence_codes, shard_count)
+    return sh.run_shards(_lookup_shard, [(entity_codes[shards==shard], sentence_codes[shards==shard], entity_counts[shards==shard]) for shard in range(shard_count)], shared)
+
+if __name__ == "__main__":
+    #codes as they come from the key dictionary, the dimension codes in random order as they are stored in the code columns
+    shared={
+        'entity_codes': rng.permutation(N_ENTITIES).astype(np.int64), 'entity_pks': np.arange(1, N_ENTITIES+1, dtype=np.int64),
+        'sentence_codes': rng.permutation(N_SENTENCES).astype(np.int64), 'sentence_pks': np.arange(1, N_SENTENCES+1, dtype=np.int64)}
+    entity_codes=rng.integers(0, N_ENTITIES, size=N_FACTS)
+    sentence_codes=rng.integers(0, N_SENTENCES, size=N_FACTS)
+    entity_counts=rng.integers(1, 4, size=N_FACTS)
+
+    _, serial=_timed(fact._lookup_fact_keys, entity_codes, sentence_codes, entity_counts, shared['entity_codes'], shared['entity_pks'], shared['sentence_codes'], shared['sentence_pks'])
+    print('{} facts, {} sentences, {} entities'.format(N_FACTS, N_SENTENCES, N_ENTITIES))
+    print('{:<10}{:>10}{:>10}'.format('shards', 'seconds', 'speedup'))
+    print('{:<10}{:>10.2f}{:>10.2f}'.format('serial', serial, 1))
+    for shard_count in SHARD_COUNTS:
+        _, sharded=_timed(_lookup_sharded, entity_codes, sentence_codes, entity_counts, shared, shard_count)
+        print('{:<10}{:>10.2f}{:>10.2f}'.format(shard_count, sharded, serial/sharded))
@@ -0,0 +1,37 @@
+"""Measures the import time of the main.py CLI with python -X importtime, as it is until the prompt appears and after loading the modules of
+one process step, and lists the slowest imports. The main module is imported in a fresh interpreter for every measurement.
+
+Run from the repository root with: python -m benchmarks.startup
+"""
+import subprocess
+import sys
+
+#statements executed after importing main, the first one is the state when the prompt appears
+SCENARIOS={
+    'prompt': 'pass',
+    'Keyword ETL modules': 'main.keyw.extract_unique_keywords_from_file',
+    'Author ETL modules': 'main.auth.extract_unique_authors_from_files; main.ares.resolve_authors',
+    'Paper ETL modules': 'main.pape.extract_all_papers'
+}
+REPORTED_IMPORTS=8
+
+
+def _import_times(statement):
+    """Runs import main and the statement with -X importtime and returns the cumulative microseconds per imported module."""
+    result=subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main; {}'.format(statement)], capture_output=True, text=True, check=True)
+    times={}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module=line[len('import time:'):].split('|')
+        #modules imported by other modules are indented, the top-level ones sum up to the total import time
+        times[module.rstrip()]=int(cumulative)
+    return times
+
+if __name__ == "__main__":
+    for name, statement in SCENARIOS.items():
+        times=_import_times(statement)
+        total=sum(microseconds for module, microseconds in times.items() if not module.startswith('  '))
+        print('{}: {} modules imported in {:.3f}s'.format(name, len(times), total/1e6))
+        for module, microseconds in sorted(times.items(), key=lambda item: item[1], reverse=True)[:REPORTED_IMPORTS]:
+            print('  {:<40} {:.3f}s'.format(module.strip(), microseconds/1e6))
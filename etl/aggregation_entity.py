@@ -0,0 +1,99 @@
+import etl.database as db
+import pandas as pd
+from variables import fact_partition_size
+
+#rollup tables of fact_entity_detection over map_entity_hierarchy with their grain. entity_count and fact_count are added up when a delta hits an existing row
+ROLLUP_KEYS={
+    'aggregation_entity_hierarchy': ['parent_entity_pk', 'depth_from_parent'],
+    'aggregation_paper_entity': ['paper_pk', 'parent_entity_pk']
+}
+#how the measures of an existing rollup row are combined with the delta
+ROLLUP_UPDATES={
+    'entity_count': '{0}.entity_count+excluded.entity_count',
+    'fact_count': '{0}.fact_count+excluded.fact_count',
+    'highest_parent_flag': '{0}.highest_parent_flag or excluded.highest_parent_flag'
+}
+#aggregation_paper_entity calculated in the DB from the facts, optionally restricted by a WHERE clause on the paper, e.g. to recalculate papers whose paragraphs changed
+PAPER_ROLLUP_QUERY="""INSERT INTO aggregation_paper_entity (paper_pk, parent_entity_pk, highest_parent_flag, entity_count, fact_count)
+        SELECT coalesce(dp.paper_pk, 0), meh.parent_entity_pk, bool_or(meh.highest_parent_flag), sum(fed.entity_count), count(*)
+        FROM fact_entity_detection fed INNER JOIN map_entity_hierarchy meh ON fed.entity_pk=meh.child_entity_pk
+        LEFT JOIN dim_sentence ds ON fed.sentence_pk=ds.sentence_pk LEFT JOIN dim_paragraph dp ON ds.paragraph_pk=dp.paragraph_pk
+        {}
+        GROUP BY coalesce(dp.paper_pk, 0), meh.parent_entity_pk"""
+#the same rollups calculated in the DB from all facts, to fill the tables of a warehouse loaded before they existed
+BACKFILL_QUERIES={
+    'aggregation_entity_hierarchy': """INSERT INTO aggregation_entity_hierarchy (parent_entity_pk, depth_from_parent, highest_parent_flag, entity_count, fact_count)
+        SELECT meh.parent_entity_pk, meh.depth_from_parent, bool_or(meh.highest_parent_flag), sum(fed.entity_count), count(*)
+        FROM fact_entity_detection fed INNER JOIN map_entity_hierarchy meh ON fed.entity_pk=meh.child_entity_pk
+        GROUP BY meh.parent_entity_pk, meh.depth_from_parent""",
+    'aggregation_paper_entity': PAPER_ROLLUP_QUERY.format('')
+}
+
+
+def load_entity_ancestors(engine):
+    """Loads the ancestors of every entity from map_entity_hierarchy, including the entity itself with depth 0.
+
+    Args:
+        engine (SQL Alchemy engine): engine to connect to the target DB.
+
+    Returns:
+        DataFrame with the columns child_entity_pk, parent_entity_pk, depth_from_parent and highest_parent_flag.
+    """
+    return db.load_df_from_query(engine, 'select child_entity_pk, parent_entity_pk, depth_from_parent, highest_parent_flag from map_entity_hierarchy')
+
+def calc_rollups(delta_facts, partition_no, ancestors, engine):
+    """Rolls the delta facts of one partition of fact_entity_detection up to every ancestor of their entity.
+    Each fact counts for its own entity (depth 0) and for every parent above it, so the rows of a parent cover its whole subtree.
+
+    Args:
+        delta_facts (DataFrame): the facts that were inserted into the partition.
+        partition_no (int): number of the partition, i.e. sentence_pk // fact_partition_size.
+        ancestors (DataFrame): result of load_entity_ancestors().
+        engine (SQL Alchemy engine): engine to connect to the target DB.
+
+    Returns:
+        DataFrame of the delta of aggregation_entity_hierarchy, per parent entity and depth.
+        DataFrame of the delta of aggregation_paper_entity, per paper and parent entity.
+    """
+    #facts of entities without a hierarchy path have no ancestors and are not rolled up
+    facts=pd.merge(delta_facts[['entity_pk', 'sentence_pk', 'entity_count']], ancestors, how='inner', left_on='entity_pk', right_on='child_entity_pk')
+    measures={'highest_parent_flag': ('highest_parent_flag', 'max'), 'entity_count': ('entity_count', 'sum'), 'fact_count': ('entity_count', 'size')}
+    entity_rollup=facts.groupby(['parent_entity_pk', 'depth_from_parent'], as_index=False).agg(**measures)
+    #the paper of each sentence, sentences without a paragraph or paper count for the dummy paper
+    sentence_papers=db.load_df_from_query(engine, 'select ds.sentence_pk, dp.paper_pk from dim_sentence ds left join dim_paragraph dp on ds.paragraph_pk=dp.paragraph_pk where ds.sentence_pk >= {} and ds.sentence_pk < {}'.format(int(partition_no)*fact_partition_size, (int(partition_no)+1)*fact_partition_size))
+    facts=pd.merge(facts, sentence_papers, how='left', on='sentence_pk').fillna({'paper_pk': 0})
+    paper_rollup=facts.groupby(['paper_pk', 'parent_entity_pk'], as_index=False).agg(**measures)
+    return entity_rollup.astype({'highest_parent_flag': bool}), paper_rollup.astype({'paper_pk': 'int64', 'highest_parent_flag': bool})
+
+def upsert_rollup(connection, rollup, table):
+    """Adds the delta of a rollup table to the DB without committing: new rows are inserted, the measures of existing rows are increased.
+    The caller commits it together with the insert of the facts it was calculated from, see fact.load_delta_partition().
+
+    Args:
+        connection (DBAPI connection): a psycopg2 connection within the transaction of the fact insert.
+        rollup (DataFrame): delta of the rollup table from calc_rollups().
+        table (str): one of ROLLUP_KEYS.
+    """
+    db.upsert_rows(connection, rollup, table, ROLLUP_KEYS[table], {column: update.format(table) for column, update in ROLLUP_UPDATES.items()})
+
+def is_rollup_empty(engine, table):
+    """Checks whether a rollup table has no rows yet, e.g. in a warehouse that was loaded before the table existed.
+
+    Args:
+        engine (SQL Alchemy engine): engine to connect to the target DB.
+        table (str): one of ROLLUP_KEYS.
+
+    Returns:
+        True if the table is empty, otherwise False.
+    """
+    return db.load_df_from_query(engine, 'select count(*) as row_count from (select 1 from {} limit 1) as first_row'.format(table)).row_count[0]==0
+
+def backfill_rollups(engine):
+    """Fills the empty rollup tables from all facts in the DB. Must run before the facts of a new delta are loaded, as these are added by upsert_rollup().
+
+    Args:
+        engine (SQL Alchemy engine): engine to connect to the target DB.
+    """
+    for table, query in BACKFILL_QUERIES.items():
+        if is_rollup_empty(engine, table):
+            db.execute_statement(engine, query)
@@ -1,34 +1,101 @@
 import etl.database as db
 import pandas as pd
 import re
+from sqlalchemy import text
 import etl.common_functions as cof
+import etl.dtypes as dt
+from variables import fact_partition_size
 
-def extract_source_data(engine):
-    """Extracts source data about papers and sentences with entities from the data warehouse.
+#the columns of dim_paper that are copied into aggregation_paper, other columns like inferred or citekey_code stay in the dimension
+PAPER_COLUMNS=['paper_pk', 'authorgroup_pk', 'keywordgroup_pk', 'journal_pk', 'year', 'title', 'citekey', 'abstract', 'no_of_pages', 'article_source_id']
+
+def extract_source_data(engine, partition_nos=None):
+    """Extracts source data about the papers to recalculate and their sentences with entities from the data warehouse.
     
     Args:
         engine (SQL Alchemy engine): engine to connect to the target DB.
+        partition_nos (list): if given, only the papers that have facts in these partitions of fact_entity_detection, the papers without a row in aggregation_paper
+            and the dummy paper are extracted. Otherwise all papers are extracted.
 
     Returns:
         DataFrame of sentences, paragraph headings and entities that were detected in these sentences.
-        DataFrame of the paper dimension in the data warehouse.
+        DataFrame of the papers to recalculate from the paper dimension in the data warehouse.
     """
-    sql_query='select paper_pk, heading, paragraph_type,  sentence_string, sentence_type, entity_count, entity_label, entity_name from (select sentence_string, sentence_type, paragraph_pk, entity_count, entity_label, entity_name from (select sentence_pk, entity_count, entity_label, entity_name from fact_entity_detection fed inner join dim_entity de on fed.entity_pk = de.entity_pk) as fact_ent_join left join dim_sentence ds on fact_ent_join.sentence_pk=ds.sentence_pk) as sent_ent_join left join dim_paragraph dp on sent_ent_join.paragraph_pk=dp.paragraph_pk'
-    sentences_with_ents=db.load_df_from_query(engine, sql_query)
-    papers_in_dwh=db.load_full_table(engine, 'dim_paper')
+    #wide_sentence_entity holds the facts already joined with their entity, sentence and paragraph
+    sql_query='select paper_pk, heading, paragraph_type, sentence_string, sentence_type, entity_count, entity_label, entity_name from wide_sentence_entity'
+    paper_query='select {} from dim_paper'.format(', '.join(PAPER_COLUMNS))
+    if partition_nos is not None:
+        sql_query='{} where paper_pk in ({})'.format(sql_query, _recalculated_papers_query(partition_nos))
+        paper_query='{} where paper_pk in ({})'.format(paper_query, _recalculated_papers_query(partition_nos))
+    #entity_name stays a string column here, as the aggregated entity names are filled with 'MISSING' which is not one of its categories
+    sentences_with_ents=dt.apply_dtype_policy(db.load_df_from_query(engine, sql_query), categorical_columns=['heading', 'paragraph_type', 'sentence_type', 'entity_label'])
+    papers_in_dwh=db.load_df_from_query(engine, paper_query)
     return sentences_with_ents, papers_in_dwh
 
+def is_sentence_entity_empty(engine):
+    """Checks whether wide_sentence_entity has no rows yet, e.g. in a warehouse that was loaded before the table existed.
+
+    Args:
+        engine (SQL Alchemy engine): engine to connect to the target DB.
+
+    Returns:
+        True if the table is empty, otherwise False.
+    """
+    return db.load_df_from_query(engine, 'select count(*) as row_count from (select 1 from wide_sentence_entity limit 1) as first_row').row_count[0]==0
+
+def load_unaggregated_partitions(engine):
+    """Finds the partitions of fact_entity_detection that received new facts since the last aggregation.
+
+    Args:
+        engine (SQL Alchemy engine): engine to connect to the target DB.
+
+    Returns:
+        DataFrame with the columns partition_no and loaded_at.
+    """
+    return db.load_df_from_query(engine, 'select partition_no, loaded_at from fact_partition_log where aggregated_at is null or aggregated_at < loaded_at')
+
+def replace_aggregated_papers(engine, aggregated_papers, partitions):
+    """Replaces the rows of the recalculated papers in aggregation_paper and records the aggregated partitions in fact_partition_log, in one transaction.
+    A partition is marked with the loaded_at that was read before the aggregation, so a partition loaded again in the meantime stays unaggregated.
+
+    Args:
+        engine (SQL Alchemy engine): engine to connect to the target DB.
+        aggregated_papers (DataFrame): result of calc_agg_columns() for the recalculated papers.
+        partitions (DataFrame): result of load_unaggregated_partitions().
+    """
+    marks=[{'partition_no': int(p.partition_no), 'loaded_at': p.loaded_at.to_pydatetime()} for p in partitions.itertuples()]
+    with engine.begin() as conn:
+        conn.execute(text('DELETE FROM aggregation_paper WHERE paper_pk = ANY(:paper_pks)'), {'paper_pks': [int(pk) for pk in aggregated_papers.paper_pk]})
+        aggregated_papers.to_sql('aggregation_paper', conn, if_exists='append', index=False)
+        if marks:
+            conn.execute(text('UPDATE fact_partition_log SET aggregated_at=:loaded_at WHERE partition_no=:partition_no'), marks)
+
+def _recalculated_papers_query(partition_nos):
+    """Builds a subquery selecting the paper_pk of all papers that have facts in the given partitions of fact_entity_detection,
+    of all papers without a row in aggregation_paper (new papers, papers whose row was removed) and of the dummy paper.
+
+    Args:
+        partition_nos (list): partition numbers, i.e. sentence_pk // fact_partition_size.
+
+    Returns:
+        The SQL subquery as string.
+    """
+    ranges=' or '.join(['(sentence_pk >= {} and sentence_pk < {})'.format(int(p)*fact_partition_size, (int(p)+1)*fact_partition_size) for p in partition_nos]) or 'false'
+    return """select dpa.paper_pk from dim_paper dpa where dpa.paper_pk=0 or not exists (select 1 from aggregation_paper ap where ap.paper_pk=dpa.paper_pk)
+        or dpa.paper_pk in (select distinct paper_pk from wide_sentence_entity where {})""".format(ranges)
+
 def calc_agg_columns(sentences_with_ents, papers_in_dwh):
     """Adds an aggregation column for each entity category to the paper DataFrame, plus two numeric columns (participant number and metric value). 
     The values of the new columns are aggregated by different strategies, chosen after the most likely approach to select the most relevant entity for a paper.
     
     Args:
         sentences_with_ents (DataFrame): Df of sentences, paragraph headings and entities that were detected in these sentences.
-        papers_in_dwh (DataFrame): Df of the paper dimension in the data warehouse.
+        papers_in_dwh (DataFrame): Df of the paper dimension in the data warehouse, only the columns in PAPER_COLUMNS are kept.
 
     Returns: 
         DataFrame of papers with aggregated entities.
     """
+    papers_in_dwh=papers_in_dwh[PAPER_COLUMNS]
     #model_element
     model_element=sentences_with_ents[sentences_with_ents.entity_label=='MODEL_ELEMENT']
     me=model_element.groupby(by='paper_pk')[['entity_name']].agg(lambda x: x.mode()[0]).reset_index()
@@ -0,0 +1,123 @@
+import pandas as pd
+import numpy as np
+import re
+import time
+import unicodedata
+from difflib import SequenceMatcher
+
+NAME_COLUMNS=['surname', 'firstname', 'middlename']
+ATTRIBUTE_COLUMNS=['email', 'department', 'institution', 'country']
+#minimum similarity of the normalized first names (and of full middle names) for two authors of the same block to be merged
+SIMILARITY_THRESHOLD=0.9
+#number of slowest blocks listed in the report
+REPORTED_BLOCKS=5
+
+
+def resolve_authors(source_authors):
+    """Merges near-duplicate authors, e.g. (Abbott, Pamela, MISSING) and (Abbott, Pamela, Y). Authors are blocked by normalized surname and first initial,
+    only authors within the same block are compared, so the effort grows with the block sizes instead of quadratically with the number of authors.
+    Within a block, every author is merged into the first more complete author with a similar name. Missing attributes of the kept author are filled from the merged ones.
+
+    Args:
+        source_authors (DataFrame): cleaned and conformed authors from extract_unique_authors_from_files().
+
+    Returns:
+        DataFrame of the resolved authors, in the same format as source_authors.
+        DataFrame merge map with the name columns of each merged author and the columns canonical_surname, canonical_firstname and canonical_middlename of the author it was merged into.
+    """
+    authors=source_authors.fillna('MISSING').reset_index(drop=True)
+    authors['completeness']=(authors[['middlename']+ATTRIBUTE_COLUMNS]!='MISSING').sum(axis=1)
+    authors['block']=authors.surname.map(_normalize)+' '+authors.firstname.map(_normalize).str[:1]
+    #most complete authors first, so that they become the canonical authors of their block
+    authors=authors.sort_values(['completeness'], ascending=False, kind='stable')
+    canonical=pd.Series(authors.index, index=authors.index)
+    block_sizes=authors.block.value_counts()
+    block_timings={}
+    for block, members in authors[authors.block.isin(block_sizes[block_sizes>1].index)].groupby('block', sort=False):
+        start=time.perf_counter()
+        canonical.loc[members.index]=_resolve_block(members)
+        block_timings[block]=time.perf_counter()-start
+    authors['canonical']=canonical
+    merged=authors[authors.canonical!=authors.index]
+    merge_map=pd.concat([merged[NAME_COLUMNS].reset_index(drop=True), authors.loc[merged.canonical, NAME_COLUMNS].add_prefix('canonical_').reset_index(drop=True)], axis=1)
+    #fill missing attributes of each canonical author from its merged authors, the canonical author itself comes first
+    attributes=authors[ATTRIBUTE_COLUMNS].replace('MISSING', np.nan)
+    attributes['canonical']=authors.canonical
+    attributes=attributes.groupby('canonical', sort=False).first()
+    resolved=authors.loc[authors.canonical==authors.index, NAME_COLUMNS].join(attributes).fillna('MISSING').sort_index().reset_index(drop=True)
+    _report(len(authors.index), block_sizes, block_timings, len(merge_map.index))
+    return resolved, merge_map
+
+def find_delta_merge_map(merge_map, merge_map_in_dwh):
+    """Finds the entries of the merge map that are not yet present in the DB table map_author_merge.
+
+    Args:
+        merge_map (DataFrame): merge map from resolve_authors().
+        merge_map_in_dwh (DataFrame): rows currently present in the DB table map_author_merge.
+
+    Returns:
+        DataFrame of new merge map entries, ready to insert into map_author_merge.
+    """
+    left=pd.merge(merge_map, merge_map_in_dwh[NAME_COLUMNS], how='left', on=NAME_COLUMNS, indicator=True)
+    return left[left._merge=='left_only'].drop(columns=['_merge'])
+
+def apply_merge_map(authors_df, merge_map):
+    """Replaces the names of merged authors by the names of the authors they were merged into, so that they can be joined with dim_author.
+
+    Args:
+        authors_df (DataFrame): any DataFrame with the columns surname, firstname and middlename.
+        merge_map (DataFrame): merge map from resolve_authors() or the DB table map_author_merge.
+
+    Returns:
+        The DataFrame with canonical author names.
+    """
+    if merge_map.empty:
+        return authors_df
+    mapped=pd.merge(authors_df, merge_map, how='left', on=NAME_COLUMNS)
+    for column in NAME_COLUMNS:
+        mapped[column]=mapped['canonical_'+column].combine_first(mapped[column])
+    return mapped.drop(columns=['canonical_'+column for column in NAME_COLUMNS])
+
+def _resolve_block(members):
+    """Assigns each author of a block to the first earlier (more complete) canonical author with a compatible and similar name.
+
+    Args:
+        members (DataFrame): the authors of one block, most complete first.
+
+    Returns:
+        List of the index of the canonical author of each member.
+    """
+    canonicals=[]
+    assigned=[]
+    for index, firstname, middlename in zip(members.index, members.firstname.map(_normalize), members.middlename.map(_normalize)):
+        match=next((c_index for c_index, c_firstname, c_middlename in canonicals if _is_similar(firstname, middlename, c_firstname, c_middlename)), None)
+        if match is None:
+            canonicals.append((index, firstname, middlename))
+            match=index
+        assigned.append(match)
+    return assigned
+
+def _is_similar(firstname, middlename, other_firstname, other_middlename):
+    """Compares two normalized names of the same block. The firstnames must be similar and the middlenames compatible: a missing middlename is compatible
+    with any middlename, an initial with the initial of the other middlename and two full middlenames must be similar as well."""
+    return SequenceMatcher(None, firstname, other_firstname).ratio()>=SIMILARITY_THRESHOLD and _is_compatible_middlename(middlename, other_middlename)
+
+def _is_compatible_middlename(middlename, other_middlename):
+    """Compares two normalized middlenames, see _is_similar(). Compared on their own, so that a long firstname does not hide a different middle initial."""
+    if middlename=='missing' or other_middlename=='missing':
+        return True
+    if min(len(middlename), len(other_middlename))<=1:
+        return middlename[:1]==other_middlename[:1]
+    return SequenceMatcher(None, middlename, other_middlename).ratio()>=SIMILARITY_THRESHOLD
+
+def _normalize(name):
+    """Normalizes a name for comparison: accents removed, lower case, only letters, digits and spaces."""
+    name=unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode()
+    return re.sub('[^a-z0-9 ]', '', name.lower()).strip()
+
+def _report(authors_count, block_sizes, block_timings, merged_count):
+    """Prints the number of blocks, the merged authors and the time spent in the slowest blocks."""
+    print('Author resolution: {} authors in {} blocks, {} blocks with candidates, {} authors merged in {:.2f}s'.format(
+        authors_count, len(block_sizes.index), len(block_timings), merged_count, sum(block_timings.values())))
+    for block, seconds in sorted(block_timings.items(), key=lambda item: item[1], reverse=True)[:REPORTED_BLOCKS]:
+        print("  block '{}' ({} authors): {:.4f}s".format(block, block_sizes[block], seconds))
@@ -0,0 +1,203 @@
+import etl.database as db
+import etl.source_lineage as sl
+import pandas as pd
+import os
+from datetime import datetime
+from variables import checkpointpath
+
+#marker file that is written last, so that a stage only counts as completed if all its outputs were written
+SUCCESS_MARKER='_SUCCESS'
+#source keys recorded for map_source_lineage while a stage parsed its source files, recorded again when the stage is resumed
+LINEAGE_FILE='_lineage.parquet'
+
+
+def new_run_id():
+    """Creates a new run id from the current timestamp, in the same format as the CauseMiner result folders.
+
+    Returns:
+        The run id as string.
+    """
+    return datetime.now().strftime('%Y_%m_%d_%H%M%S')
+
+def latest_run_id(pipeline):
+    """Finds the most recent run that has checkpoints for the given pipeline.
+
+    Args:
+        pipeline (str): name of the pipeline, e.g. 'Paper ETL'.
+
+    Returns:
+        The run id as string, or None if there are no checkpoints for this pipeline.
+    """
+    if not os.path.isdir(checkpointpath):
+        return None
+    run_ids=sorted(r for r in os.listdir(checkpointpath) if os.path.isdir(_stage_dir(r, pipeline)))
+    return run_ids[-1] if run_ids else None
+
+def register_run(run_id, pipeline):
+    """Creates the checkpoint directory of a pipeline, so that the run can be found by latest_run_id() even before any stage completed.
+
+    Args:
+        run_id (str): id of the current run.
+        pipeline (str): name of the pipeline, e.g. 'Full ETL'.
+    """
+    os.makedirs(_stage_dir(run_id, pipeline), exist_ok=True)
+
+def run_stage(run_id, pipeline, stage, func, *args):
+    """Executes one stage of a pipeline and checkpoints its output to Parquet.
+    If the stage was already completed in this run, the checkpointed output is returned instead and func is not executed.
+    The source keys recorded for map_source_lineage while func parses source files are checkpointed with the stage and recorded again on resume.
+
+    Args:
+        run_id (str): id of the current run.
+        pipeline (str): name of the pipeline, e.g. 'Paper ETL'.
+        stage (str): name of the stage within the pipeline, e.g. 'extract'.
+        func (function): the function computing the stage, must return a DataFrame, a Series or a tuple of those.
+        *args: arguments passed on to func.
+
+    Returns:
+        The output of func, either freshly computed or loaded from the checkpoint.
+    """
+    stage_dir=_stage_dir(run_id, pipeline, stage)
+    if os.path.exists(os.path.join(stage_dir, SUCCESS_MARKER)):
+        print('{}: resuming stage {} from checkpoint of run {}'.format(pipeline, stage, run_id))
+        if os.path.exists(os.path.join(stage_dir, LINEAGE_FILE)):
+            sl.restore(pd.read_parquet(os.path.join(stage_dir, LINEAGE_FILE)))
+        return _read_outputs(stage_dir)
+    with sl.capture() as lineage:
+        output=func(*args)
+    if lineage:
+        os.makedirs(stage_dir, exist_ok=True)
+        sl.to_frame(lineage).to_parquet(os.path.join(stage_dir, LINEAGE_FILE), index=False)
+    _write_outputs(stage_dir, output)
+    return output
+
+def run_stage_tables(run_id, pipeline, stage, func, *args):
+    """Executes a stage that is a generator of tables and checkpoints each table as soon as it is produced, so that the tables can be passed on one by one.
+    If the stage was already completed in this run, the checkpointed tables are yielded instead and func is not executed.
+
+    Args:
+        run_id (str): id of the current run.
+        pipeline (str): name of the pipeline, e.g. 'Paper ETL'.
+        stage (str): name of the stage within the pipeline, e.g. 'delta'.
+        func (function): generator function yielding tuples of table name and DataFrame.
+        *args: arguments passed on to func.
+
+    Yields:
+        Tuples of table name and DataFrame, either freshly computed or loaded from the checkpoint.
+    """
+    stage_dir=_stage_dir(run_id, pipeline, stage)
+    if os.path.exists(os.path.join(stage_dir, SUCCESS_MARKER)):
+        print('{}: resuming stage {} from checkpoint of run {}'.format(pipeline, stage, run_id))
+        with open(os.path.join(stage_dir, SUCCESS_MARKER)) as marker:
+            tables=marker.read().split(',')
+        yield from zip(tables, _read_outputs(stage_dir, as_tuple=True))
+        return
+    #outputs of an earlier, interrupted attempt are overwritten
+    os.makedirs(stage_dir, exist_ok=True)
+    tables=[]
+    for position, (table, data) in enumerate(func(*args)):
+        _write_output(stage_dir, position, data)
+        tables.append(table)
+        yield table, data
+    with open(os.path.join(stage_dir, SUCCESS_MARKER), 'w') as marker:
+        marker.write(','.join(tables))
+
+def load_stage(run_id, pipeline, engine, data, table, if_exists='append'):
+    """Inserts data into a DB table unless this insert was already completed in this run. The insert is only recorded as completed if it succeeded,
+    a failing insert raises, so that --resume executes it again.
+
+    Args:
+        run_id (str): id of the current run.
+        pipeline (str): name of the pipeline, e.g. 'Paper ETL'.
+        engine (SQL Alchemy engine object): The engine for the target database.
+        data (DataFrame): the rows to insert.
+        table (str): name of the target table, also used as name of the stage.
+        if_exists (str): passed on to insert_to_database().
+    """
+    if is_loaded(run_id, pipeline, table):
+        print('{}: {} was already loaded in run {}, skipping'.format(pipeline, table, run_id))
+        return
+    db.insert_to_database(engine, data, table, if_exists=if_exists, raise_errors=True)
+    mark_loaded(run_id, pipeline, table)
+
+def is_loaded(run_id, pipeline, table):
+    """Checks whether the insert into a DB table was already completed in this run.
+
+    Args:
+        run_id (str): id of the current run.
+        pipeline (str): name of the pipeline, e.g. 'Paper ETL'.
+        table (str): name of the target table.
+
+    Returns:
+        True if the table was already loaded, otherwise False.
+    """
+    return os.path.exists(os.path.join(_stage_dir(run_id, pipeline, 'load_'+table), SUCCESS_MARKER))
+
+def mark_loaded(run_id, pipeline, table):
+    """Marks the insert into a DB table as completed in this run.
+
+    Args:
+        run_id (str): id of the current run.
+        pipeline (str): name of the pipeline, e.g. 'Paper ETL'.
+        table (str): name of the target table.
+    """
+    stage_dir=_stage_dir(run_id, pipeline, 'load_'+table)
+    os.makedirs(stage_dir, exist_ok=True)
+    open(os.path.join(stage_dir, SUCCESS_MARKER), 'w').close()
+
+def _stage_dir(run_id, pipeline, stage=''):
+    """Builds the checkpoint directory of a stage (or of the whole pipeline, if no stage is given)."""
+    return os.path.join(checkpointpath, run_id, pipeline.replace(' ', '_'), stage)
+
+def _write_outputs(stage_dir, output):
+    """Writes the DataFrames and Series returned by a stage to the stage directory and marks the stage as completed.
+    Frames with mixed-type object columns that Parquet cannot represent are pickled instead.
+
+    Args:
+        stage_dir (str): checkpoint directory of the stage.
+        output (DataFrame, Series or tuple): the output of the stage.
+    """
+    os.makedirs(stage_dir, exist_ok=True)
+    outputs=output if isinstance(output, tuple) else (output,)
+    for position, item in enumerate(outputs):
+        _write_output(stage_dir, position, item)
+    with open(os.path.join(stage_dir, SUCCESS_MARKER), 'w') as marker:
+        marker.write('tuple' if isinstance(output, tuple) else 'single')
+
+def _write_output(stage_dir, position, item):
+    """Writes a single DataFrame or Series to the stage directory, falling back to pickle if Parquet cannot represent it.
+
+    Args:
+        stage_dir (str): checkpoint directory of the stage.
+        position (int): position of the item within the outputs of the stage.
+        item (DataFrame or Series): the output to write.
+    """
+    kind='series' if isinstance(item, pd.Series) else 'frame'
+    frame=item.to_frame() if kind=='series' else item
+    path=os.path.join(stage_dir, '{}.{}'.format(position, kind))
+    try:
+        frame.to_parquet(path+'.parquet')
+    except (TypeError, ValueError):
+        if os.path.exists(path+'.parquet'):
+            os.remove(path+'.parquet')
+        frame.to_pickle(path+'.pkl')
+
+def _read_outputs(stage_dir, as_tuple=False):
+    """Reads the checkpointed outputs of a completed stage.
+
+    Args:
+        stage_dir (str): checkpoint directory of the stage.
+        as_tuple (bool): always return a tuple, regardless of the marker.
+
+    Returns:
+        The output of the stage in the same form as it was returned by the stage function.
+    """
+    outputs=[]
+    for filename in sorted((f for f in os.listdir(stage_dir) if f not in (SUCCESS_MARKER, LINEAGE_FILE)), key=lambda f: int(f.split('.')[0])):
+        path=os.path.join(stage_dir, filename)
+        frame=pd.read_parquet(path) if filename.endswith('.parquet') else pd.read_pickle(path)
+        outputs.append(frame.iloc[:, 0] if '.series.' in filename else frame)
+    if as_tuple:
+        return tuple(outputs)
+    with open(os.path.join(stage_dir, SUCCESS_MARKER)) as marker:
+        return tuple(outputs) if marker.read()=='tuple' else outputs[0]
@@ -1,22 +1,90 @@
 import pandas as pd
+import numpy as np
 import os
+import pyarrow as pa
+import pyarrow.csv
 import re
 import roman
-from variables import sourcepath
+from concurrent.futures import ThreadPoolExecutor
+import etl.source_lineage as sl
+import etl.source_snapshot as ss
+from variables import sourcepaths, csv_engine
 
 
-def load_sourcefile (filename): 
-    """Loads a .csv-sourcefile from the folder specified in the global variable sourcepath. 
+def load_sourcefile (filename, engine=csv_engine): 
+    """Loads a .csv-sourcefile from the folders specified in the global variable sourcepaths. 
+    If a source snapshot is open, the file is only parsed on its first request and served from the snapshot afterwards.
     
     Args:
         filename(str): the name of the file to load, must be a .csv-file.
+        engine(str): the CSV parser, 'pyarrow' parses multithreaded with pyarrow.csv, 'c' is pandas' single-threaded parser.
         
     Returns:
         The data of the specified file as a pandas Dataframe.
     """
-    source_df=pd.read_csv(os.path.join(sourcepath, filename))
+    if ss.is_open():
+        return ss.get_sourcefile(filename, lambda: _parse_sourcefile(filename, engine))
+    return _parse_sourcefile(filename, engine)
+
+def _parse_sourcefile (filename, engine):
+    """Parses a .csv-sourcefile from all folders specified in the global variable sourcepaths, concurrently in a thread pool, one thread per folder.
+    The rows of all folders are unioned and exact duplicates are dropped, keeping the row of the first folder. The folder of each source key is recorded for map_source_lineage.
+    
+    Args:
+        filename(str): the name of the file to load, must be a .csv-file.
+        engine(str): the CSV parser, see load_sourcefile().
+        
+    Returns:
+        The data of the specified file as a pandas Dataframe.
+    """
+    with ThreadPoolExecutor(max_workers=len(sourcepaths)) as pool:
+        frames=list(pool.map(lambda folder: _read_sourcefile(folder, filename, engine), sourcepaths))
+    if len(frames)>1:
+        source_df=pd.concat(frames, ignore_index=True)
+        source_df=source_df[~source_df.drop(columns=['source_folder']).duplicated()].reset_index(drop=True)
+    else:
+        source_df=frames[0]
+    sl.record(filename, source_df)
+    return source_df.drop(columns=['source_folder'])
+
+def _read_sourcefile (folder, filename, engine):
+    """Parses a .csv-sourcefile from one result folder and adds the folder as column source_folder.
+    
+    Args:
+        folder(str): the result folder.
+        filename(str): the name of the file to load, must be a .csv-file.
+        engine(str): the CSV parser, see load_sourcefile().
+        
+    Returns:
+        The data of the specified file as a pandas Dataframe.
+    """
+    if engine=='pyarrow':
+        #read with pyarrow directly, as pd.read_csv(engine='pyarrow') fails on quoted newlines (e.g. in abstracts) that cross a parse block
+        table=pyarrow.csv.read_csv(os.path.join(folder, filename), parse_options=pyarrow.csv.ParseOptions(newlines_in_values=True), convert_options=pyarrow.csv.ConvertOptions(strings_can_be_null=True, timestamp_parsers=[]))
+        #dates stay strings like with the C parser
+        table=table.cast(pa.schema([pa.field(field.name, pa.string()) if pa.types.is_date(field.type) or pa.types.is_timestamp(field.type) else field for field in table.schema]))
+        source_df=table.to_pandas()
+        #pyarrow returns missing strings as None, the transformations rely on NaN (e.g. in checks like x==x)
+        object_columns=source_df.select_dtypes(include='object').columns
+        source_df[object_columns]=source_df[object_columns].fillna(np.nan)
+    else:
+        source_df=pd.read_csv(os.path.join(folder, filename), engine=engine)
+    source_df['source_folder']=folder
     return source_df
 
+def load_sourcefiles (filenames, engine=csv_engine):
+    """Loads several .csv-sourcefiles concurrently in a thread pool, one thread per file.
+    
+    Args:
+        filenames(list): the names of the files to load, must be .csv-files.
+        engine(str): the CSV parser, passed on to load_sourcefile().
+        
+    Returns:
+        List of pandas Dataframes in the same order as filenames.
+    """
+    with ThreadPoolExecutor(max_workers=len(filenames)) as pool:
+        return list(pool.map(lambda filename: load_sourcefile(filename, engine), filenames))
+
 def split_into_lists_of_two_strings(names):
     """Takes list of names and splits it into sublists of length 2.
     If the length of the split and flattened list is uneven, the last string is dropped.
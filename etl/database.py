@@ -1,6 +1,49 @@
 from sqlalchemy import create_engine, exc, text
+from contextlib import contextmanager
+import io
 import pandas as pd
+import psycopg2.extras
+import queue
+import threading
 import sqlalchemy
+import time
+import etl.dtypes as dt
+import etl.query_log as ql
+import pyarrow as pa
+import pyarrow.csv
+from variables import db_read_path
+
+#Arrow types of the PostgreSQL type OIDs in cursor.description, for the COPY read path. Other types are read as strings
+COPY_COLUMN_TYPES={
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int16(),
+    23: pa.int32(),
+    700: pa.float32(),
+    701: pa.float64(),
+    1082: pa.date32(),
+    1114: pa.timestamp('us'),
+    1700: pa.float64()
+}
+#integer columns become nullable pandas integers, so that NULLs do not turn them into floats
+COPY_PANDAS_TYPES={pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(), pa.int64(): pd.Int64Dtype(), pa.bool_(): pd.BooleanDtype()}
+
+#secondary indexes on the natural keys and foreign keys the pipelines join or diff on, as (index name, table, columns). Keep in sync with schema_creation.sql
+SECONDARY_INDEXES=[
+    ('dim_sentence_sentence_source_id_idx', 'dim_sentence', ['sentence_source_id']),
+    ('dim_sentence_paragraph_pk_idx', 'dim_sentence', ['paragraph_pk']),
+    ('dim_paragraph_para_source_id_idx', 'dim_paragraph', ['para_source_id']),
+    ('dim_paragraph_paper_pk_idx', 'dim_paragraph', ['paper_pk']),
+    ('dim_paper_citekey_idx', 'dim_paper', ['citekey']),
+    ('dim_paper_article_source_id_idx', 'dim_paper', ['article_source_id']),
+    ('dim_entity_entity_name_idx', 'dim_entity', ['entity_name']),
+    ('dim_author_name_idx', 'dim_author', ['surname', 'firstname', 'middlename']),
+    #the primary key (entity_pk, sentence_pk) already serves lookups by entity_pk
+    ('fact_entity_detection_sentence_pk_idx', 'fact_entity_detection', ['sentence_pk']),
+    ('wide_sentence_entity_paper_pk_idx', 'wide_sentence_entity', ['paper_pk']),
+    #the primary key (paper_pk, parent_entity_pk) serves lookups by paper
+    ('aggregation_paper_entity_parent_entity_pk_idx', 'aggregation_paper_entity', ['parent_entity_pk'])
+]
 
 
 def initialize_engine(connection_params):
@@ -28,12 +71,22 @@ def load_full_table(engine, table):
         table (str): The name of the DB table to load.
         
     Returns: 
-        A pandas dataframe of the entire table.
+        A pandas dataframe of the entire table, with key columns as nullable 32 bit integers.
     
     Raises:
         ValueError: If the table does not exist in the DB.
         """
-    return (pd.read_sql_table(table, engine.connect()))
+    start=time.perf_counter()
+    with ql.record_call('load_full_table', table) as call:
+        if db_read_path=='copy':
+            #errors of the raw DBAPI connection are not wrapped by SQLAlchemy, so the table is checked beforehand like read_sql_table does
+            if not sqlalchemy.inspect(engine).has_table(table, schema='public'):
+                raise ValueError('Table {} not found'.format(table))
+            call['data']=copy_query_to_df(engine, 'select * from public.{}'.format(table))
+        else:
+            call['data']=dt.cast_keys(pd.read_sql_table(table, engine.connect()))
+    ql.capture_plan(engine, 'select * from public.{}'.format(table), time.perf_counter()-start)
+    return call['data']
 
 def load_df_from_query(engine, querystring):
     """Loads full table that is existing in the specified database table and returns it as dataframe.
@@ -43,28 +96,306 @@ def load_df_from_query(engine, querystring):
         querystring (str): The SQL SELECT statement to load the data.
         
     Returns: 
-        A pandas dataframe of the selected data.
+        A pandas dataframe of the selected data, with key columns as nullable 32 bit integers.
     """
-    return (pd.read_sql_query(text(querystring), engine.connect()))
-    
+    start=time.perf_counter()
+    with ql.record_call('load_df_from_query', querystring) as call:
+        if db_read_path=='copy':
+            call['data']=copy_query_to_df(engine, querystring)
+        else:
+            call['data']=dt.cast_keys(pd.read_sql_query(text(querystring), engine.connect()))
+    ql.capture_plan(engine, querystring, time.perf_counter()-start)
+    return call['data']
 
-def insert_to_database(engine, data, table, if_exists='append'):
+def copy_query_to_df(engine, querystring):
+    """Loads the result of a query with COPY (query) TO STDOUT into an in-memory CSV buffer and parses it with the multithreaded Arrow CSV reader.
+    This avoids building a Python tuple per row like read_sql does. The dtypes are taken from the result columns of the query instead of being inferred.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+        querystring (str): The SQL SELECT statement to load the data, without bind parameters.
+
+    Returns:
+        A pandas dataframe of the selected data, with integer columns as nullable integers, DATE and TIMESTAMP columns as datetime64 and key columns as nullable 32 bit integers.
+    """
+    connection=engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            #an empty result of the query yields the column names and type OIDs
+            cursor.execute('select * from ({}) as copy_query limit 0'.format(querystring))
+            columns=[(column.name, column.type_code) for column in cursor.description]
+            buffer=io.BytesIO()
+            start=time.perf_counter()
+            cursor.copy_expert('COPY ({}) TO STDOUT WITH (FORMAT csv)'.format(querystring), buffer)
+            ql.log_statement('COPY ({}) TO STDOUT'.format(querystring), time.perf_counter()-start, cursor.rowcount)
+            ql.add_bytes(buffer.getbuffer().nbytes)
+        connection.commit()
+    finally:
+        connection.close()
+    buffer.seek(0)
+    names=[name for name, type_code in columns]
+    column_types={name: COPY_COLUMN_TYPES.get(type_code, pa.string()) for name, type_code in columns}
+    #the Arrow CSV reader rejects an empty file, an empty result gets the typed columns without rows
+    if not buffer.getbuffer().nbytes:
+        table=pa.schema([(name, column_types[name]) for name in names]).empty_table()
+    else:
+        #in the CSV format of COPY, NULL is an unquoted empty value and an empty string is quoted
+        table=pa.csv.read_csv(buffer,
+            read_options=pa.csv.ReadOptions(column_names=names),
+            parse_options=pa.csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa.csv.ConvertOptions(column_types=column_types, null_values=[''], true_values=['t'], false_values=['f'], strings_can_be_null=True, quoted_strings_can_be_null=False))
+    return dt.cast_keys(table.to_pandas(types_mapper=COPY_PANDAS_TYPES.get, date_as_object=False))
+
+def execute_statement(engine, statement, params=None):
+    """Executes a single SQL statement that does not return rows (e.g. DDL or UPDATE) in its own transaction.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+        statement (str): The SQL statement, may contain bind parameters like :name.
+        params (dict): Values for the bind parameters, if any.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(statement), params or {})
+
+def insert_to_database(engine, data, table, if_exists='append', raise_errors=False):
     """This function inserts data into a table of the database.
 
         Args: 
             engine (SQL Alchemy engine object): The engine for the target database.
             data (Dataframe): The dataframe to be inserted into the database; it must follow the same schema as the database table.
             table (str): The name of the table the data should be inserted into.
+            raise_errors (bool): raise integrity errors instead of printing them, for callers that record the insert as done afterwards.
 
         Raises:
-            Integrity error when the schemas do not match or table constraints are violated.
+            Integrity error when the schemas do not match or table constraints are violated, if raise_errors is set.
         """
     try:
-        data.to_sql(table, engine, if_exists=if_exists, index=False)
+        with ql.record_call('insert_to_database', table) as call:
+            call['data']=data
+            data.to_sql(table, engine, if_exists=if_exists, index=False)
     except exc.IntegrityError as error:
+        if raise_errors:
+            raise
         print(error)
 
+def upsert_rows(connection, data, table, key_columns, updates):
+    """Inserts rows into a table and updates the existing rows with the same key instead (INSERT ... ON CONFLICT DO UPDATE), in pages of a multi-row VALUES list.
+    Runs over a raw DBAPI connection without committing, the caller controls the transaction, so that the upsert can be committed together with other statements.
+
+    Args:
+        connection (DBAPI connection): a psycopg2 connection, e.g. from engine.raw_connection().
+        data (DataFrame): the rows to upsert, the column names must match the table.
+        table (str): The name of the table.
+        key_columns (list): the columns of the primary key or a unique constraint of the table.
+        updates (dict): column and SQL expression of its new value in an existing row, e.g. '{table}.entity_count+excluded.entity_count'.
+    """
+    if data.empty:
+        return
+    statement='INSERT INTO public.{} ({}) VALUES %s ON CONFLICT ({}) DO UPDATE SET {}'.format(table, ', '.join(data.columns), ', '.join(key_columns), ', '.join('{}={}'.format(column, update) for column, update in updates.items()))
+    #plain Python values, as the DB driver cannot adapt numpy scalars and pd.NA
+    records=list(data.astype(object).where(data.notna(), None).itertuples(index=False, name=None))
+    with ql.record_call('upsert_rows', table) as call:
+        call['data']=data
+        with connection.cursor() as cursor:
+            start=time.perf_counter()
+            psycopg2.extras.execute_values(cursor, statement, records, page_size=10000)
+            ql.log_statement(statement, time.perf_counter()-start, len(records))
 
+def update_by_key(engine, data, table, key_column):
+    """Updates columns of existing rows from a DataFrame, joined on a key column (UPDATE ... FROM VALUES), in pages of a multi-row VALUES list.
 
-        
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+        data (DataFrame): the key column and the columns to update, the column names must match the table.
+        table (str): The name of the table.
+        key_column (str): the column identifying the rows, usually the primary key.
+    """
+    if data.empty:
+        return
+    columns=[column for column in data.columns if column!=key_column]
+    statement='UPDATE public.{0} SET {1} FROM (VALUES %s) AS v ({2}) WHERE {0}.{3}=v.{3}'.format(table, ', '.join('{0}=v.{0}'.format(column) for column in columns), ', '.join(data.columns), key_column)
+    records=list(data.astype(object).where(data.notna(), None).itertuples(index=False, name=None))
+    with ql.record_call('update_by_key', table) as call:
+        call['data']=data
+        connection=engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                start=time.perf_counter()
+                psycopg2.extras.execute_values(cursor, statement, records, page_size=10000)
+                ql.log_statement(statement, time.perf_counter()-start, len(records))
+            connection.commit()
+        finally:
+            connection.close()
+
+def copy_into_table(connection, data, table):
+    """Streams a DataFrame into a table with COPY FROM STDIN over a raw DBAPI connection, without committing.
+    The caller controls the transaction, so that several tables can be committed together.
 
+    Args:
+        connection (DBAPI connection): a psycopg2 connection, e.g. from engine.raw_connection().
+        data (DataFrame): the rows to insert, the column names must match the table.
+        table (str): The name of the table the data should be inserted into.
+    """
+    buffer=io.StringIO()
+    #\\N marks NULL, so that empty strings stay empty strings
+    data.to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        start=time.perf_counter()
+        cursor.copy_expert("COPY public.{} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(table, ', '.join(data.columns)), buffer)
+        ql.log_statement('COPY public.{} FROM STDIN'.format(table), time.perf_counter()-start, cursor.rowcount)
+        ql.add_bytes(buffer.tell())
+
+def pipelined_insert(engine, tables, insert=None, maxsize=2):
+    """Inserts the tables produced by a generator in a separate writer thread, so that a table is already streamed to the DB while the next ones are still being produced.
+    The tables are inserted one after another in the order they are produced, so a producer that yields them in foreign key order never violates a constraint.
+    The bounded queue limits how many finished tables are held in memory while the writer is busy.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+        tables (iterable): yields tuples of table name and DataFrame to insert.
+        insert (function): function(data, table) executing a single insert, defaults to insert_to_database() with engine.
+        maxsize (int): number of finished tables that may wait for the writer before the producer is paused.
+
+    Returns:
+        Dict of table name and the seconds the producer waited for the writer before handing over the table.
+
+    Raises:
+        The first exception raised by the writer thread, after the writer has stopped.
+    """
+    insert=insert or (lambda data, table: insert_to_database(engine, data, table))
+    pending=queue.Queue(maxsize=maxsize)
+    errors=[]
+
+    def writer():
+        while True:
+            item=pending.get()
+            if item is None:
+                return
+            #after a failed insert the remaining tables are skipped, as they may reference the rows that are missing now
+            if not errors:
+                try:
+                    insert(item[1], item[0])
+                except Exception as error:
+                    errors.append(error)
+
+    thread=threading.Thread(target=writer, name='pipelined-insert')
+    thread.start()
+    waits={}
+    try:
+        for table, data in tables:
+            if errors:
+                break
+            start=time.perf_counter()
+            pending.put((table, data))
+            waits[table]=time.perf_counter()-start
+    finally:
+        pending.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
+    return waits
+
+
+def create_indexes(engine):
+    """Creates all secondary indexes defined in SECONDARY_INDEXES that are not yet present in the database.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+
+    Returns:
+        Dict of index name and the seconds it took to build the index.
+    """
+    timings={}
+    for index_name, table, columns in SECONDARY_INDEXES:
+        start=time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(text('CREATE INDEX IF NOT EXISTS {} ON public.{} ({})'.format(index_name, table, ', '.join(columns))))
+        timings[index_name]=time.perf_counter()-start
+    return timings
+
+def drop_indexes(engine):
+    """Drops all secondary indexes defined in SECONDARY_INDEXES. Primary keys are not touched.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+    """
+    with engine.begin() as conn:
+        for index_name, table, columns in SECONDARY_INDEXES:
+            conn.execute(text('DROP INDEX IF EXISTS public.{}'.format(index_name)))
+
+def load_foreign_keys(engine):
+    """Loads the definitions of all foreign key constraints in the schema public, so that they can be dropped and recreated later.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+
+    Returns:
+        DataFrame with the columns table_name, constraint_name and definition.
+    """
+    #constraints inherited by partitions (conparentid!=0) are dropped and recreated together with their parent
+    sql_query="select conrelid::regclass::text as table_name, conname as constraint_name, pg_get_constraintdef(oid) as definition from pg_constraint where contype='f' and conparentid=0 and connamespace='public'::regnamespace"
+    return load_df_from_query(engine, sql_query)
+
+@contextmanager
+def bulk_load_mode(engine):
+    """Context manager for large initial loads: drops the secondary indexes and foreign key constraints before the load 
+    and rebuilds them afterwards, then prints a timing report of all phases.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+
+    Yields:
+        Nothing, the inserts are executed inside the with-block as usual.
+
+    Raises:
+        RuntimeError with the statements to restore the foreign keys that could not be added again, e.g. because the loaded data violates them.
+        If the load itself failed, its exception is raised instead and the statements are only printed.
+    """
+    start=time.perf_counter()
+    foreign_keys=load_foreign_keys(engine)
+    with engine.begin() as conn:
+        for fk in foreign_keys.itertuples():
+            conn.execute(text('ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}'.format(fk.table_name, fk.constraint_name)))
+    drop_indexes(engine)
+    drop_seconds=time.perf_counter()-start
+    start=time.perf_counter()
+    #an exception of the load must not be replaced by a failure of the rebuild, it is the one the user needs to see
+    load_failed=False
+    try:
+        yield
+    except BaseException:
+        load_failed=True
+        raise
+    finally:
+        load_seconds=time.perf_counter()-start
+        try:
+            index_timings=create_indexes(engine)
+        except Exception as error:
+            if not load_failed:
+                raise
+            print(error)
+            index_timings={}
+        fk_timings={}
+        #every constraint is tried, the ones violated by the loaded data are reported with their definition so that they can be restored after repairing the data
+        failed_fks=[]
+        for fk in foreign_keys.itertuples():
+            fk_start=time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(fk.table_name, fk.constraint_name, fk.definition)))
+            except exc.DBAPIError as error:
+                print(error)
+                failed_fks.append('ALTER TABLE {} ADD CONSTRAINT {} {};'.format(fk.table_name, fk.constraint_name, fk.definition))
+            fk_timings[fk.constraint_name]=time.perf_counter()-fk_start
+        print('Bulk load report:')
+        print('  dropping {} indexes and {} foreign keys: {:.2f}s'.format(len(SECONDARY_INDEXES), len(foreign_keys.index), drop_seconds))
+        print('  loading: {:.2f}s'.format(load_seconds))
+        for name, seconds in {**index_timings, **fk_timings}.items():
+            print('  rebuilding {}: {:.2f}s'.format(name, seconds))
+        print('  rebuilding total: {:.2f}s'.format(sum(index_timings.values())+sum(fk_timings.values())))
+        if failed_fks:
+            message='{} foreign keys could not be restored, repair the data and run:\n{}'.format(len(failed_fks), '\n'.join(failed_fks))
+            if not load_failed:
+                raise RuntimeError(message)
+            print(message)
@@ -1,5 +1,4 @@
 import pandas as pd
-from gensim.parsing.preprocessing import strip_numeric
 import re
 import numpy as np
 import etl.common_functions as cof
@@ -11,8 +10,9 @@ def extract_unique_authors_from_files():
     Returns:
         Dataframe of cleaned and conformed authors.
     """
-    from_authors=_clean_authors_from_authors()
-    from_references=_clean_authors_from_references()
+    authors_df, references_df=cof.load_sourcefiles(['authors.csv', 'unique_references.csv'])
+    from_authors=_clean_authors_from_authors(authors_df)
+    from_references=_clean_authors_from_references(references_df)
     unique_authors=pd.merge(from_authors, from_references, how='outer', on=['surname', 'firstname', 'middlename'], suffixes=[None, '_ref'])[['surname', 'firstname', 'middlename', 'email', 'department', 'institution', 'country']]
     return unique_authors
 
@@ -45,13 +45,15 @@ def tramsform_delta_authors(source_authors, authors_in_dwh):
             #completely_new=completely_new.append({'author_pk': 0, 'surname': 'MISSING', 'firstname': 'MISSING', 'middlename': 'MISSING', 'email': 'MISSING', 'department': 'MISSING', 'institution': 'MISSING', 'country': 'MISSING'}, ignore_index=True)
     return completely_new
 
-def _clean_authors_from_references():
-    """Loads and cleans the source data from the unique_references.csv file to the desired format.
+def _clean_authors_from_references(references_df):
+    """Cleans the source data from the unique_references.csv file to the desired format.
     
+    Args:
+        references_df (DataFrame): the content of the source file unique_references.csv.
+
     Returns:
         The cleaned DataFrame containing surname, firstname and middlename ('MISSING' in all cases) of reference authors.
     """
-    references_df=cof.load_sourcefile('unique_references.csv')
     #create a new dataframe of authors where each author gets an own row and empty rows are discarded
     ref_aut=pd.Series(references_df['authors'].str.split('; ').explode(ignore_index=True).str.split(', ').dropna())
     #remove the 'Van' if existing in strings that are longer tan 2, as checks have shown these are most probably parsing errors
@@ -87,27 +89,24 @@ def _clean_authors_from_references():
     reference_authors.drop_duplicates(inplace=True, ignore_index=True)
     return reference_authors
 
-def _clean_authors_from_authors():
-    """Loads and cleans the source data from the authors.csv file to the desired format.
+def _clean_authors_from_authors(authors_df):
+    """Cleans the source data from the authors.csv file to the desired format.
     
+    Args:
+        authors_df (DataFrame): the content of the source file authors.csv.
+
     Returns:
         The cleaned DataFrame of conformed and aggregated authors.
     """
-    authors_df=cof.load_sourcefile('authors.csv').rename(columns={'departments': 'department', 'institutions': 'institution', 'countries': 'country'})
+    authors_df=authors_df.rename(columns={'departments': 'department', 'institutions': 'institution', 'countries': 'country'})
     #some cells in the source data still contain numbers, html tags or @ tags, these are removed
     authors_df.fullname=authors_df.fullname.apply(lambda f: _remove_numbers_tags_and_signs(f))
     #then split the fullname again into the columns first-, middle- and surname
     authors_df[['surname', 'firstname', 'middlename']]=pd.DataFrame(authors_df.fullname.apply(lambda fn: _split_fullname(fn)).to_list(), index=authors_df.index)
     #merge duplicate authors, if fullnames are identical. From email and institute information take the majority, if any, otherwise impute 'MISSING'
-    aggregate_functions={'surname': 'first', 
-    'firstname': 'first', 
-    'middlename': 'first', 
-    'email': lambda x: _try_impute_missing(x.mode()),
-    'department': lambda x: _try_impute_missing(x.mode()), 
-    'institution': lambda x: _try_impute_missing(x.mode()), 
-    'country': lambda x: _try_impute_missing(x.mode())}
-    authors_df= authors_df.groupby('fullname')[['firstname', 'middlename', 'surname', 'email','department', 'institution', 'country']].agg(aggregate_functions)
-    #TODO: merge authors if surname and fullname are identical and for the rest of the values everything is missing, current merging allows two entries (Abbott, Pamela, MISSING) and (Abbott, Pamela, Y)
+    names=authors_df.groupby('fullname')[['surname', 'firstname', 'middlename']].first()
+    authors_df=names.join(_majority_vote(authors_df, ['email', 'department', 'institution', 'country']))
+    #near-duplicates like (Abbott, Pamela, MISSING) and (Abbott, Pamela, Y) are merged later by author_resolution.resolve_authors()
     return authors_df
 
 def _remove_numbers_tags_and_signs(fullname):
@@ -119,7 +118,7 @@ def _remove_numbers_tags_and_signs(fullname):
     Returns:
         The cleaned string.
     """
-    fullname=strip_numeric(fullname)
+    fullname=re.sub('[0-9]+', '', fullname)
     fullname=re.sub('&\w+', '', fullname)
     fullname=re.sub('@\w+', '', fullname)
     fullname=re.sub('\| ', '', fullname)
@@ -150,18 +149,19 @@ def _split_fullname(fullname):
         middlename=np.nan
     return fn_surname, firstname, middlename
 
-def _try_impute_missing (item):
-    """This  function is needed when loading authors for the first time and removing duplicates.
-    When some attributes of the same author are equally often present in the source data, take the first option. 
-    If an attribute is missing in all entries of the same author, return NaN.
-    
+def _majority_vote(authors_df, attributes):
+    """Finds the most frequent value of each attribute per fullname with a single count over (fullname, attribute, value) in long format.
+    When several values are equally frequent, the smallest one wins, like the first value of Series.mode(). If an attribute is missing in all entries of the same author, it is NaN.
+
     Args:
-        item(list or str): The attribute mode, it is a list if there are several most frequent values for one attribute.
-        
+        authors_df (DataFrame): authors with the column fullname and the attribute columns.
+        attributes (list): names of the attribute columns.
+
     Returns:
-        Atomic attribute value, either the first option or NaN.
+        DataFrame indexed by fullname with one column per attribute.
     """
-    try:
-        return item[0]
-    except:
-        return np.nan
\ No newline at end of file
+    long=authors_df.melt(id_vars='fullname', value_vars=attributes, var_name='attribute').dropna()
+    counts=long.value_counts(['fullname', 'attribute', 'value']).rename('count').reset_index()
+    #per fullname and attribute the most frequent value comes first, among equally frequent values the smallest
+    winners=counts.sort_values(['fullname', 'attribute', 'count', 'value'], ascending=[True, True, False, True]).drop_duplicates(['fullname', 'attribute'])
+    return winners.pivot(index='fullname', columns='attribute', values='value').reindex(columns=attributes).rename_axis(columns=None)
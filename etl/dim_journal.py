@@ -7,8 +7,7 @@ def extract_unique_journals_from_files():
     Returns:
         DataFrame of cleaned and unique journals from source files.
     """
-    from_papers=cof.load_sourcefile('papers_final.csv')[['journal', 'volume', 'issue', 'publisher', 'place']]
-    from_references=cof.load_sourcefile('unique_references.csv')[['journal', 'volume', 'issue', 'publisher', 'place']]
+    from_papers, from_references=[df[['journal', 'volume', 'issue', 'publisher', 'place']] for df in cof.load_sourcefiles(['papers_final.csv', 'unique_references.csv'])]
     all_journals=pd.concat([from_references,from_papers], ignore_index=True).rename(columns={'journal': 'title'})
     all_journals.dropna(axis=0, how='all', inplace=True)
     all_journals.fillna({'title': 'MISSING', 'volume':0, 'issue': 0, 'publisher': 'MISSING', 'place': 'MISSING'}, inplace=True)
@@ -1,7 +1,11 @@
+import hashlib
 import pandas as pd
 import etl.common_functions as cof
 import etl.dim_author as auth
+import etl.author_resolution as ares
+import etl.inferred_members as im
 import etl.database as db
+import etl.dtypes as dt
 import roman
 
     
@@ -12,61 +16,66 @@ def extract_all_papers():
         DataFrame of papers from papers_final sourcefile.
         DataFrame of papers from unique_references sourcefile.
     """
-    from_papers=cof.load_sourcefile('papers_final.csv')
-    from_references=cof.load_sourcefile('unique_references.csv')
+    from_papers, from_references=cof.load_sourcefiles(['papers_final.csv', 'unique_references.csv'])
     return from_papers, from_references
 
 def transform_papers(source_papers, engine):
     """Transforms papers from papers_final source: triggers the addition of keyword_pk, author_pk and journal_pk.
+    The keywords and authors are kept in separate frames keyed by article_id, so that a paper with several keywords and authors is not multiplied into all their combinations.
     
     Args: 
         source_papers (DataFrame): df of source file from papers_final.
         engine (SQL Alchemy engine): engine to connect to the target DB.
     
     Returns: 
-        DataFrame of prepared papers. The group primary keys are not created yet, so papers with e.g. multiple keywords are listed in multiple rows, each with different keyword_pk.
+        DataFrame of prepared papers, one row per paper with journal_pk.
+        DataFrame of article_id and keyword_pk, one row per keyword of a paper.
+        DataFrame of article_id, author_position and author_pk, one row per author of a paper.
     """
-    keywords_df=cof.load_sourcefile('keywords.csv')
-    articles_prep=_join_articles_keyword_pk(source_papers, keywords_df, engine)
-    #join articles with authors and lookup existing foreign key author_pk
-    authors_df=cof.load_sourcefile('authors.csv').rename(columns={'departments': 'department', 'institutions': 'institution', 'countries': 'country'})
-    articles_prep=_prepare_article_authors(authors_df, articles_prep)
-    articles_prep=_join_papers_author_pk(articles_prep, engine).drop(columns=['surname', 'firstname', 'middlename','email_x', 'department_x', 'institution_x', 'country_x', 'email_y', 'department_y', 'institution_y', 'country_y'], axis=1)
+    keywords_df, authors_df=cof.load_sourcefiles(['keywords.csv', 'authors.csv'])
+    article_keywords=_join_articles_keyword_pk(keywords_df, engine)
+    #lookup existing foreign key author_pk for the authors of the articles
+    authors_df=authors_df.rename(columns={'departments': 'department', 'institutions': 'institution', 'countries': 'country'})
+    article_authors=_join_papers_author_pk(_prepare_article_authors(authors_df), engine)[['article_id', 'author_position', 'author_pk']]
     #join articles with journals and lookup existing foreign key journal_pk
-    articles_prep=_prepare_paper_journals(articles_prep)
+    articles_prep=_prepare_paper_journals(source_papers.drop(columns=['keywords', 'authors']))
     articles_prep=_join_papers_journal_pk(articles_prep, engine).drop(columns=['journal_akronym'], axis=1)
-    return articles_prep
+    return articles_prep, article_keywords, article_authors
 
 def transform_references(source_references, engine):
     """Transforms papers from unique_references source: triggers the addition of author_pk and journal_pk.
-    As keywords are not present in the source data, the dummy keyword_pk of 0 is added to each reference which will point to MISSING keywords.
+    References have no keywords, merge_all_papers() assigns the dummy keyword_pk of 0 to them which will point to MISSING keywords.
     
     Args: 
         source_references (DataFrame):
         engine (SQL Alchemy engine): engine to connect to target DB.
     
     Returns:
-        DataFrame of prepared references. As in transform_papers() the group primary keys are not created yet, which is why for each author, a paper has a row in the returned df. 
+        DataFrame of prepared references, one row per reference with journal_pk.
+        DataFrame of citekey and author_pk, one row per author of a reference.
     """
-    # create 'keyword_pk'=0 for papers from references with reference to dummy entry in dim_keyword
-    references_prep=source_references.assign(keyword_pk=0)
-    #join references with authors and lookup existing foreign key author_pk
-    references_prep=_prepare_reference_authors(references_prep)
-    references_prep=_join_papers_author_pk(references_prep, engine).drop(columns=['authors', 'surname', 'firstname', 'middlename', 'email', 'department', 'institution', 'country'], axis=1)
-    #join articles with journals and lookup existing foreign key journal_pk
-    references_prep=_prepare_paper_journals(references_prep)
+    #lookup existing foreign key author_pk for the authors of the references
+    reference_authors=_prepare_reference_authors(source_references[['citekey', 'authors']].copy())
+    reference_authors=_join_papers_author_pk(reference_authors, engine)[['citekey', 'author_pk']]
+    #join references with journals and lookup existing foreign key journal_pk
+    references_prep=_prepare_paper_journals(source_references.drop(columns=['authors']))
     references_prep=_join_papers_journal_pk(references_prep, engine).drop(columns=['source_type', 'editor', 'monograph_title', 'note'], axis=1)
-    return references_prep
+    return references_prep, reference_authors
 
-def merge_all_papers(prepared_references, prepared_papers):
-    """Merges prepared references and prepared papers to one df.
+def merge_all_papers(prepared_references, reference_authors, prepared_papers, article_keywords, article_authors):
+    """Merges prepared references and prepared papers to one df, and their keywords and authors to one df each, all keyed by citekey.
     
     Args:
-        prepared_references (DataFrame): The references df resulting from transform references() with primary keys added.
-        prepared_papers (DataFrame): The papers df resulting from transform_papers() with primary keys added.
+        prepared_references (DataFrame): The references df resulting from transform_references().
+        reference_authors (DataFrame): The authors of the references resulting from transform_references().
+        prepared_papers (DataFrame): The papers df resulting from transform_papers().
+        article_keywords (DataFrame): The keywords of the papers resulting from transform_papers().
+        article_authors (DataFrame): The authors of the papers resulting from transform_papers().
     
     Returns:
-        DataFrame of merged papers with page numbers calculated and filled missing values.
+        DataFrame of merged papers with page numbers calculated and filled missing values, one row per paper.
+        DataFrame of citekey and keyword_pk, with the dummy keyword_pk 0 for papers without keywords.
+        DataFrame of citekey, author_position and author_pk, with the dummy author_pk 0 for papers without authors.
     """
     #split start and end of pages from references into two columns, then transform the page numbers to integers
     prepared_references.pages=prepared_references.pages.apply(lambda x: x.split('-') if x==x else [0, 0])
@@ -78,26 +87,41 @@ def merge_all_papers(prepared_references, prepared_papers):
 
     #merge papers from articles and from references
     all_papers=pd.merge(prepared_papers, prepared_references, how='outer', on='citekey', suffixes=['_art', '_ref'])
-    all_papers['year']=all_papers.apply(lambda x: x.year_art if x.year_art==x.year_art else x.year_ref, axis=1)
+    #take the value from the articles, if it is missing there the one from the references
+    all_papers['year']=all_papers.year_art.combine_first(all_papers.year_ref)
     all_papers['year']=all_papers.year.apply(lambda y: pd.to_datetime(int(y), format='%Y').normalize() if 1676<y<2263 else pd.to_datetime(1678, format='%Y').normalize()) 
-    all_papers['title']=all_papers.apply(lambda x: x.title_art if x.title_art==x.title_art else x.title_ref, axis=1)
-    all_papers['author_pk']=all_papers.apply(lambda x: x.author_pk_art if x.author_pk_art==x.author_pk_art else x.author_pk_ref, axis=1)
-    all_papers['no_of_pages']=all_papers.apply(lambda x: x.number_of_pages_art if x.number_of_pages_art==x.number_of_pages_art else x.number_of_pages_ref, axis=1)
+    all_papers['title']=all_papers.title_art.combine_first(all_papers.title_ref)
+    all_papers['no_of_pages']=all_papers.number_of_pages_art.combine_first(all_papers.number_of_pages_ref)
     all_papers['no_of_pages']=all_papers.no_of_pages.apply(lambda x: x if 0<x<2000000000 else 0)
-    all_papers['journal_pk']=all_papers.apply(lambda x: x.journal_pk_art if x.journal_pk_art==x.journal_pk_art else x.journal_pk_ref, axis=1)
-    all_papers['keyword_pk']=all_papers['keyword_pk_art']
-    all_papers.fillna({'article_id': 0, 'author_position': 0, 'citekey': 'MISSING', 'abstract': 'MISSING', 'year': pd.to_datetime(1678, format='%Y').normalize(), 'title': 'MISSING', 'author_pk': 0, 'no_of_pages': 0, 'journal_pk': 0,'keyword_pk': 0}, inplace=True)
+    all_papers['journal_pk']=all_papers.journal_pk_art.combine_first(all_papers.journal_pk_ref)
+    all_papers.fillna({'article_id': 0, 'citekey': 'MISSING', 'abstract': 'MISSING', 'year': pd.to_datetime(1678, format='%Y').normalize(), 'title': 'MISSING', 'no_of_pages': 0, 'journal_pk': 0}, inplace=True)
+    final_papers=dt.cast_keys(all_papers[['article_id', 'citekey', 'abstract', 'year', 'title', 'no_of_pages', 'journal_pk']].drop_duplicates())
 
-    final_papers=all_papers[['article_id', 'author_position', 'citekey', 'abstract', 'year', 'title', 'author_pk', 'no_of_pages', 'journal_pk', 'keyword_pk']]
-    return final_papers
+    #keywords and authors of the articles are keyed by citekey like the references
+    article_citekeys=prepared_papers[['article_id', 'citekey']].fillna({'citekey': 'MISSING'}).drop_duplicates()
+    paper_keywords=pd.merge(article_citekeys, article_keywords, how='inner', on='article_id')[['citekey', 'keyword_pk']]
+    article_authors=pd.merge(article_citekeys, article_authors, how='inner', on='article_id')[['citekey', 'author_position', 'author_pk']]
+    #the authors of a paper are taken from the articles, only if it is not an article from the references
+    reference_authors=reference_authors[~reference_authors.citekey.isin(article_citekeys.citekey)].assign(author_position=0)
+    paper_authors=pd.concat([article_authors, reference_authors[['citekey', 'author_position', 'author_pk']]], ignore_index=True)
+    #papers without any keyword or author point to the dummy entries
+    paper_keywords=_with_dummy_members(paper_keywords, final_papers.citekey, {'keyword_pk': 0})
+    paper_authors=_with_dummy_members(paper_authors, final_papers.citekey, {'author_position': 0, 'author_pk': 0})
+    paper_keywords=dt.cast_keys(paper_keywords.fillna({'keyword_pk': 0}).drop_duplicates())
+    paper_authors=dt.cast_keys(paper_authors.fillna({'author_position': 0, 'author_pk': 0}).drop_duplicates(subset=['citekey', 'author_pk'], keep='first'))
+    return final_papers, paper_keywords, paper_authors
 
-def find_delta_papers(source_papers, papers_in_dwh):
+def find_delta_papers(source_papers, paper_keywords, paper_authors, papers_in_dwh, keyword_bridge_in_dwh, author_bridge_in_dwh):
     """Compares merged source papers with data in the DB and finds delta of rows. 
     For this delta_df, a primary key, authorgroup_pk and keywordgroup_pk are added, bridge tables and separate group dimensions are created. 
     
     Args:
         source_papers (DataFrame): The transformed and merged source papers.
+        paper_keywords (DataFrame): The keywords of the source papers by citekey, from merge_all_papers().
+        paper_authors (DataFrame): The authors of the source papers by citekey, from merge_all_papers().
         papers_in_dwh (DataFrame): The data currently present in the DB table dim_paper as pandas df.
+        keyword_bridge_in_dwh (DataFrame): The data currently present in the DB table bridge_paper_keyword.
+        author_bridge_in_dwh (DataFrame): The data currently present in the DB table bridge_paper_author.
     Returns:  
         DataFrame of delta papers, ready to insert into dim_paper.
         DataFrame of delta keywordgroup, ready to insert into dim_keywordgroup.
@@ -105,22 +129,50 @@ def find_delta_papers(source_papers, papers_in_dwh):
         DataFrame of delta authorgroup, ready to insert into dim_authorgroup.
         DataFrame of delta rows ready to insert into bridge_paper_author.
     """
-    source_papers=source_papers.rename(columns={'article_id': 'article_source_id'})
-    outer=pd.merge(source_papers, papers_in_dwh, how='outer')[['article_source_id', 'author_position', 'citekey', 'abstract', 'year', 'title', 'author_pk', 'no_of_pages', 'journal_pk', 'keyword_pk']]
-    delta_papers=pd.concat([outer,papers_in_dwh]).drop_duplicates(keep=False)
+    delta=dict(iter_delta_papers(source_papers, paper_keywords, paper_authors, papers_in_dwh, keyword_bridge_in_dwh, author_bridge_in_dwh))
+    return delta['dim_paper'], delta['dim_keywordgroup'], delta['bridge_paper_keyword'], delta['dim_authorgroup'], delta['bridge_paper_author']
+
+def iter_delta_papers(source_papers, paper_keywords, paper_authors, papers_in_dwh, keyword_bridge_in_dwh, author_bridge_in_dwh):
+    """Generator version of find_delta_papers(): each delta table is yielded as soon as it is complete, in an order that respects the foreign key constraints.
+    This way the first tables can already be loaded while the later ones are still being produced.
+    Papers with the same set of keywords (or the same authors at the same positions) share one keywordgroup (or authorgroup), also with the groups already in the DB.
     
-    #assign group_index for later authorgroup and keywordgroup, starting from 0
-    delta_papers['group_index']=delta_papers.groupby(by='citekey').ngroup(ascending=True)
-    #which is the highest group_index we have currently in the dwh?
-    max_group_pk=max(papers_in_dwh.keywordgroup_pk, default=0)
-    delta_papers['keywordgroup_pk']=delta_papers['group_index']+max_group_pk+1
-    delta_papers['authorgroup_pk']=delta_papers['group_index']+max_group_pk+1
-    delta_keywordbridge=delta_papers[['keywordgroup_pk', 'keyword_pk']].drop_duplicates()
+    Args:
+        source_papers (DataFrame): The transformed and merged source papers.
+        paper_keywords (DataFrame): The keywords of the source papers by citekey, from merge_all_papers().
+        paper_authors (DataFrame): The authors of the source papers by citekey, from merge_all_papers().
+        papers_in_dwh (DataFrame): The data currently present in the DB table dim_paper as pandas df.
+        keyword_bridge_in_dwh (DataFrame): The data currently present in the DB table bridge_paper_keyword.
+        author_bridge_in_dwh (DataFrame): The data currently present in the DB table bridge_paper_author.
+
+    Yields:
+        Tuples of table name and DataFrame of delta rows for dim_keywordgroup, bridge_paper_keyword, dim_authorgroup, bridge_paper_author and dim_paper.
+    """
+    source_papers=source_papers.rename(columns={'article_id': 'article_source_id'})
+    #papers whose attributes are not yet present in the DB
+    compared_columns=['article_source_id', 'citekey', 'abstract', 'year', 'title', 'no_of_pages', 'journal_pk']
+    left=pd.merge(source_papers, papers_in_dwh[compared_columns].drop_duplicates(), how='left', on=compared_columns, indicator=True)
+    #papers whose keywords or authors differ from the member set of their current group are also delta papers, they get a new row with the new group
+    changed_citekeys=_changed_member_papers(paper_keywords, papers_in_dwh, keyword_bridge_in_dwh, 'keywordgroup_pk', ['keyword_pk']).union(
+        _changed_member_papers(paper_authors, papers_in_dwh, author_bridge_in_dwh, 'authorgroup_pk', ['author_position', 'author_pk']))
+    delta_papers=left[(left._merge=='left_only') | left.citekey.isin(changed_citekeys)].drop(columns=['_merge'])
+    delta_keywords=paper_keywords[paper_keywords.citekey.isin(delta_papers.citekey)]
+    delta_authors=paper_authors[paper_authors.citekey.isin(delta_papers.citekey)]
+
+    keyword_groups, delta_keywordbridge=_assign_groups(delta_keywords, keyword_bridge_in_dwh, 'keywordgroup_pk', ['keyword_pk'], {'keyword_pk': 0})
     delta_keywordgroup=pd.DataFrame(delta_keywordbridge['keywordgroup_pk']).drop_duplicates()
-    delta_authorbridge=delta_papers[['authorgroup_pk', 'author_pk', 'author_position']].drop_duplicates(subset=['authorgroup_pk', 'author_pk'], keep='first')
-    delta_authorgroup=pd.DataFrame(delta_authorbridge['authorgroup_pk']).drop_duplicates(subset=['authorgroup_pk'], keep='first')
-    #remove now not needed columns from paper df and drop duplicate rows now
-    delta_papers=delta_papers.drop(columns=['author_position', 'author_pk', 'keyword_pk', 'group_index'], axis=1).drop_duplicates()
+    yield 'dim_keywordgroup', delta_keywordgroup
+    yield 'bridge_paper_keyword', delta_keywordbridge
+
+    author_groups, delta_authorbridge=_assign_groups(delta_authors, author_bridge_in_dwh, 'authorgroup_pk', ['author_position', 'author_pk'], {'author_position': 0, 'author_pk': 0})
+    delta_authorgroup=pd.DataFrame(delta_authorbridge['authorgroup_pk']).drop_duplicates()
+    yield 'dim_authorgroup', delta_authorgroup
+    yield 'bridge_paper_author', delta_authorbridge
+
+    delta_papers['keywordgroup_pk']=delta_papers.citekey.map(keyword_groups)
+    delta_papers['authorgroup_pk']=delta_papers.citekey.map(author_groups)
+    #drop duplicate rows now
+    delta_papers=delta_papers.drop_duplicates()
     #add a consecutive key, starting from max_pk +1
     max_pk=max(papers_in_dwh.paper_pk, default=0)
     delta_papers['paper_pk']=list(range(max_pk+1, max_pk+1+delta_papers.index.size))
@@ -129,53 +181,131 @@ def find_delta_papers(source_papers, papers_in_dwh):
     if max_pk==0:
         dummy_paper={'paper_pk': 0, 'article_source_id': 0, 'citekey': 'MISSING', 'abstract': 'MISSING', 'year': pd.to_datetime(1678, format='%Y').normalize(), 'title': 'MISSING', 'authorgroup_pk': 0, 'no_of_pages': 0, 'journal_pk': 0,'keywordgroup_pk': 0}
         delta_papers=pd.concat([delta_papers, pd.DataFrame([dummy_paper])], ignore_index=True)
-    if max_group_pk==0:
-        delta_keywordbridge=pd.concat([delta_keywordbridge, pd.DataFrame([{'keywordgroup_pk': 0, 'keyword_pk': 0}])], ignore_index=True)
-        delta_keywordgroup=pd.concat([delta_keywordgroup, pd.DataFrame([{'keywordgroup_pk': 0}])], ignore_index=True)
-        delta_authorbridge=pd.concat([delta_authorbridge, pd.DataFrame([{'authorgroup_pk': 0, 'author_pk': 0, 'author_position': 0}])], ignore_index=True)
-        delta_authorgroup=pd.concat([delta_authorgroup, pd.DataFrame([{'authorgroup_pk': 0}])], ignore_index=True)
-    return delta_papers, delta_keywordgroup, delta_keywordbridge, delta_authorgroup, delta_authorbridge
-
-def _join_articles_keyword_pk(articles_df, keywords_df, engine):
-    """Joins papers with keywords so that a keyword_pk is added to each row.
+    yield 'dim_paper', delta_papers
+
+def _assign_groups(paper_members, bridge_in_dwh, group_column, member_columns, dummy):
+    """Assigns a group key to the members (keywords or authors) of each paper. Papers with the same member set share a group: the key is looked up by the signature of the set
+    among the groups already in the bridge table and the new groups of this run, only new member sets get new keys.
+
+    Args:
+        paper_members (DataFrame): the members of the delta papers, with the column citekey and the member columns.
+        bridge_in_dwh (DataFrame): the rows currently present in the bridge table of the group.
+        group_column (str): name of the group key, e.g. 'keywordgroup_pk'.
+        member_columns (list): the columns that identify a member within a group, e.g. ['keyword_pk'].
+        dummy (dict): the member values of the dummy group 0.
+
+    Returns:
+        Series of the group key per citekey.
+        DataFrame of delta rows for the bridge table, including the dummy group 0 if the bridge table was empty before.
+    """
+    #insert dummy rows with group key 0 if the tables were empty before
+    if bridge_in_dwh.empty:
+        bridge_in_dwh=pd.DataFrame([{group_column: 0, **dummy}])
+        new_bridge=bridge_in_dwh
+    else:
+        new_bridge=bridge_in_dwh.iloc[0:0]
+    existing=_group_signatures(bridge_in_dwh, group_column, member_columns)
+    #groups that are in the DB several times (created before groups were shared) are reused by their lowest key
+    known=pd.Series(existing.index, index=existing.values).sort_values()
+    known=known[~known.index.duplicated(keep='first')]
+    signatures=_group_signatures(paper_members, 'citekey', member_columns)
+    new_signatures=signatures[~signatures.isin(known.index)].drop_duplicates()
+    max_group_pk=max(bridge_in_dwh[group_column], default=0)
+    new_groups=pd.Series(range(max_group_pk+1, max_group_pk+1+len(new_signatures.index)), index=new_signatures.values, dtype='int64')
+    groups=signatures.map(pd.concat([known, new_groups]))
+    #one set of bridge rows per new group
+    new_members=paper_members[paper_members.citekey.isin(new_signatures.index)].assign(**{group_column: lambda df: df.citekey.map(groups)})
+    new_bridge=pd.concat([new_bridge, new_members[[group_column]+member_columns].drop_duplicates()], ignore_index=True)
+    return groups, dt.cast_keys(new_bridge)
+
+def _changed_member_papers(paper_members, papers_in_dwh, bridge_in_dwh, group_column, member_columns):
+    """Finds the papers in the DB whose members (keywords or authors) in the source differ from the member set of the group of their current row.
+
+    Args:
+        paper_members (DataFrame): the members of the source papers, with the column citekey and the member columns.
+        papers_in_dwh (DataFrame): the data currently present in the DB table dim_paper.
+        bridge_in_dwh (DataFrame): the rows currently present in the bridge table of the group.
+        group_column (str): name of the group key, e.g. 'keywordgroup_pk'.
+        member_columns (list): the columns that identify a member within a group, e.g. ['keyword_pk'].
+
+    Returns:
+        Index of the citekeys whose member set changed.
+    """
+    if papers_in_dwh.empty or bridge_in_dwh.empty:
+        return pd.Index([])
+    #the current row of a paper is the one added last
+    current_groups=papers_in_dwh.sort_values('paper_pk').drop_duplicates(subset=['citekey'], keep='last').set_index('citekey')[group_column]
+    source_signatures=_group_signatures(paper_members[paper_members.citekey.isin(current_groups.index)], 'citekey', member_columns)
+    current_signatures=current_groups.reindex(source_signatures.index).map(_group_signatures(bridge_in_dwh, group_column, member_columns))
+    return source_signatures.index[source_signatures!=current_signatures]
+
+def _group_signatures(members, key_column, member_columns):
+    """Builds a canonical signature per group from the sorted member set, so that equal sets get equal signatures.
+
+    Args:
+        members (DataFrame): one row per member, with the key column and the member columns.
+        key_column (str): the column identifying a group, e.g. citekey or keywordgroup_pk.
+        member_columns (list): the columns that identify a member within a group.
+
+    Returns:
+        Series of the signature per key, a blake2b digest of the sorted members.
+    """
+    members=members[[key_column]+member_columns].drop_duplicates().sort_values([key_column]+member_columns)
+    canonical=members[member_columns[0]].astype('int64').astype(str)
+    for column in member_columns[1:]:
+        canonical=canonical+':'+members[column].astype('int64').astype(str)
+    return canonical.groupby(members[key_column]).agg(','.join).map(lambda members: hashlib.blake2b(members.encode(), digest_size=16).hexdigest())
+
+def _join_articles_keyword_pk(keywords_df, engine):
+    """Looks up the keyword_pk of the keywords of each paper.
     
     Args:
-        articles_df (DataFrame): dataframe of the source file final_papers.
         keywords_df (DataFrame): dataframe of the source file keywords.csv.
         engine (SQLAlchemy engine): engine object to connect to the target DB.
     
     Returns: 
-        DataFrame of papers with a keyword_pk instead of keyword itself.
+        DataFrame of article_id and keyword_pk, one row per keyword of a paper.
     """
-    #join with keywords and lookup exising foreign key 'keyword_pk'
+    #lookup exising foreign key 'keyword_pk'
     keywords_df["keyword"]=keywords_df["keyword"].str.lower()
-    articles_prep=pd.merge(articles_df, keywords_df, how='outer', on='article_id')
-    keywords_in_dwh = db.load_full_table(engine, 'dim_keyword')
-    articles_prep=pd.merge(articles_prep, keywords_in_dwh, how='left', left_on='keyword', right_on='keyword_string')
+    #keywords that the Keyword ETL has not loaded yet are inserted as inferred members
+    keywords_in_dwh=im.infer_members(engine, 'dim_keyword', keywords_df[['keyword']].rename(columns={'keyword': 'keyword_string'}), db.load_full_table(engine, 'dim_keyword'))
+    article_keywords=pd.merge(keywords_df, keywords_in_dwh, how='left', left_on='keyword', right_on='keyword_string')
     #insert dummy foreign key 0 if keyword is missing
-    articles_prep.keyword_pk=articles_prep.keyword_pk.apply(lambda p: 0 if p!=p else int(p))
-    articles_prep.drop(['keywords', 'keyword', 'keyword_string'], axis=1, inplace=True)
-    return articles_prep
+    article_keywords.keyword_pk=article_keywords.keyword_pk.fillna(0)
+    return article_keywords[['article_id', 'keyword_pk']]
 
-def _prepare_article_authors(authors_df, articles_df):
+def _prepare_article_authors(authors_df):
     """Prepares the author fullname column from the authors sourcefile as it is done during the transformations for the author dimension. 
-    Then the transformed authors are merged to the paper file.
     
     Args: 
         authors_df (DataFrame): df from the source file authors.csv.
-        articles_df (DataFrame): prepared df from the source file papers_final.
 
     Returns: 
-        DataFrame of papers with columns for the authors first-, middle- and surname. If a paper has multiple authors it is listed miltiple times, each author gets one row.
+        DataFrame of authors with columns for the authors first-, middle- and surname, one row per author of a paper.
     """
     #some cells in the source data still contain numbers, html tags or @ tags, these are removed
     authors_df.fullname=authors_df.fullname.apply(lambda f: auth._remove_numbers_tags_and_signs(f))
     #then split the fullname again into the columns first-, middle- and surname
     authors_df[['surname', 'firstname', 'middlename']]=pd.DataFrame(authors_df.fullname.apply(lambda fn: auth._split_fullname(fn)).to_list(), index=authors_df.index)
-    article_authors=pd.merge(authors_df, articles_df, how='outer', on='article_id').drop(columns=['fullname', 'authors'])
+    article_authors=authors_df.drop(columns=['fullname'])
     article_authors.fillna({'surname': 'MISSING', 'firstname': 'MISSING', 'middlename': 'MISSING'}, axis=0, inplace=True)
     return article_authors
 
+def _with_dummy_members(paper_members, citekeys, dummy):
+    """Adds a row with dummy foreign keys for every paper that has no keyword (or author).
+
+    Args:
+        paper_members (DataFrame): keywords or authors of the papers, with the column citekey.
+        citekeys (Series): the citekeys of all papers.
+        dummy (dict): the dummy values of the member columns.
+
+    Returns:
+        DataFrame of the members with the added dummy rows.
+    """
+    without_members=citekeys[~citekeys.isin(paper_members.citekey)].drop_duplicates()
+    return pd.concat([paper_members, pd.DataFrame({'citekey': without_members}).assign(**dummy)], ignore_index=True)
+
 def _join_papers_author_pk(articles_df, engine):
     """Exchanges author name for a foreign key to author in dim_author.
     
@@ -186,7 +316,10 @@ def _join_papers_author_pk(articles_df, engine):
     Returns:
         DataFrame of papers with author_pk.
     """
-    authors_in_dwh=db.load_full_table(engine, 'dim_author')
+    #authors merged by the Author ETL are joined with the author they were merged into
+    articles_df=ares.apply_merge_map(articles_df, db.load_full_table(engine, 'map_author_merge'))
+    #authors that the Author ETL has not loaded yet are inserted as inferred members
+    authors_in_dwh=im.infer_members(engine, 'dim_author', articles_df[['surname', 'firstname', 'middlename']], db.load_full_table(engine, 'dim_author'))
     joined=pd.merge(articles_df, authors_in_dwh, how= 'left', on=['surname', 'firstname', 'middlename'])
     return joined
 
@@ -214,7 +347,8 @@ def _join_papers_journal_pk(paper_df, engine):
     Returns:
         DataFrame of papers with journal_pk.
     """
-    journals_in_dwh=db.load_full_table(engine, 'dim_journal').rename({'title': 'journal'})
+    #journals that the Journal ETL has not loaded yet are inserted as inferred members
+    journals_in_dwh=im.infer_members(engine, 'dim_journal', paper_df[['journal', 'volume', 'issue', 'publisher', 'place']].rename(columns={'journal': 'title'}), db.load_full_table(engine, 'dim_journal'))
     joined=pd.merge(paper_df, journals_in_dwh, how='left', left_on=['journal', 'volume', 'issue', 'publisher', 'place'], right_on=['title', 'volume', 'issue', 'publisher', 'place'], suffixes=[None, '_db'])
     joined=joined.drop(columns=['journal', 'volume', 'issue', 'publisher', 'place', 'title_db'], axis=1)
     return joined
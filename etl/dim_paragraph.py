@@ -1,6 +1,8 @@
 import pandas as pd
 import etl.common_functions as cof
 import etl.database as db
+import etl.dtypes as dt
+import etl.inferred_members as im
 
 def extract_unique_paragraphs_from_file():
     """Loads unique paragraphs from paragraphs.csv.
@@ -21,10 +23,11 @@ def transform_paragraphs(source_paragraphs, engine):
     Returns:
         DataFrame of transformed paragraphs with paper_pk.
     """
-    papers_in_dwh=db.load_full_table(engine, 'dim_paper')[['paper_pk', 'article_source_id']]
+    #papers that the Paper ETL has not loaded yet are inserted as inferred members
+    papers_in_dwh=im.infer_members(engine, 'dim_paper', source_paragraphs[['article_id']].rename(columns={'article_id': 'article_source_id'}), db.load_full_table(engine, 'dim_paper'))[['paper_pk', 'article_source_id']]
     transformed_para=pd.merge(source_paragraphs, papers_in_dwh, how='left', left_on='article_id', right_on='article_source_id').drop(columns=['article_source_id', 'article_id'])
     transformed_para.fillna({'last_section_title': 'MISSING', 'last_subsection_title': 'MISSING', 'paragraph_type': 'MISSING', 'paper_pk': 0}, axis=0, inplace=True)
-    return transformed_para
+    return dt.apply_dtype_policy(transformed_para)
 
 def find_delta_paragraphs(source_para_trans, para_in_dwh):
     """Finds delta between source paragraphs and those present in table dim_paragraph, adds a consecutive primary key to those missing rows and eventually creates dummy row for missing paragraphs.
@@ -1,5 +1,8 @@
 import etl.common_functions as cof
-import etl.database as db 
+import etl.dtypes as dt
+import etl.inferred_members as im
+import etl.key_dictionary as kd
+import etl.sharding as sh
 import pandas as pd
 
 def extract_sentences_from_files():
@@ -27,50 +30,168 @@ def transform_sentences(source_sentences, engine):
     Returns:
         Dataframe of sentences with paragraph_pk and citation paper_pk.
     """
-    #load foreign keys from citations papers
-    citations=cof.load_sourcefile('citations.csv')[['sentence_id', 'reference_citekey']]
-    papers_in_dwh=db.load_full_table(engine, 'dim_paper')[['citekey', 'paper_pk']]
-    citations_with_pk=pd.merge(citations, papers_in_dwh, how='left', left_on='reference_citekey', right_on='citekey')[['sentence_id', 'paper_pk']]
-    sentences_with_reference_pk=pd.merge(source_sentences, citations_with_pk, how='left', on='sentence_id')
-    #get paragraph_pk as foreign key
-    paragraphs_in_dwh=db.load_full_table(engine, 'dim_paragraph')[['paragraph_pk', 'para_source_id']]
-    sentences_with_para_pk=pd.merge(sentences_with_reference_pk, paragraphs_in_dwh, how='left', left_on='para_id', right_on='para_source_id').drop(columns=['para_id', 'para_source_id'])
-    #add some strategies for missing values
-    sentences_with_para_pk.fillna({'sentence_id': '0', 'sentence': 'MISSING', 'sentence_type': 'MISSING', 'paper_pk': 0, 'paragraph_pk': 0}, axis=0, inplace=True)
-    return sentences_with_para_pk
+    #all joins on the VARCHAR source keys run on their integer codes from the key dictionary
+    citations_with_pk, paragraphs_in_dwh=_load_sentence_keys(engine, source_sentences)
+    source_sentences=source_sentences.assign(sentence_code=kd.encode(engine, 'sentence', source_sentences.sentence_id), para_code=kd.encode(engine, 'paragraph', source_sentences.para_id))
+    return dt.apply_dtype_policy(_join_sentence_keys(source_sentences, citations_with_pk, paragraphs_in_dwh.para_code.to_numpy(), paragraphs_in_dwh.paragraph_pk))
 
-def find_delta_sentences(transformed_sentences, sentences_in_dwh):
+def find_delta_sentences(transformed_sentences, sentences_in_dwh, engine):
     """Finds delta of sentences in source file and those present in the DB table dim_sentence. For the delta rows, a citationgroup_pk is added.
     
     Args:
         transformed_sentences (DataFrame): transformed source sentences.
-        sentences_in_dwh (DataFrame): sentences currently present in the DB table dim_sentence.
+        sentences_in_dwh (DataFrame): sentence_pk, citationgroup_pk and sentence_code of the sentences in the DB, from kd.load_codes().
+        engine (SQLAlchemy engine): engine object to connect to the target DB, needed for the key dictionary.
     Returns: 
         DataFrame of delta citationgroups, ready to be inserted into dim_citationgroup.
         DataFrame of delta sentence_citation combinations, ready to be inserted into bridge_sentence_citation.
         DataFrame of delta sentences, ready to be inserted into dim_sentence.
     """
+    delta=dict(iter_delta_sentences(transformed_sentences, sentences_in_dwh, engine))
+    return delta['dim_citationgroup'], delta['bridge_sentence_citation'], delta['dim_sentence']
+
+def iter_delta_sentences(transformed_sentences, sentences_in_dwh, engine):
+    """Generator version of find_delta_sentences(): each delta table is yielded as soon as it is complete, in an order that respects the foreign key constraints.
+    
+    Args:
+        transformed_sentences (DataFrame): transformed source sentences.
+        sentences_in_dwh (DataFrame): sentence_pk, citationgroup_pk and sentence_code of the sentences in the DB, from kd.load_codes().
+        engine (SQLAlchemy engine): engine object to connect to the target DB, needed for the key dictionary.
+
+    Yields:
+        Tuples of table name and DataFrame of delta rows for dim_citationgroup, bridge_sentence_citation and dim_sentence.
+    """
     #get maximum primary key currently in db and group pk for citations
     max_pk=max(sentences_in_dwh.sentence_pk, default=0)
     max_citationgroup_pk=max(sentences_in_dwh.citationgroup_pk, default=0)
     #find subset of entries not yet present in dwh
-    delta_sentences=transformed_sentences[transformed_sentences.sentence_id.apply(lambda i: False if  i in sentences_in_dwh.sentence_source_id.to_list() else True)]
+    delta_sentences=transformed_sentences[~kd.contains(transformed_sentences.sentence_code.fillna(-1).to_numpy(dtype='int64'), sentences_in_dwh.sentence_code.to_numpy())]
+    delta_citationgroup, delta_bridge_sentence_citation, delta_sentences=_number_delta_sentences(delta_sentences, max_pk+1, max_citationgroup_pk+1)
+    if max_citationgroup_pk==0:
+        delta_citationgroup, delta_bridge_sentence_citation=_with_dummy_citationgroup(delta_citationgroup, delta_bridge_sentence_citation)
+    yield 'dim_citationgroup', delta_citationgroup
+    yield 'bridge_sentence_citation', delta_bridge_sentence_citation
+    if max_pk==0:
+        delta_sentences=_with_dummy_sentence(delta_sentences)
+    yield 'dim_sentence', delta_sentences
+
+def find_delta_sentences_sharded(source_sentences, sentences_in_dwh, engine, shard_count):
+    """Sharded version of transform_sentences() and find_delta_sentences() for multiple cores. The sentences are split by paragraph into shards,
+    which are transformed and diffed in a process pool. The source keys are encoded before, as only this process writes new codes to the key dictionary.
+    Every shard numbers its sentences and citationgroups within a reserved range of primary keys, so the results are only concatenated.
+    The ranges are reserved for all new source rows, so the primary keys have gaps where the source file contains duplicate sentence rows.
+
+    Args:
+        source_sentences (DataFrame): df of sentences from the souce file.
+        sentences_in_dwh (DataFrame): sentence_pk, citationgroup_pk and sentence_code of the sentences in the DB, from kd.load_codes().
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        shard_count (int): number of shards and worker processes.
+
+    Returns:
+        DataFrame of delta citationgroups, ready to be inserted into dim_citationgroup.
+        DataFrame of delta sentence_citation combinations, ready to be inserted into bridge_sentence_citation.
+        DataFrame of delta sentences, ready to be inserted into dim_sentence.
+    """
+    max_pk=max(sentences_in_dwh.sentence_pk, default=0)
+    max_citationgroup_pk=max(sentences_in_dwh.citationgroup_pk, default=0)
+    citations_with_pk, paragraphs_in_dwh=_load_sentence_keys(engine, source_sentences)
+    source_sentences=source_sentences.assign(sentence_code=kd.encode(engine, 'sentence', source_sentences.sentence_id), para_code=kd.encode(engine, 'paragraph', source_sentences.para_id))
+    #only new sentences are transformed, the diff on the sentence codes is the same as after the transformation
+    source_sentences=source_sentences[~kd.contains(source_sentences.sentence_code.to_numpy(), sentences_in_dwh.sentence_code.to_numpy())]
+    shards=sh.shard_ids(source_sentences.para_code.to_numpy(), shard_count)
+    #citations follow their sentence into its shard, citations of sentences that are not new are not needed
+    shard_of_sentence=pd.Series(shards, index=source_sentences.sentence_code.to_numpy())
+    shard_of_sentence=shard_of_sentence[~shard_of_sentence.index.duplicated()]
+    citations_with_pk=citations_with_pk.assign(shard=shard_of_sentence.reindex(citations_with_pk.sentence_code.to_numpy()).to_numpy()).dropna(subset=['shard'])
+    sentence_shards=[source_sentences[shards==shard] for shard in range(shard_count)]
+    first_pks=sh.reserve_pk_ranges(max_pk+1, [len(sentences.index) for sentences in sentence_shards])
+    first_citationgroup_pks=sh.reserve_pk_ranges(max_citationgroup_pk+1, [sentences.sentence_code.nunique(dropna=False) for sentences in sentence_shards])
+    results=sh.run_shards(_transform_sentence_shard, [
+        (sentence_shards[shard], citations_with_pk[citations_with_pk['shard']==shard].drop(columns=['shard']), first_pks[shard], first_citationgroup_pks[shard]) for shard in range(shard_count)],
+        {'paragraph_codes': paragraphs_in_dwh.para_code.to_numpy(), 'paragraph_pks': paragraphs_in_dwh.paragraph_pk.to_numpy()})
+    delta_citationgroup, delta_bridge_sentence_citation, delta_sentences=(pd.concat(tables, ignore_index=True) for tables in zip(*results))
+    if max_citationgroup_pk==0:
+        delta_citationgroup, delta_bridge_sentence_citation=_with_dummy_citationgroup(delta_citationgroup, delta_bridge_sentence_citation)
+    if max_pk==0:
+        delta_sentences=_with_dummy_sentence(delta_sentences)
+    return delta_citationgroup, delta_bridge_sentence_citation, dt.apply_dtype_policy(delta_sentences)
+
+def _transform_sentence_shard(source_sentences, citations_with_pk, first_pk, first_citationgroup_pk):
+    """Transforms and numbers the new sentences of one shard, runs in a worker process of find_delta_sentences_sharded()."""
+    transformed_sentences=_join_sentence_keys(source_sentences, citations_with_pk, sh.get_shared('paragraph_codes'), sh.get_shared('paragraph_pks'))
+    return _number_delta_sentences(transformed_sentences, first_pk, first_citationgroup_pk)
+
+def _load_sentence_keys(engine, source_sentences):
+    """Loads the citations of the source file with the paper_pk of the cited paper and the paragraphs in the DB.
+    Cited papers and paragraphs that are not loaded yet are inserted as inferred members.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        source_sentences (DataFrame): df of sentences from the souce file.
+
+    Returns:
+        DataFrame of citations with the columns sentence_code and paper_pk.
+        DataFrame of the paragraph_pk and para_code of the paragraphs in the DB.
+    """
+    #load foreign keys from citations papers, the dimensions are read by the stored codes of their natural keys
+    citations=cof.load_sourcefile('citations.csv')[['sentence_id', 'reference_citekey']]
+    citekey_codes=kd.encode(engine, 'citekey', citations.reference_citekey)
+    papers_in_dwh=im.infer_coded_members(engine, 'dim_paper', citations.reference_citekey, citekey_codes, kd.load_codes(engine, 'dim_paper'))
+    citations_with_pk=pd.DataFrame({
+        'sentence_code': kd.encode(engine, 'sentence', citations.sentence_id),
+        'paper_pk': kd.lookup(citekey_codes, papers_in_dwh.citekey_code.to_numpy(), papers_in_dwh.paper_pk)})
+    paragraphs_in_dwh=im.infer_coded_members(engine, 'dim_paragraph', source_sentences.para_id, kd.encode(engine, 'paragraph', source_sentences.para_id), kd.load_codes(engine, 'dim_paragraph'))
+    return citations_with_pk, paragraphs_in_dwh
+
+def _join_sentence_keys(source_sentences, citations_with_pk, paragraph_codes, paragraph_pks):
+    """Joins the paper_pk of the cited papers and the paragraph_pk to sentences with encoded source keys.
+
+    Args:
+        source_sentences (DataFrame): sentences from the source file with the additional columns sentence_code and para_code.
+        citations_with_pk (DataFrame): citations from _load_sentence_keys().
+        paragraph_codes (array): codes of the para_source_id of the paragraphs in the DB.
+        paragraph_pks (array): paragraph_pk of the paragraphs in the DB, in the same order as paragraph_codes.
+
+    Returns:
+        Dataframe of sentences with paragraph_pk, citation paper_pk and sentence_code, which is stored in dim_sentence.
+    """
+    sentences_with_reference_pk=pd.merge(source_sentences, citations_with_pk, how='left', on='sentence_code')
+    #get paragraph_pk as foreign key
+    sentences_with_reference_pk['paragraph_pk']=kd.lookup(sentences_with_reference_pk.para_code.to_numpy(), paragraph_codes, paragraph_pks)
+    sentences_with_para_pk=sentences_with_reference_pk.drop(columns=['para_id', 'para_code']).assign(sentence_code=lambda df: kd.nullable(df.sentence_code.to_numpy()))
+    #add some strategies for missing values
+    sentences_with_para_pk.fillna({'sentence_id': '0', 'sentence': 'MISSING', 'sentence_type': 'MISSING', 'paper_pk': 0, 'paragraph_pk': 0}, axis=0, inplace=True)
+    return sentences_with_para_pk
+
+def _number_delta_sentences(delta_sentences, first_pk, first_citationgroup_pk):
+    """Assigns citationgroup_pk and sentence_pk to new sentences and separates citationgroups and their bridge.
+
+    Args:
+        delta_sentences (DataFrame): transformed sentences that are not yet present in the DB.
+        first_pk (int): the first sentence_pk to assign.
+        first_citationgroup_pk (int): the first citationgroup_pk to assign.
+
+    Returns:
+        DataFrame of delta citationgroups, DataFrame of delta sentence_citation combinations and DataFrame of delta sentences, without dummy rows.
+    """
     #assign citationgroup_pk
-    delta_sentences['citationgroup_pk']=delta_sentences.groupby(by='sentence_id').ngroup(ascending=True)+max_citationgroup_pk+1
+    delta_sentences['citationgroup_pk']=delta_sentences.groupby(by='sentence_id').ngroup(ascending=True)+first_citationgroup_pk
     #separate citation_paper_bridge and dim_citationgroup
     delta_bridge_sentence_citation=delta_sentences[['citationgroup_pk', 'paper_pk']].drop_duplicates()
     delta_citationgroup=pd.DataFrame(delta_sentences['citationgroup_pk']).drop_duplicates()
     #now drop unnecessary columns, remove then the duplicated sentence rows and rename columns so they fit to the db table
     delta_sentences=delta_sentences.drop(columns=['paper_pk']).drop_duplicates().rename({'sentence_id': 'sentence_source_id', 'sentence': 'sentence_string'}, axis=1)
     #add primary_key
-    delta_sentences['sentence_pk']=list(range(max_pk+1, max_pk+1+delta_sentences.index.size))
-     #insert dummy row with primary key 0 if the table was empty before. Will serve as dummy for linked tables to avoid missing foreign keys in case of missing values
-    if max_pk==0:
-        dummy_sent={'sentence_pk': 0, 'sentence_source_id': '0', 'sentence_string': 'MISSING', 'sentence_type': 'MISSING', 'citationgroup_pk': 0, 'paragraph_pk': 0}
-        delta_sentences=pd.concat([delta_sentences, pd.DataFrame([dummy_sent])], ignore_index=True)
-    if max_citationgroup_pk==0:
-        delta_bridge_sentence_citation=pd.concat([delta_bridge_sentence_citation, pd.DataFrame([{'citationgroup_pk': 0, 'paper_pk': 0}])], ignore_index=True)
-        delta_citationgroup=pd.concat([delta_citationgroup, pd.DataFrame([{'citationgroup_pk': 0}])], ignore_index=True)
+    delta_sentences['sentence_pk']=list(range(first_pk, first_pk+delta_sentences.index.size))
     return delta_citationgroup, delta_bridge_sentence_citation, delta_sentences
 
+def _with_dummy_citationgroup(delta_citationgroup, delta_bridge_sentence_citation):
+    """Adds the dummy citationgroup with primary key 0 and its bridge row, for the first load of an empty table."""
+    delta_bridge_sentence_citation=pd.concat([delta_bridge_sentence_citation, pd.DataFrame([{'citationgroup_pk': 0, 'paper_pk': 0}])], ignore_index=True)
+    delta_citationgroup=pd.concat([delta_citationgroup, pd.DataFrame([{'citationgroup_pk': 0}])], ignore_index=True)
+    return delta_citationgroup, delta_bridge_sentence_citation
 
+def _with_dummy_sentence(delta_sentences):
+    """Adds the dummy sentence with primary key 0 if the table was empty before. Will serve as dummy for linked tables to avoid missing foreign keys in case of missing values."""
+    dummy_sent={'sentence_pk': 0, 'sentence_source_id': '0', 'sentence_string': 'MISSING', 'sentence_type': 'MISSING', 'citationgroup_pk': 0, 'paragraph_pk': 0}
+    return pd.concat([delta_sentences, pd.DataFrame([dummy_sent])], ignore_index=True)
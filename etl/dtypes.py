@@ -0,0 +1,73 @@
+import pandas as pd
+
+#string columns with few distinct values that are held as categoricals in the large pipeline DataFrames
+CATEGORICAL_COLUMNS=['sentence_type', 'paragraph_type', 'heading', 'last_section_title', 'entity_label', 'entity_name']
+#surrogate keys and group keys are held as nullable 32 bit integers, matching the INTEGER columns in the DB. Nullable, so that left merges produce <NA> instead of turning them into floats
+KEY_DTYPE='Int32'
+
+
+def is_key_column(column):
+    """Checks whether a column holds a surrogate key or group key.
+
+    Args:
+        column (str): name of the column.
+
+    Returns:
+        True for primary and foreign key columns (ending in _pk) and group indexes, otherwise False.
+    """
+    return column.endswith('_pk') or column=='group_index'
+
+def cast_keys(df):
+    """Casts all key columns of a DataFrame to the nullable 32 bit integer dtype.
+
+    Args:
+        df (DataFrame): any pipeline DataFrame.
+
+    Returns:
+        The DataFrame with cast key columns.
+    """
+    key_columns={column: KEY_DTYPE for column in df.columns if is_key_column(column) and str(df[column].dtype)!=KEY_DTYPE}
+    return df.astype(key_columns) if key_columns else df
+
+def apply_dtype_policy(df, categorical_columns=CATEGORICAL_COLUMNS):
+    """Applies the dtype policy to a DataFrame: key columns become nullable 32 bit integers and repeated strings become categoricals.
+    Categoricals should only be applied after all missing values were filled, as a categorical column cannot be filled with a value that is not one of its categories.
+
+    Args:
+        df (DataFrame): any pipeline DataFrame.
+        categorical_columns (list): names of the string columns to convert to categoricals, if present.
+
+    Returns:
+        The DataFrame with compact dtypes.
+    """
+    df=cast_keys(df)
+    categoricals={column: 'category' for column in categorical_columns if column in df.columns and df[column].dtype==object}
+    return df.astype(categoricals) if categoricals else df
+
+def memory_usage(df):
+    """Calculates the memory used by a DataFrame, including the Python strings in object columns.
+
+    Args:
+        df (DataFrame): any pipeline DataFrame.
+
+    Returns:
+        Memory usage in bytes.
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def memory_report(stages):
+    """Prints the memory usage of pipeline DataFrames before and after applying the dtype policy.
+
+    Args:
+        stages (dict): maps the name of a stage to a tuple of the DataFrame before and after applying the dtype policy.
+
+    Returns:
+        DataFrame with one row per stage and the columns stage, before_mb, after_mb and saving.
+    """
+    rows=[]
+    for stage, (before, after) in stages.items():
+        before_mb, after_mb=memory_usage(before)/2**20, memory_usage(after)/2**20
+        rows.append({'stage': stage, 'before_mb': round(before_mb, 1), 'after_mb': round(after_mb, 1), 'saving': '{:.0%}'.format(1-after_mb/before_mb if before_mb else 0)})
+    report=pd.DataFrame(rows)
+    print(report.to_string(index=False))
+    return report
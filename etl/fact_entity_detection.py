@@ -1,11 +1,24 @@
+import etl.aggregation_entity as agg_ent
 import etl.common_functions as cof
 import etl.database as db
+import etl.key_dictionary as kd
 import pandas as pd
+import numpy as np
+from sqlalchemy import text
+from variables import fact_partition_size
+
+#appends the facts of a partition (:lower to :upper) that are not yet in wide_sentence_entity, joined with their sentence, paragraph and entity attributes
+SENTENCE_ENTITY_INSERT="""INSERT INTO wide_sentence_entity (sentence_pk, entity_pk, paper_pk, heading, paragraph_type, sentence_type, sentence_string, entity_label, entity_name, entity_count)
+        SELECT fed.sentence_pk, fed.entity_pk, dp.paper_pk, dp.heading, dp.paragraph_type, ds.sentence_type, ds.sentence_string, de.entity_label, de.entity_name, fed.entity_count
+        FROM fact_entity_detection fed INNER JOIN dim_entity de ON fed.entity_pk=de.entity_pk LEFT JOIN dim_sentence ds ON fed.sentence_pk=ds.sentence_pk LEFT JOIN dim_paragraph dp ON ds.paragraph_pk=dp.paragraph_pk
+        WHERE fed.sentence_pk >= :lower AND fed.sentence_pk < :upper
+        AND NOT EXISTS (SELECT 1 FROM wide_sentence_entity wse WHERE wse.sentence_pk=fed.sentence_pk AND wse.entity_pk=fed.entity_pk)"""
+PARTITION_LOG_UPSERT='INSERT INTO fact_partition_log (partition_no, loaded_at) VALUES (:partition_no, now()) ON CONFLICT (partition_no) DO UPDATE SET loaded_at=excluded.loaded_at'
 
 def extract_unique_facts_from_file():
     """Extracts facts about entity detections in a sentence from the source file entities.csv.
-    
-    Returns: 
+
+    Returns:
         DataFrame of entities without duplicates.
     """
     source_facts=cof.load_sourcefile('entities.csv')
@@ -13,25 +26,222 @@ def extract_unique_facts_from_file():
     source_facts=source_facts.groupby(['sentence_id', 'ent_id']).size().reset_index().rename(columns={0:'entity_count', 'entity': 'entity_instance'})
     return source_facts
 
-def transform_delta_facts(source_facts, facts_in_dwh, engine):
-    """Exchanges entity and sentence for their foreign keys and finds delta of facts in the source file vs those in the DB.
-    
+def transform_facts(source_facts, engine):
+    """Exchanges entity and sentence of the source facts for their foreign keys. Facts whose sentence or entity is not present in the DB are dropped.
+
     Args:
         source_facts (DataFrame): df of source entities.
-        facts_in_dwh (DataFrame): df of facts currently present in the DB table fact_entity_detection.
         engine (SQLAlchemy engine): engine object to connect to the target DB.
+
+    Returns:
+        DataFrame of facts with the columns entity_pk, sentence_pk and entity_count.
+    """
+    #the lookups run on the integer codes of the VARCHAR source keys from the key dictionary, the codes of the dimensions are stored in their code columns
+    dim_sentence=kd.load_codes(engine, 'dim_sentence')
+    dim_entity=kd.load_codes(engine, 'dim_entity')
+    return _lookup_fact_keys(kd.encode(engine, 'entity', source_facts.ent_id), kd.encode(engine, 'sentence', source_facts.sentence_id), source_facts.entity_count.to_numpy(),
+        dim_entity.entity_code.to_numpy(), dim_entity.entity_pk, dim_sentence.sentence_code.to_numpy(), dim_sentence.sentence_pk)
+
+def _lookup_fact_keys(entity_codes, sentence_codes, entity_counts, dim_entity_codes, dim_entity_pks, dim_sentence_codes, dim_sentence_pks):
+    """Exchanges the encoded entity and sentence of facts for their primary keys and drops facts whose sentence or entity is not present in the DB.
+
+    Args:
+        entity_codes (array): codes of the ent_id of the facts.
+        sentence_codes (array): codes of the sentence_id of the facts.
+        entity_counts (array): the entity_count of the facts.
+        dim_entity_codes (array): codes of the entity_name of the entities in the DB.
+        dim_entity_pks (array): entity_pk of the entities in the DB, in the same order as dim_entity_codes.
+        dim_sentence_codes (array): codes of the sentence_source_id of the sentences in the DB.
+        dim_sentence_pks (array): sentence_pk of the sentences in the DB, in the same order as dim_sentence_codes.
+
+    Returns:
+        DataFrame of facts with the columns entity_pk, sentence_pk and entity_count.
+    """
+    source_facts=pd.DataFrame({
+        'entity_pk': kd.lookup(entity_codes, dim_entity_codes, dim_entity_pks),
+        'sentence_pk': kd.lookup(sentence_codes, dim_sentence_codes, dim_sentence_pks),
+        'entity_count': entity_counts})
+    source_facts=source_facts.dropna(axis=0, how='any')
+    return source_facts
+
+def find_delta_facts(source_facts, facts_in_dwh):
+    """Finds delta of transformed source facts vs the facts in the DB.
+
+    Args:
+        source_facts (DataFrame): transformed facts from transform_facts().
+        facts_in_dwh (DataFrame): df of facts currently present in the DB table fact_entity_detection (or one of its partitions).
+
     Returns:
-        DataFrame of transformed delta rows of facts, ready to load into fact_entity_detection table.
+        DataFrame of delta rows of facts, ready to load into fact_entity_detection table.
     """
-    #first get sentence_pk and entity_pk and substitute the names in the source facts with it
-    dim_sentence=db.load_full_table(engine, 'dim_sentence')
-    dim_entity=db.load_full_table(engine, 'dim_entity')
-    source_facts=pd.merge(source_facts, dim_sentence, how='left', left_on='sentence_id', right_on='sentence_source_id')[['ent_id', 'sentence_pk', 'entity_count']]
-    source_facts=pd.merge(source_facts, dim_entity, how='left', left_on='ent_id', right_on='entity_name')[['entity_pk', 'sentence_pk', 'entity_count']]
-    #find delta of facts in dwh vs source facts
     outer=pd.merge(source_facts, facts_in_dwh, how='outer')
     delta_facts=pd.concat([outer,facts_in_dwh]).drop_duplicates(keep=False)
     delta_facts.dropna(axis=0, how='any', inplace=True)
     return delta_facts
 
+def find_delta_facts_anti_join(source_facts, keys_in_dwh):
+    """Finds delta of transformed source facts vs the facts in the DB by an anti-join on the grain (sentence_pk, entity_pk).
+    Both key columns are packed into one int64 per fact and looked up by binary search in the sorted keys of the DB, so the fact table is neither merged nor concatenated.
+    Facts whose grain is already present are not part of the delta, even if their entity_count differs.
+
+    Args:
+        source_facts (DataFrame): transformed facts from transform_facts().
+        keys_in_dwh (DataFrame): sentence_pk and entity_pk of the facts currently present in the DB (or one of its partitions).
+
+    Returns:
+        DataFrame of delta rows of facts, ready to load into fact_entity_detection table.
+    """
+    existing=np.sort(_grain_keys(keys_in_dwh))
+    keys=_grain_keys(source_facts)
+    positions=np.searchsorted(existing, keys)
+    found=existing[np.minimum(positions, len(existing)-1)]==keys if len(existing) else np.zeros(len(keys), dtype=bool)
+    return source_facts[~found].drop_duplicates(subset=['sentence_pk', 'entity_pk'])
+
+def filter_above_watermark(source_facts, watermark):
+    """Keeps only the facts of sentences with a sentence_pk above the high-water mark of the last successful Fact ETL run.
+
+    Args:
+        source_facts (DataFrame): transformed facts from transform_facts().
+        watermark (int): the high-water mark from load_fact_watermark().
+
+    Returns:
+        DataFrame of the facts above the high-water mark.
+    """
+    return source_facts[source_facts.sentence_pk>watermark]
+
+def load_fact_watermark(engine):
+    """Loads the high-water mark of the last successful Fact ETL run, i.e. the highest sentence_pk it considered.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+
+    Returns:
+        The high-water mark, -1 if the Fact ETL has not run yet.
+    """
+    watermark=db.load_df_from_query(engine, "select high_water_mark from etl_watermark where pipeline='Fact ETL'")
+    return -1 if watermark.empty else int(watermark.high_water_mark[0])
+
+def save_fact_watermark(engine, watermark):
+    """Records the high-water mark of a successful Fact ETL run.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        watermark (int): the highest sentence_pk considered in this run.
+    """
+    db.execute_statement(engine, "INSERT INTO etl_watermark (pipeline, high_water_mark, updated_at) VALUES ('Fact ETL', :watermark, now()) ON CONFLICT (pipeline) DO UPDATE SET high_water_mark=excluded.high_water_mark, updated_at=excluded.updated_at", {'watermark': int(watermark)})
+
+def split_fact_partitions(transformed_facts):
+    """Splits transformed facts by the range partition of fact_entity_detection their sentence_pk belongs to.
+
+    Args:
+        transformed_facts (DataFrame): facts from transform_facts().
+
+    Returns:
+        Iterator of tuples of partition number and DataFrame of the facts in this partition.
+    """
+    return iter(transformed_facts.groupby(transformed_facts.sentence_pk//fact_partition_size))
 
+def find_delta_fact_partition(partition_facts, partition_no, engine, delta_mode='anti-join', watermark=-1):
+    """Finds the delta of the transformed source facts of one partition vs the rows of the same partition in the DB.
+
+    Args:
+        partition_facts (DataFrame): transformed facts that all belong to the partition.
+        partition_no (int): number of the partition, i.e. sentence_pk // fact_partition_size.
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        delta_mode (str): 'full-diff' compares all columns of the facts, 'anti-join' and 'incremental' anti-join on the grain.
+        watermark (int): in 'incremental' mode only the DB facts above this sentence_pk are loaded for the comparison.
+
+    Returns:
+        DataFrame of delta facts of this partition.
+    """
+    if delta_mode=='full-diff':
+        facts_in_partition=load_fact_partition(engine, partition_no)
+        return find_delta_facts(partition_facts, facts_in_partition)
+    keys_in_partition=load_fact_partition_keys(engine, partition_no, watermark if delta_mode=='incremental' else -1)
+    return find_delta_facts_anti_join(partition_facts, keys_in_partition)
+
+def load_fact_partition(engine, partition_no):
+    """Loads the facts of one range partition of fact_entity_detection. The range condition lets Postgres prune all other partitions.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        partition_no (int): number of the partition, i.e. sentence_pk // fact_partition_size.
+
+    Returns:
+        DataFrame of the facts in this partition.
+    """
+    sql_query='select entity_pk, sentence_pk, entity_count from fact_entity_detection where sentence_pk >= {} and sentence_pk < {}'.format(partition_no*fact_partition_size, (partition_no+1)*fact_partition_size)
+    return db.load_df_from_query(engine, sql_query)
+
+def load_fact_partition_keys(engine, partition_no, watermark=-1):
+    """Loads only the grain (sentence_pk, entity_pk) of the facts of one range partition of fact_entity_detection, optionally only above a high-water mark.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        partition_no (int): number of the partition, i.e. sentence_pk // fact_partition_size.
+        watermark (int): only facts with a sentence_pk above this value are loaded.
+
+    Returns:
+        DataFrame of sentence_pk and entity_pk of the facts in this partition.
+    """
+    sql_query='select sentence_pk, entity_pk from fact_entity_detection where sentence_pk >= {} and sentence_pk < {}'.format(max(partition_no*fact_partition_size, watermark+1), (partition_no+1)*fact_partition_size)
+    return db.load_df_from_query(engine, sql_query)
+
+def create_fact_partition(engine, partition_no):
+    """Creates the range partition of fact_entity_detection with the given number, if it does not exist yet.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        partition_no (int): number of the partition, i.e. sentence_pk // fact_partition_size.
+    """
+    db.execute_statement(engine, 'CREATE TABLE IF NOT EXISTS public.fact_entity_detection_p{} PARTITION OF public.fact_entity_detection FOR VALUES FROM ({}) TO ({})'.format(
+        partition_no, partition_no*fact_partition_size, (partition_no+1)*fact_partition_size))
+
+def load_delta_partition(engine, delta_facts, partition_no, rollups):
+    """Loads the delta facts of a partition and everything derived from them in one transaction: the facts, their rows of wide_sentence_entity,
+    the rollups and the entry in fact_partition_log. If the insert of the facts fails (e.g. a fact of --fact-delta full-diff whose entity_count changed),
+    nothing is committed, so the rollups never count facts that were not inserted.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        delta_facts (DataFrame): the delta facts of the partition.
+        partition_no (int): number of the partition, its table must exist, see create_fact_partition().
+        rollups (tuple): the deltas of the rollup tables from agg_ent.calc_rollups(), in the order of agg_ent.ROLLUP_KEYS.
+    """
+    bounds={'lower': int(partition_no)*fact_partition_size, 'upper': (int(partition_no)+1)*fact_partition_size}
+    with engine.begin() as conn:
+        delta_facts.to_sql('fact_entity_detection_p{}'.format(partition_no), conn, if_exists='append', index=False)
+        conn.execute(text(SENTENCE_ENTITY_INSERT), bounds)
+        for table, rollup in zip(agg_ent.ROLLUP_KEYS, rollups):
+            agg_ent.upsert_rollup(conn.connection, rollup, table)
+        conn.execute(text(PARTITION_LOG_UPSERT), {'partition_no': int(partition_no)})
+
+def append_to_sentence_entity(engine, partition_no):
+    """Appends the facts of a partition that are not yet in wide_sentence_entity, joined with their sentence, paragraph and entity attributes.
+    The existing rows are found by the primary key of wide_sentence_entity, so only the new facts are joined.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        partition_no (int): number of the partition that received new rows.
+    """
+    db.execute_statement(engine, SENTENCE_ENTITY_INSERT, {'lower': int(partition_no)*fact_partition_size, 'upper': (int(partition_no)+1)*fact_partition_size})
+
+def backfill_sentence_entity(engine):
+    """Fills wide_sentence_entity from all partitions of fact_entity_detection, for warehouses that were loaded before the table existed.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+    """
+    for partition_no in db.load_df_from_query(engine, 'select partition_no from fact_partition_log order by partition_no').partition_no:
+        append_to_sentence_entity(engine, partition_no)
+
+def _grain_keys(facts):
+    """Packs sentence_pk and entity_pk of each fact into one int64, so that the grain can be compared as a single integer.
+
+    Args:
+        facts (DataFrame): facts with the columns sentence_pk and entity_pk.
+
+    Returns:
+        numpy array of int64 keys.
+    """
+    return (facts.sentence_pk.to_numpy(dtype=np.int64)<<32) | facts.entity_pk.to_numpy(dtype=np.int64)
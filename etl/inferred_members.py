@@ -0,0 +1,229 @@
+import etl.aggregation_entity as agg_ent
+import etl.database as db
+import etl.dtypes as dt
+import etl.key_dictionary as kd
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from variables import fact_partition_size
+
+#dummy rows with key 0 of the tables that inferred members may reference, the first column is the key. Must match the dummy rows of the pipelines
+DUMMY_ROWS={
+    'dim_keyword': {'keyword_pk': 0, 'keyword_string': 'MISSING'},
+    'dim_author': {'author_pk': 0, 'surname': 'MISSING', 'firstname': 'MISSING', 'middlename': 'MISSING', 'email': 'MISSING', 'department': 'MISSING', 'institution': 'MISSING', 'country': 'MISSING'},
+    'dim_journal': {'journal_pk': 0, 'title': 'MISSING', 'volume': 0, 'issue': 0, 'publisher': 'MISSING', 'place': 'MISSING'},
+    'dim_keywordgroup': {'keywordgroup_pk': 0},
+    'bridge_paper_keyword': {'keywordgroup_pk': 0, 'keyword_pk': 0},
+    'dim_authorgroup': {'authorgroup_pk': 0},
+    'bridge_paper_author': {'authorgroup_pk': 0, 'author_pk': 0, 'author_position': 0},
+    'dim_paper': {'paper_pk': 0, 'article_source_id': 0, 'citekey': 'MISSING', 'abstract': 'MISSING', 'year': pd.to_datetime(1678, format='%Y').normalize(), 'title': 'MISSING', 'authorgroup_pk': 0, 'no_of_pages': 0, 'journal_pk': 0, 'keywordgroup_pk': 0},
+    'dim_paragraph': {'paragraph_pk': 0, 'para_source_id': '0', 'heading': 'MISSING', 'subheading': 'MISSING', 'paragraph_type': 'MISSING', 'paper_pk': 0}
+}
+#tables whose dummy rows the dummy row of a table references, they are inserted first
+DUMMY_REFERENCES={
+    'bridge_paper_keyword': ['dim_keyword', 'dim_keywordgroup'],
+    'bridge_paper_author': ['dim_author', 'dim_authorgroup'],
+    'dim_paper': ['dim_journal', 'bridge_paper_keyword', 'bridge_paper_author'],
+    'dim_paragraph': ['dim_paper']
+}
+#dimensions that get inferred members, with their primary key and the natural keys an inferred member can be created from. dim_paper is referenced by article_id from paragraphs and by citekey from citations
+INFERRED_DIMENSIONS={
+    'dim_keyword': {'pk': 'keyword_pk', 'keys': [['keyword_string']]},
+    'dim_author': {'pk': 'author_pk', 'keys': [['surname', 'firstname', 'middlename']]},
+    'dim_journal': {'pk': 'journal_pk', 'keys': [['title', 'volume', 'issue', 'publisher', 'place']]},
+    'dim_paper': {'pk': 'paper_pk', 'keys': [['article_source_id'], ['citekey']]},
+    'dim_paragraph': {'pk': 'paragraph_pk', 'keys': [['para_source_id']]}
+}
+#statements that refresh the tables derived from a dimension when inferred members (:pks) are resolved, :papers are the papers of the resolved paragraphs before and after.
+#The fact partitions of the affected sentences count as loaded again, so that the Parquet export rewrites their fact_by_paper files and the Aggregation Paper ETL runs
+DERIVED_REFRESH={
+    'dim_paper': [
+        'DELETE FROM aggregation_paper WHERE paper_pk=ANY(:pks)',
+        """UPDATE fact_partition_log SET loaded_at=now() WHERE partition_no IN (
+            SELECT DISTINCT ds.sentence_pk/{0} FROM dim_sentence ds INNER JOIN dim_paragraph dp ON ds.paragraph_pk=dp.paragraph_pk WHERE dp.paper_pk=ANY(:pks))""".format(fact_partition_size)
+    ],
+    'dim_paragraph': [
+        """UPDATE wide_sentence_entity wse SET paper_pk=dp.paper_pk, heading=dp.heading, paragraph_type=dp.paragraph_type
+            FROM dim_sentence ds INNER JOIN dim_paragraph dp ON ds.paragraph_pk=dp.paragraph_pk WHERE wse.sentence_pk=ds.sentence_pk AND dp.paragraph_pk=ANY(:pks)""",
+        'DELETE FROM aggregation_paper WHERE paper_pk=ANY(:papers)',
+        """UPDATE fact_partition_log SET loaded_at=now() WHERE partition_no IN (
+            SELECT DISTINCT sentence_pk/{0} FROM dim_sentence WHERE paragraph_pk=ANY(:pks))""".format(fact_partition_size)
+    ]
+}
+#the facts of a resolved paragraph move to its real paper, so the paper rollup of its papers before and after is calculated again
+PAPER_ROLLUP_REFRESH=[
+    'DELETE FROM aggregation_paper_entity WHERE paper_pk=ANY(:papers)',
+    agg_ent.PAPER_ROLLUP_QUERY.format('WHERE coalesce(dp.paper_pk, 0)=ANY(:papers)')
+]
+
+
+def infer_members(engine, table, source_keys, in_dwh):
+    """Inserts inferred (late-arriving) members into a dimension for natural keys that a dependent pipeline looks up but that are not present yet.
+    An inferred member carries its natural key, the dummy values in all other columns and the flag inferred. The pipeline owning the dimension
+    overwrites it with the real attributes once they arrive (see resolve_inferred()), so its key stays valid for all rows referencing it.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        table (str): the dimension table, one of INFERRED_DIMENSIONS.
+        source_keys (DataFrame): the natural keys looked up by the dependent pipeline, with the column names of the dimension.
+        in_dwh (DataFrame): all rows of the dimension currently present in the DB, at least with the primary key and the natural key columns.
+
+    Returns:
+        in_dwh with the inserted inferred members (and the dummy row if it was inserted), ready for the lookup.
+    """
+    pk=INFERRED_DIMENSIONS[table]['pk']
+    key_columns=list(source_keys.columns)
+    dummy=DUMMY_ROWS[table]
+    #missing keys and keys equal to the dummy values point to the dummy row
+    source_keys=source_keys.dropna().drop_duplicates()
+    source_keys=source_keys[~(source_keys==pd.Series({column: dummy[column] for column in key_columns})).all(axis=1)]
+    left=pd.merge(source_keys, in_dwh[key_columns].drop_duplicates(), how='left', on=key_columns, indicator=True)
+    new_keys=left[left._merge=='left_only'].drop(columns=['_merge'])
+    if new_keys.empty:
+        return in_dwh
+    added=_insert_inferred(engine, table, new_keys, max(in_dwh[pk], default=0))
+    return dt.cast_keys(pd.concat([in_dwh]+[rows[[column for column in in_dwh.columns if column in rows.columns]] for rows in added], ignore_index=True))
+
+def infer_coded_members(engine, table, source_keys, source_codes, dim_codes):
+    """Version of infer_members() for the lookups on key codes (see key_dictionary.py): the natural keys of the dimension are not loaded, only their codes.
+    The inferred members are inserted with the code of their natural key.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        table (str): the dimension table, one of INFERRED_DIMENSIONS and of kd.DIMENSION_CODES.
+        source_keys (Series): the natural keys looked up by the dependent pipeline.
+        source_codes (array): the codes of source_keys.
+        dim_codes (DataFrame): primary keys and codes of the rows of the dimension, from kd.load_codes().
+
+    Returns:
+        dim_codes with the inserted inferred members (and the dummy row if it was inserted, with code -1), ready for the lookup.
+    """
+    namespace, key_column, code_column, pk=kd.DIMENSION_CODES[table]
+    new=~kd.contains(source_codes, dim_codes[code_column].to_numpy()) & (source_codes>=0)
+    new_keys=pd.DataFrame({key_column: np.asarray(source_keys, dtype=object)[new], code_column: source_codes[new]}).drop_duplicates(subset=[code_column])
+    #keys equal to the dummy value point to the dummy row
+    new_keys=new_keys[new_keys[key_column]!=DUMMY_ROWS[table][key_column]]
+    if new_keys.empty:
+        return dim_codes
+    added=_insert_inferred(engine, table, new_keys, max(dim_codes[pk], default=0))
+    added=pd.concat([rows.reindex(columns=dim_codes.columns) for rows in added], ignore_index=True).fillna({code_column: -1})
+    return dt.cast_keys(pd.concat([dim_codes, added], ignore_index=True).astype({code_column: 'int64'}))
+
+def _insert_inferred(engine, table, new_keys, max_pk):
+    """Inserts inferred members for new natural keys, numbered after the highest primary key in the DB, and the dummy row of the table if it is missing.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        table (str): the dimension table, one of INFERRED_DIMENSIONS.
+        new_keys (DataFrame): the natural keys not present in the dimension, optionally with further columns like their code.
+        max_pk (int): the highest primary key in the dimension.
+
+    Returns:
+        List of the inserted DataFrames: the dummy row if it was inserted and the inferred members.
+    """
+    pk=INFERRED_DIMENSIONS[table]['pk']
+    dummy=DUMMY_ROWS[table]
+    added=[pd.DataFrame([dummy])] if ensure_dummy_rows(engine, table) else []
+    inferred=new_keys.assign(**{column: value for column, value in dummy.items() if column not in new_keys.columns}, inferred=True)
+    inferred[pk]=list(range(max_pk+1, max_pk+1+len(inferred.index)))
+    db.insert_to_database(engine, inferred, table)
+    print('{}: {} inferred members inserted'.format(table, len(inferred.index)))
+    return added+[inferred]
+
+def ensure_dummy_rows(engine, table):
+    """Inserts the dummy row with key 0 of a table, and the dummy rows it references, unless they are present already.
+    Needed when a dependent pipeline inserts inferred members before the pipeline owning the table ran.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        table (str): one of DUMMY_ROWS.
+
+    Returns:
+        True if the dummy row of the table was inserted, False if it was present.
+    """
+    for referenced in DUMMY_REFERENCES.get(table, []):
+        ensure_dummy_rows(engine, referenced)
+    key=next(iter(DUMMY_ROWS[table]))
+    if db.load_df_from_query(engine, 'select count(*) as row_count from public.{} where {}=0'.format(table, key)).row_count[0]>0:
+        return False
+    db.insert_to_database(engine, pd.DataFrame([DUMMY_ROWS[table]]), table)
+    return True
+
+def known_members(in_dwh):
+    """Removes the inferred members from the rows of a dimension, so that the pipeline owning the dimension treats them like missing rows.
+
+    Args:
+        in_dwh (DataFrame): rows of the dimension currently present in the DB.
+
+    Returns:
+        DataFrame of the rows that are not inferred, without the column inferred.
+    """
+    if 'inferred' not in in_dwh.columns:
+        return in_dwh
+    return in_dwh[~in_dwh.inferred.astype(bool)].drop(columns=['inferred'])
+
+def resolve_inferred(delta, in_dwh, table):
+    """Splits the delta of the pipeline owning a dimension into rows to insert and real attributes of inferred members to update.
+    A delta row whose natural key matches an inferred member takes over its key. The remaining rows are numbered after the highest key in the DB,
+    and the dummy row is dropped if it is present already.
+
+    Args:
+        delta (DataFrame): delta rows of the dimension, found against known_members(in_dwh).
+        in_dwh (DataFrame): all rows of the dimension currently present in the DB, including the inferred members.
+        table (str): the dimension table, one of INFERRED_DIMENSIONS.
+
+    Returns:
+        DataFrame of the rows to insert.
+        DataFrame of the rows to update, with the key of the inferred member.
+    """
+    pk=INFERRED_DIMENSIONS[table]['pk']
+    dummy=DUMMY_ROWS[table]
+    inferred=in_dwh[in_dwh.inferred.astype(bool)] if 'inferred' in in_dwh.columns else in_dwh.iloc[0:0]
+    matched=pd.Series(pd.NA, index=delta.index, dtype='Int64')
+    for key_columns in INFERRED_DIMENSIONS[table]['keys']:
+        #inferred members with dummy values in these key columns were created from another natural key
+        candidates=inferred[~(inferred[key_columns]==pd.Series({column: dummy[column] for column in key_columns})).all(axis=1)][key_columns+[pk]].drop_duplicates(subset=key_columns)
+        rows=pd.merge(delta[key_columns].rename_axis('delta_row').reset_index(), candidates, how='inner', on=key_columns).set_index('delta_row')[pk]
+        matched=matched.fillna(rows.reindex(matched.index).astype('Int64'))
+    #each inferred member is updated by one real row at most
+    matched[matched.duplicated() & matched.notna()]=pd.NA
+    updates=delta[matched.notna()].assign(**{pk: matched[matched.notna()]})
+    inserts=delta[matched.isna()].copy()
+    if (in_dwh[pk]==0).any():
+        inserts=inserts[inserts[pk]!=0]
+    numbered=inserts[pk]!=0
+    max_pk=max(in_dwh[pk], default=0)
+    inserts.loc[numbered, pk]=list(range(max_pk+1, max_pk+1+int(numbered.sum())))
+    return dt.cast_keys(inserts), dt.cast_keys(updates)
+
+def update_members(engine, table, updates):
+    """Overwrites inferred members with the real attributes from resolve_inferred() and clears their flag inferred.
+    In the same transaction the tables derived from the dimension are refreshed, see DERIVED_REFRESH.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        table (str): the dimension table, one of INFERRED_DIMENSIONS.
+        updates (DataFrame): the rows to update, with the key of the inferred member.
+    """
+    if updates.empty:
+        return
+    pk=INFERRED_DIMENSIONS[table]['pk']
+    columns=[column for column in updates.columns if column!=pk]
+    #the code of the natural key may change with it, it is encoded again by the next kd.load_codes()
+    if table in kd.DIMENSION_CODES and kd.DIMENSION_CODES[table][2] not in columns:
+        columns_sql=', '.join(['{0}=:{0}'.format(column) for column in columns]+['{}=NULL'.format(kd.DIMENSION_CODES[table][2])])
+    else:
+        columns_sql=', '.join('{0}=:{0}'.format(column) for column in columns)
+    statement='UPDATE public.{} SET {}, inferred=false WHERE {}=:{}'.format(table, columns_sql, pk, pk)
+    #plain Python values, as the DB driver cannot adapt numpy scalars and pd.NA
+    records=updates.astype(object).where(updates.notna(), None).to_dict('records')
+    pks=updates[pk].astype(int).to_list()
+    #an empty rollup is filled from all facts by the next Fact ETL
+    refresh=DERIVED_REFRESH.get(table, [])+(PAPER_ROLLUP_REFRESH if table=='dim_paragraph' and not agg_ent.is_rollup_empty(engine, 'aggregation_paper_entity') else [])
+    with engine.begin() as conn:
+        papers=[row[0] for row in conn.execute(text('SELECT DISTINCT paper_pk FROM dim_paragraph WHERE paragraph_pk=ANY(:pks)'), {'pks': pks})] if table=='dim_paragraph' else []
+        conn.execute(text(statement), records)
+        papers=sorted(set(papers+(updates.paper_pk.dropna().astype(int).to_list() if 'paper_pk' in updates.columns else [])))
+        for refresh_statement in refresh:
+            conn.execute(text(refresh_statement), {'pks': pks, 'papers': papers})
+    print('{}: {} inferred members resolved'.format(table, len(records)))
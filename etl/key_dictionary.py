@@ -0,0 +1,124 @@
+import etl.database as db
+import numpy as np
+import pandas as pd
+
+#dimensions that store the code of their natural key, with the key namespace, the natural key column, the code column and the primary key
+DIMENSION_CODES={
+    'dim_paper': ('citekey', 'citekey', 'citekey_code', 'paper_pk'),
+    'dim_paragraph': ('paragraph', 'para_source_id', 'para_code', 'paragraph_pk'),
+    'dim_sentence': ('sentence', 'sentence_source_id', 'sentence_code', 'sentence_pk'),
+    'dim_entity': ('entity', 'entity_name', 'entity_code', 'entity_pk')
+}
+
+#dictionaries already loaded in this process, per namespace a pd.Index of the source keys in the order of their codes (code = position)
+_dictionaries={}
+
+
+def load_dictionary(engine, namespace):
+    """Loads the dictionary of a key namespace (e.g. 'sentence') from the table map_source_key, unless it is already loaded.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        namespace (str): the key namespace.
+
+    Returns:
+        pd.Index of the source keys, the position of a key is its code.
+    """
+    if namespace not in _dictionaries:
+        keys=db.load_df_from_query(engine, "select source_key from map_source_key where namespace='{}' order by key_code".format(namespace))
+        _dictionaries[namespace]=pd.Index(keys.source_key, dtype=object)
+    return _dictionaries[namespace]
+
+def encode(engine, namespace, keys):
+    """Encodes VARCHAR source keys to dense integer codes. Keys that are not in the dictionary yet get the next free codes, which are persisted in map_source_key.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        namespace (str): the key namespace, keys of different namespaces get independent codes.
+        keys (Series): the source keys to encode.
+
+    Returns:
+        numpy array of codes, -1 for missing keys (NaN).
+
+    Raises:
+        The error of the DB if the new codes cannot be written, the dictionary of the process is then left unchanged.
+    """
+    dictionary=load_dictionary(engine, namespace)
+    keys=pd.Series(keys, dtype=object).reset_index(drop=True)
+    codes=dictionary.get_indexer(keys)
+    unknown=codes==-1
+    new_keys=pd.Index(keys[unknown].dropna().unique(), dtype=object)
+    if len(new_keys):
+        new_rows=pd.DataFrame({'namespace': namespace, 'key_code': np.arange(len(dictionary), len(dictionary)+len(new_keys)), 'source_key': new_keys})
+        #the codes are only added to the dictionary of the process once they are committed, so both stay in sync
+        connection=engine.raw_connection()
+        try:
+            db.copy_into_table(connection, new_rows, 'map_source_key')
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        dictionary=_dictionaries[namespace]=dictionary.append(new_keys)
+        codes[unknown]=dictionary.get_indexer(keys[unknown])
+    return codes
+
+def load_codes(engine, table, columns=[]):
+    """Loads the primary keys and the codes of the natural keys of a dimension from its code column, so the natural keys are neither read nor encoded again.
+    Rows without a code yet (rows inserted without it, e.g. by an earlier version or with a changed natural key) are encoded once and their codes are written to the table.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        table (str): one of DIMENSION_CODES.
+        columns (list): further columns of the dimension to load.
+
+    Returns:
+        DataFrame with the primary key, the further columns and the code column.
+    """
+    namespace, key_column, code_column, pk_column=DIMENSION_CODES[table]
+    dim=db.load_df_from_query(engine, 'select {} from {} order by {}'.format(', '.join([pk_column]+columns+[code_column]), table, pk_column))
+    if dim[code_column].isna().any():
+        missing=db.load_df_from_query(engine, 'select {}, {} from {} where {} is null'.format(pk_column, key_column, table, code_column))
+        missing[code_column]=encode(engine, namespace, missing[key_column])
+        db.update_by_key(engine, missing[[pk_column, code_column]], table, pk_column)
+        print('{}: codes of {} rows stored'.format(table, len(missing.index)))
+        dim[code_column]=dim[pk_column].map(missing.set_index(pk_column)[code_column]).fillna(dim[code_column])
+    return dim.astype({code_column: 'int64'})
+
+def nullable(codes):
+    """Converts codes to a nullable integer array for a code column of a dimension, with <NA> for missing keys (-1)."""
+    return pd.arrays.IntegerArray(np.asarray(codes, dtype=np.int64), mask=np.asarray(codes)<0)
+
+def lookup(source_codes, dim_codes, dim_values):
+    """Looks up a value (usually a primary key) for encoded source keys by direct indexing into an array over all codes.
+    If a code occurs more than once in the dimension, the last value wins.
+
+    Args:
+        source_codes (array): codes of the source keys to look up.
+        dim_codes (array): codes of the natural keys of the dimension.
+        dim_values (Series): the values of the dimension rows, in the same order as dim_codes.
+
+    Returns:
+        pd.array of nullable 32 bit integers, <NA> where the source key is not present in the dimension.
+    """
+    table=np.full(max(np.max(source_codes, initial=-1), np.max(dim_codes, initial=-1))+2, -1, dtype=np.int64)
+    valid=dim_codes>=0
+    table[dim_codes[valid]]=np.asarray(dim_values, dtype=np.int64)[valid]
+    #code -1 (missing key) points to the last element, which is never set
+    values=table[source_codes]
+    return pd.arrays.IntegerArray(values.astype(np.int32), mask=values<0)
+
+def contains(source_codes, dim_codes):
+    """Checks for encoded source keys whether they are present in a dimension.
+
+    Args:
+        source_codes (array): codes of the source keys.
+        dim_codes (array): codes of the natural keys of the dimension.
+
+    Returns:
+        Boolean numpy array, True where the source key is present in the dimension.
+    """
+    seen=np.zeros(max(np.max(source_codes, initial=-1), np.max(dim_codes, initial=-1))+2, dtype=bool)
+    seen[dim_codes[dim_codes>=0]]=True
+    return seen[source_codes] & (source_codes>=0)
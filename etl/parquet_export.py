@@ -0,0 +1,160 @@
+import etl.database as db
+import etl.fact_entity_detection as fact
+import etl.inferred_members as im
+import json
+import numpy as np
+import os
+import pandas as pd
+import shutil
+from urllib.parse import quote
+from variables import exportpath, fact_partition_size
+
+#tables exported by their primary key (or group key) watermark: new rows are appended as new files, the tables are append-only
+WATERMARK_TABLES={
+    'dim_keyword': 'keyword_pk',
+    'dim_author': 'author_pk',
+    'dim_journal': 'journal_pk',
+    'dim_keywordgroup': 'keywordgroup_pk',
+    'bridge_paper_keyword': 'keywordgroup_pk',
+    'dim_authorgroup': 'authorgroup_pk',
+    'bridge_paper_author': 'authorgroup_pk',
+    'dim_paper': 'paper_pk',
+    'dim_paragraph': 'paragraph_pk',
+    'dim_citationgroup': 'citationgroup_pk',
+    'bridge_sentence_citation': 'citationgroup_pk',
+    'dim_sentence': 'sentence_pk',
+    'dim_entity': 'entity_pk'
+}
+#small tables that are rewritten completely: the rows of aggregation_paper are replaced by every Aggregation Paper ETL run, the entity rollups are updated in place by the Fact ETL
+REWRITE_TABLES=['map_entity_hierarchy', 'aggregation_paper', 'aggregation_entity_hierarchy', 'aggregation_paper_entity']
+#hive partition column of the exported tables, tables not listed here are written unpartitioned
+PARTITION_COLUMNS={
+    'dim_paper': 'publication_year',
+    'aggregation_paper': 'publication_year',
+    'dim_entity': 'entity_label',
+    'fact_by_paper': 'entity_label'
+}
+#the denormalized view of all facts with their entity, sentence, paragraph and paper
+FACT_BY_PAPER_QUERY='select dpa.paper_pk, dpa.year, dpa.citekey, dpa.title, dp.paragraph_pk, dp.heading, dp.paragraph_type, ds.sentence_pk, ds.sentence_type, ds.sentence_string, de.entity_pk, de.entity_label, de.entity_name, fed.entity_count from fact_entity_detection fed inner join dim_entity de on fed.entity_pk=de.entity_pk inner join dim_sentence ds on fed.sentence_pk=ds.sentence_pk inner join dim_paragraph dp on ds.paragraph_pk=dp.paragraph_pk inner join dim_paper dpa on dp.paper_pk=dpa.paper_pk where fed.sentence_pk >= {} and fed.sentence_pk < {}'
+STATE_FILE='_export_state.json'
+COMPRESSION='zstd'
+
+
+def export_warehouse(engine):
+    """Exports the warehouse tables and the denormalized view fact_by_paper to compressed, hive partitioned Parquet files in the exportpath.
+    Append-only tables are exported incrementally from the watermark of the last export, fact_entity_detection and fact_by_paper per range partition
+    that was loaded since the last export. Files with inferred members that were resolved since are written again.
+    The export state is kept next to the files, so deleting the folder triggers a full export.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+
+    Returns:
+        Dict of exported table name and number of exported rows.
+    """
+    state=_load_state()
+    exported={}
+    for table, key_column in WATERMARK_TABLES.items():
+        #files with inferred members that were resolved since the last export are written again, as their rows were updated in place
+        exported[table]=_rewrite_resolved(engine, table, key_column, state) if table in im.INFERRED_DIMENSIONS else 0
+        watermark=state['watermarks'].get(table, -1)
+        new_rows=_with_partition_column(table, db.load_df_from_query(engine, 'select * from {} where {} > {}'.format(table, key_column, watermark)))
+        if not new_rows.empty:
+            high_water_mark=int(new_rows[key_column].max())
+            _write_table(table, new_rows, 'part-{}-{}'.format(watermark+1, high_water_mark))
+            state['watermarks'][table]=high_water_mark
+        exported[table]+=len(new_rows.index)
+    for table in REWRITE_TABLES:
+        rows=_with_partition_column(table, db.load_full_table(engine, table))
+        shutil.rmtree(os.path.join(exportpath, table), ignore_errors=True)
+        _write_table(table, rows, 'part-0')
+        exported[table]=len(rows.index)
+    #a partition is exported again whenever the Fact ETL loaded new rows into it
+    partitions=db.load_df_from_query(engine, 'select partition_no, loaded_at::text as loaded_at from fact_partition_log')
+    exported['fact_entity_detection']=exported['fact_by_paper']=0
+    for partition in partitions.itertuples():
+        if state['fact_partitions'].get(str(partition.partition_no))==partition.loaded_at:
+            continue
+        facts=fact.load_fact_partition(engine, partition.partition_no)
+        facts_by_paper=_with_partition_column('fact_by_paper', db.load_df_from_query(engine, FACT_BY_PAPER_QUERY.format(partition.partition_no*fact_partition_size, (partition.partition_no+1)*fact_partition_size)))
+        basename='part-p{}'.format(partition.partition_no)
+        _remove_files('fact_entity_detection', basename)
+        _remove_files('fact_by_paper', basename)
+        _write_table('fact_entity_detection', facts, basename)
+        _write_table('fact_by_paper', facts_by_paper, basename)
+        state['fact_partitions'][str(partition.partition_no)]=partition.loaded_at
+        exported['fact_entity_detection']+=len(facts.index)
+        exported['fact_by_paper']+=len(facts_by_paper.index)
+    _save_state(state)
+    return exported
+
+def _rewrite_resolved(engine, table, key_column, state):
+    """Writes the files of a dimension again that contain inferred members which were resolved since the last export, and records the inferred members exported now.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        table (str): the dimension table, one of im.INFERRED_DIMENSIONS.
+        key_column (str): the primary key of the table.
+        state (dict): the export state, its entry inferred is updated.
+
+    Returns:
+        Number of rows written again.
+    """
+    inferred=db.load_df_from_query(engine, 'select {} from {} where inferred'.format(key_column, table))[key_column].astype('int64').to_list()
+    resolved=np.setdiff1d(state['inferred'].get(table, []), inferred)
+    state['inferred'][table]=sorted(inferred)
+    rewritten=0
+    if resolved.size==0:
+        return rewritten
+    #the files are named by the key range of the rows they were written with, see export_warehouse()
+    basenames={filename[:-len('.parquet')] for _, _, filenames in os.walk(os.path.join(exportpath, table)) for filename in filenames if filename.endswith('.parquet')}
+    for basename in sorted(basenames):
+        first, last=(int(bound) for bound in basename[len('part-'):].split('-'))
+        if ((resolved>=first) & (resolved<=last)).any():
+            rows=_with_partition_column(table, db.load_df_from_query(engine, 'select * from {} where {} between {} and {}'.format(table, key_column, first, last)))
+            _remove_files(table, basename)
+            _write_table(table, rows, basename)
+            rewritten+=len(rows.index)
+    return rewritten
+
+def _with_partition_column(table, df):
+    """Adds the derived partition column publication_year (from the DATE column year) where the table is partitioned by it."""
+    if PARTITION_COLUMNS.get(table)=='publication_year':
+        df['publication_year']=pd.to_datetime(df['year']).dt.year
+    return df
+
+def _write_table(table, df, basename):
+    """Writes rows of an exported table to one Parquet file per value of its partition column, in hive layout (column=value folders).
+
+    Args:
+        table (str): name of the exported table, also the name of its folder.
+        df (DataFrame): the rows to write.
+        basename (str): name of the files without extension, must be unique within a partition folder.
+    """
+    partition_column=PARTITION_COLUMNS.get(table)
+    groups=df.groupby(partition_column, observed=True, sort=False) if partition_column else [(None, df)]
+    for value, rows in groups:
+        folder=os.path.join(exportpath, table) if partition_column is None else os.path.join(exportpath, table, '{}={}'.format(partition_column, quote(str(value), safe='')))
+        os.makedirs(folder, exist_ok=True)
+        rows=rows if partition_column is None else rows.drop(columns=[partition_column])
+        rows.to_parquet(os.path.join(folder, basename+'.parquet'), compression=COMPRESSION, index=False)
+
+def _remove_files(table, basename):
+    """Removes the files of an earlier export with the given basename from all partition folders of a table."""
+    for folder, _, filenames in os.walk(os.path.join(exportpath, table)):
+        if basename+'.parquet' in filenames:
+            os.remove(os.path.join(folder, basename+'.parquet'))
+
+def _load_state():
+    """Loads the watermarks, exported fact partitions and exported inferred members of the last export, empty if there was none."""
+    path=os.path.join(exportpath, STATE_FILE)
+    if not os.path.exists(path):
+        return {'watermarks': {}, 'fact_partitions': {}, 'inferred': {}}
+    with open(path) as file:
+        return {'inferred': {}, **json.load(file)}
+
+def _save_state(state):
+    """Saves the export state after all files were written."""
+    os.makedirs(exportpath, exist_ok=True)
+    with open(os.path.join(exportpath, STATE_FILE), 'w') as file:
+        json.dump(state, file, indent=2)
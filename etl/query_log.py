@@ -0,0 +1,144 @@
+from contextlib import contextmanager
+from sqlalchemy import event, text
+import os
+import pandas as pd
+import threading
+import time
+from variables import querylogpath
+
+#reads that take at least this long get their query plan captured in explain mode
+EXPLAIN_MIN_SECONDS=1.0
+#number of slowest calls and statements listed in the report
+REPORTED_QUERIES=20
+#statements are shortened to this length in the report
+STATEMENT_LENGTH=200
+
+#state of the instrumentation: whether an engine is instrumented, whether plans are captured and the pipeline step the queries are attributed to
+_settings={'enabled': False, 'explain': False, 'step': None}
+#calls of the DB functions, SQL statements and query plans recorded since the last report
+_calls=[]
+_statements=[]
+_plans=[]
+_lock=threading.Lock()
+#the DB function that is currently running in a thread, statements are attributed to it
+_current=threading.local()
+
+
+def instrument_engine(engine, explain=False):
+    """Registers event listeners on the engine that record the duration and row count of every SQL statement, and enables recording the calls of
+    load_full_table(), load_df_from_query() and insert_to_database() with their rows and bytes.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+        explain (bool): also capture EXPLAIN (ANALYZE, BUFFERS) for reads that take at least EXPLAIN_MIN_SECONDS. The plan is captured by running the query again.
+    """
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    _settings.update({'enabled': True, 'explain': explain})
+
+def set_step(step):
+    """Sets the pipeline step the following queries are attributed to."""
+    _settings['step']=step
+
+@contextmanager
+def record_call(function, statement):
+    """Records the duration of a call of a DB function. The caller stores the DataFrame it read or wrote as call['data']. The bytes are those sent over the wire
+    as reported by add_bytes() (e.g. by the COPY paths), otherwise the in-memory size of the DataFrame without the content of strings.
+
+    Args:
+        function (str): name of the DB function.
+        statement (str): the query or table name.
+
+    Yields:
+        Dict to store data and bytes of the call.
+    """
+    call={'data': None, 'bytes': None}
+    outer=getattr(_current, 'function', None), getattr(_current, 'call', None)
+    _current.function, _current.call=function, call
+    start=time.perf_counter()
+    try:
+        yield call
+    finally:
+        _current.function, _current.call=outer
+        if _settings['enabled']:
+            data=call['data']
+            rows=None if data is None else len(data.index)
+            size=call['bytes'] if call['bytes'] is not None or data is None else int(data.memory_usage(index=True).sum())
+            with _lock:
+                _calls.append({'step': _settings['step'], 'function': function, 'statement': _shorten(statement), 'seconds': time.perf_counter()-start, 'rows': rows, 'bytes': size})
+
+def log_statement(statement, seconds, rows):
+    """Records a statement executed on a raw DBAPI connection, e.g. COPY, where the event listeners of the engine do not fire."""
+    if _settings['enabled']:
+        with _lock:
+            _statements.append({'step': _settings['step'], 'function': getattr(_current, 'function', None), 'statement': _shorten(statement), 'seconds': seconds, 'rows': rows})
+
+def add_bytes(size):
+    """Adds bytes sent over the wire to the call of a DB function that is currently running in this thread, if any."""
+    call=getattr(_current, 'call', None)
+    if call is not None:
+        call['bytes']=(call['bytes'] or 0)+size
+
+def capture_plan(engine, querystring, seconds):
+    """Captures EXPLAIN (ANALYZE, BUFFERS) of a read that took at least EXPLAIN_MIN_SECONDS, if explain mode is on.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+        querystring (str): the SELECT statement that was read.
+        seconds (float): the duration of the read.
+    """
+    if not _settings['explain'] or seconds<EXPLAIN_MIN_SECONDS:
+        return
+    outer=getattr(_current, 'function', None)
+    _current.function='explain'
+    try:
+        with engine.connect() as conn:
+            plan=[row[0] for row in conn.execute(text('EXPLAIN (ANALYZE, BUFFERS) {}'.format(querystring)))]
+    finally:
+        _current.function=outer
+    with _lock:
+        _plans.append({'step': _settings['step'], 'statement': querystring, 'seconds': seconds, 'plan': plan})
+
+def write_report(run_id):
+    """Writes the recorded calls, the slowest statements and the captured query plans of a run to a text file in the querylogpath and clears them.
+
+    Args:
+        run_id (str): the id of the run, used as file name.
+
+    Returns:
+        The path of the report, None if no engine is instrumented.
+    """
+    if not _settings['enabled']:
+        return None
+    with _lock:
+        calls, statements, plans=pd.DataFrame(_calls, columns=['step', 'function', 'statement', 'seconds', 'rows', 'bytes']), pd.DataFrame(_statements, columns=['step', 'function', 'statement', 'seconds', 'rows']), list(_plans)
+        _calls.clear()
+        _statements.clear()
+        _plans.clear()
+    summary=calls.groupby(['step', 'function'], dropna=False).agg(calls=('seconds', 'size'), seconds=('seconds', 'sum'), rows=('rows', 'sum'), mb=('bytes', lambda b: b.sum()/2**20)).round(2).reset_index()
+    sections=[
+        ('Calls by step and function', summary),
+        ('Slowest calls', calls.nlargest(REPORTED_QUERIES, 'seconds').round({'seconds': 3})),
+        ('Slowest statements ({} in total)'.format(len(statements.index)), statements.nlargest(REPORTED_QUERIES, 'seconds').round({'seconds': 3}))]
+    os.makedirs(querylogpath, exist_ok=True)
+    path=os.path.join(querylogpath, '{}.txt'.format(run_id))
+    with open(path, 'w') as file:
+        for title, df in sections:
+            file.write('{}\n{}\n\n'.format(title, df.to_string(index=False) if not df.empty else '-'))
+        for plan in plans:
+            file.write('Query plan ({}, {:.2f}s): {}\n{}\n\n'.format(plan['step'], plan['seconds'], plan['statement'], '\n'.join(plan['plan'])))
+    return path
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Event listener, remembers the start of a statement on the connection."""
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Event listener, records duration and row count of a statement."""
+    seconds=time.perf_counter()-conn.info['query_start'].pop()
+    log_statement(statement, seconds, cursor.rowcount)
+
+def _shorten(statement):
+    """Collapses whitespace and shortens a statement for the report."""
+    statement=' '.join(str(statement).split())
+    return statement if len(statement)<=STATEMENT_LENGTH else statement[:STATEMENT_LENGTH-3]+'...'
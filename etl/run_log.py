@@ -0,0 +1,143 @@
+import etl.database as db
+import hashlib
+import json
+import os
+from datetime import datetime
+from variables import sourcepaths
+
+#source files each pipeline consumes, DB tables it depends on and DB tables it writes
+PIPELINE_INPUTS={
+    'Keyword ETL': {'files': ['keywords.csv'], 'upstream': [], 'targets': ['dim_keyword']},
+    'Author ETL': {'files': ['authors.csv', 'unique_references.csv'], 'upstream': [], 'targets': ['dim_author', 'map_author_merge']},
+    'Journal ETL': {'files': ['papers_final.csv', 'unique_references.csv'], 'upstream': [], 'targets': ['dim_journal']},
+    'Paper ETL': {'files': ['papers_final.csv', 'unique_references.csv', 'keywords.csv', 'authors.csv'], 'upstream': ['dim_keyword', 'dim_author', 'map_author_merge', 'dim_journal'], 'targets': ['dim_keywordgroup', 'bridge_paper_keyword', 'dim_authorgroup', 'bridge_paper_author', 'dim_paper']},
+    'Paragraph ETL': {'files': ['paragraphs.csv'], 'upstream': ['dim_paper'], 'targets': ['dim_paragraph']},
+    'Sentence ETL': {'files': ['sentences.csv', 'citations.csv'], 'upstream': ['dim_paper', 'dim_paragraph'], 'targets': ['dim_citationgroup', 'bridge_sentence_citation', 'dim_sentence']},
+    'Entity ETL': {'files': ['entities.csv'], 'upstream': [], 'targets': ['dim_entity', 'map_entity_hierarchy']},
+    'Fact ETL': {'files': ['entities.csv'], 'upstream': ['dim_sentence', 'dim_entity', 'map_entity_hierarchy'], 'targets': ['fact_entity_detection', 'aggregation_entity_hierarchy', 'aggregation_paper_entity']},
+    'Aggregation Paper ETL': {'files': [], 'upstream': ['fact_entity_detection', 'dim_entity', 'dim_sentence', 'dim_paragraph', 'dim_paper'], 'targets': ['aggregation_paper']}
+}
+
+#cheap queries that change whenever rows are appended to a table. The warehouse tables are append-only with increasing keys, so their highest key is answered from the primary key index
+TABLE_FINGERPRINT_QUERIES={
+    #inferred members are resolved in place, so the dimensions that have them also count their inferred rows
+    'dim_keyword': "select max(keyword_pk)||'/'||count(*) filter (where inferred) from dim_keyword",
+    'dim_author': "select max(author_pk)||'/'||count(*) filter (where inferred) from dim_author",
+    'map_author_merge': 'select count(*) from map_author_merge',
+    'dim_journal': "select max(journal_pk)||'/'||count(*) filter (where inferred) from dim_journal",
+    'dim_keywordgroup': 'select max(keywordgroup_pk) from dim_keywordgroup',
+    'bridge_paper_keyword': 'select max(keywordgroup_pk) from bridge_paper_keyword',
+    'dim_authorgroup': 'select max(authorgroup_pk) from dim_authorgroup',
+    'bridge_paper_author': 'select max(authorgroup_pk) from bridge_paper_author',
+    'dim_paper': "select max(paper_pk)||'/'||count(*) filter (where inferred) from dim_paper",
+    'dim_paragraph': "select max(paragraph_pk)||'/'||count(*) filter (where inferred) from dim_paragraph",
+    'dim_citationgroup': 'select max(citationgroup_pk) from dim_citationgroup',
+    'bridge_sentence_citation': 'select max(citationgroup_pk) from bridge_sentence_citation',
+    'dim_sentence': 'select max(sentence_pk) from dim_sentence',
+    'dim_entity': 'select max(entity_pk) from dim_entity',
+    'map_entity_hierarchy': 'select max(child_entity_pk) from map_entity_hierarchy',
+    #new facts can also belong to old sentences, so the time of the last partition load is used
+    'fact_entity_detection': 'select max(loaded_at)::text from fact_partition_log',
+    'aggregation_paper': 'select count(*) from aggregation_paper',
+    #the rollups are updated in place, their totals change with every upsert
+    'aggregation_entity_hierarchy': 'select sum(fact_count) from aggregation_entity_hierarchy',
+    'aggregation_paper_entity': 'select sum(fact_count) from aggregation_paper_entity'
+}
+#number of bytes read from the start and from the end of a source file for its fingerprint
+SAMPLE_BYTES=1024*1024
+
+
+def file_fingerprint(filename):
+    """Calculates a fingerprint of a source file from its size, modification time and the content of its first and last megabyte, in every folder of the sourcepaths.
+    Reading the whole file would take seconds for the large CauseMiner outputs, the sample detects every rewrite of the file in practice.
+
+    Args:
+        filename (str): the name of the file in the sourcepaths.
+
+    Returns:
+        Hex digest of the fingerprint, 'MISSING' if the file does not exist in any of the folders.
+    """
+    paths=[os.path.join(folder, filename) for folder in sourcepaths if os.path.exists(os.path.join(folder, filename))]
+    if not paths:
+        return 'MISSING'
+    digest=hashlib.blake2b(digest_size=16)
+    for path in paths:
+        stat=os.stat(path)
+        digest.update('{}:{}'.format(stat.st_size, stat.st_mtime_ns).encode())
+        with open(path, 'rb') as file:
+            digest.update(file.read(SAMPLE_BYTES))
+            if stat.st_size>SAMPLE_BYTES:
+                file.seek(max(SAMPLE_BYTES, stat.st_size-SAMPLE_BYTES))
+                digest.update(file.read(SAMPLE_BYTES))
+    return digest.hexdigest()
+
+def table_fingerprint(engine, table):
+    """Calculates a fingerprint of a DB table with the query from TABLE_FINGERPRINT_QUERIES.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        table (str): name of the table.
+
+    Returns:
+        The result of the query as string.
+    """
+    return str(db.load_df_from_query(engine, TABLE_FINGERPRINT_QUERIES[table]).iloc[0, 0])
+
+def input_fingerprints(engine, pipeline):
+    """Calculates the fingerprints of the source files and upstream tables of a pipeline.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        pipeline (str): name of the pipeline, e.g. 'Journal ETL'.
+
+    Returns:
+        Tuple of the source fingerprint and the upstream fingerprint, both as JSON strings.
+    """
+    inputs=PIPELINE_INPUTS[pipeline]
+    source=json.dumps({filename: file_fingerprint(filename) for filename in inputs['files']}, sort_keys=True)
+    upstream=json.dumps({table: table_fingerprint(engine, table) for table in inputs['upstream']}, sort_keys=True)
+    return source, upstream
+
+def target_fingerprint(engine, pipeline):
+    """Calculates the fingerprint of the tables a pipeline writes, so that changes to them by anything else than the pipeline itself are detected.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        pipeline (str): name of the pipeline, e.g. 'Journal ETL'.
+
+    Returns:
+        The fingerprint as JSON string.
+    """
+    return json.dumps({table: table_fingerprint(engine, table) for table in PIPELINE_INPUTS[pipeline]['targets']}, sort_keys=True)
+
+def is_unchanged(engine, pipeline, source, upstream):
+    """Checks whether the inputs and targets of a pipeline are unchanged since its last successful run.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        pipeline (str): name of the pipeline, e.g. 'Journal ETL'.
+        source (str): current source fingerprint from input_fingerprints().
+        upstream (str): current upstream fingerprint from input_fingerprints().
+
+    Returns:
+        True if the pipeline has nothing to do, otherwise False.
+    """
+    last_run=db.load_df_from_query(engine, "select source_fingerprint, upstream_fingerprint, target_fingerprint from etl_run where pipeline='{}' and status='success' order by finished_at desc limit 1".format(pipeline))
+    if last_run.empty:
+        return False
+    return last_run.source_fingerprint[0]==source and last_run.upstream_fingerprint[0]==upstream and last_run.target_fingerprint[0]==target_fingerprint(engine, pipeline)
+
+def log_run(engine, run_id, pipeline, source, upstream, status, started_at):
+    """Records a finished pipeline run in the table etl_run.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+        run_id (str): id of the current run.
+        pipeline (str): name of the pipeline, e.g. 'Journal ETL'.
+        source (str): the source fingerprint of the consumed files.
+        upstream (str): the upstream fingerprint of the consumed tables.
+        status (str): 'success' or 'skipped'.
+        started_at (datetime): start time of the run.
+    """
+    db.execute_statement(engine, 'INSERT INTO etl_run (run_id, pipeline, status, source_fingerprint, upstream_fingerprint, target_fingerprint, started_at, finished_at) VALUES (:run_id, :pipeline, :status, :source, :upstream, :target, :started_at, :finished_at) ON CONFLICT (run_id, pipeline) DO UPDATE SET status=excluded.status, source_fingerprint=excluded.source_fingerprint, upstream_fingerprint=excluded.upstream_fingerprint, target_fingerprint=excluded.target_fingerprint, started_at=excluded.started_at, finished_at=excluded.finished_at',
+        {'run_id': run_id, 'pipeline': pipeline, 'status': status, 'source': source, 'upstream': upstream, 'target': target_fingerprint(engine, pipeline), 'started_at': started_at, 'finished_at': datetime.now()})
@@ -0,0 +1,52 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+#read-only data shared by all shards of a run, e.g. the encoded natural keys and primary keys of the dimensions. Set once per worker process by the pool initializer
+_shared={}
+
+
+def shard_ids(codes, shard_count):
+    """Assigns rows to shards by an encoded key, so that all rows with the same key (e.g. all sentences of a paragraph) end up in the same shard.
+
+    Args:
+        codes (array): integer codes of the shard key from the key dictionary, -1 for missing keys.
+        shard_count (int): number of shards.
+
+    Returns:
+        numpy array of the shard number of each row. Rows with a missing key are all in shard 0.
+    """
+    return np.where(codes>=0, codes%shard_count, 0)
+
+def reserve_pk_ranges(first_pk, sizes):
+    """Reserves a non-overlapping range of primary keys for each shard, in shard order, so that the shards can number their rows independently.
+
+    Args:
+        first_pk (int): the first free primary key, usually the highest primary key in the DB + 1.
+        sizes (list): the maximum number of rows each shard can produce.
+
+    Returns:
+        List of the first primary key of each shard.
+    """
+    return list(first_pk+np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(int))
+
+def run_shards(func, shards, shared):
+    """Runs a transformation on every shard in a process pool. The shared data is sent once to every worker process instead of once per shard.
+
+    Args:
+        func (function): module-level function that transforms one shard, it gets the arguments of the shard and reads the shared data with get_shared().
+        shards (list): tuples of arguments, one per shard.
+        shared (dict): the read-only data needed by all shards.
+
+    Returns:
+        List of the results of func, in the same order as shards.
+    """
+    with ProcessPoolExecutor(max_workers=len(shards), initializer=_set_shared, initargs=(shared,)) as pool:
+        return list(pool.map(func, *zip(*shards)))
+
+def get_shared(name):
+    """Returns an entry of the shared data within a shard transformation started by run_shards()."""
+    return _shared[name]
+
+def _set_shared(shared):
+    """Pool initializer, stores the shared data in the worker process."""
+    _shared.update(shared)
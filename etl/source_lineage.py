@@ -0,0 +1,96 @@
+import etl.database as db
+import pandas as pd
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+#source files whose rows are traced back to their result folder, with the lineage namespace and the column of their source key
+LINEAGE_KEYS={
+    'papers_final.csv': ('article', 'article_id'),
+    'unique_references.csv': ('citekey', 'citekey'),
+    'paragraphs.csv': ('paragraph', 'para_id'),
+    'sentences.csv': ('sentence', 'sentence_id'),
+    'entities.csv': ('entity', 'ent_id')
+}
+
+#source keys and their folder recorded since the last save, per namespace a DataFrame with the columns source_key and source_folder
+_recorded={}
+_lock=threading.Lock()
+#the source keys recorded within the open capture() blocks, so that a checkpointed stage can store the lineage of the files it parsed
+_captures=[]
+
+
+def record(filename, source_df):
+    """Records the result folder of every source key of a parsed source file. A key that occurs in several folders keeps the first folder of the sourcepaths.
+
+    Args:
+        filename (str): the name of the source file.
+        source_df (DataFrame): the unioned rows of the file with the additional column source_folder.
+    """
+    if filename not in LINEAGE_KEYS:
+        return
+    namespace, key_column=LINEAGE_KEYS[filename]
+    keys=source_df[[key_column, 'source_folder']].dropna().rename(columns={key_column: 'source_key'}).astype({'source_key': str})
+    with _lock:
+        for recorded in [_recorded]+_captures:
+            recorded[namespace]=pd.concat([recorded.get(namespace), keys]).drop_duplicates(subset=['source_key'])
+
+@contextmanager
+def capture():
+    """Collects the source keys recorded within the block, in addition to recording them for save_lineage().
+    A stage loaded from its checkpoint does not parse its source files again, so its checkpoint stores these keys and restore() records them again.
+
+    Yields:
+        Dict of namespace and DataFrame of the recorded source keys, complete when the block is left.
+    """
+    recorded={}
+    with _lock:
+        _captures.append(recorded)
+    try:
+        yield recorded
+    finally:
+        with _lock:
+            _captures.remove(recorded)
+
+def to_frame(recorded):
+    """Combines the source keys collected by capture() into one DataFrame, e.g. to checkpoint them.
+
+    Args:
+        recorded (dict): namespace and DataFrame of source keys, as yielded by capture().
+
+    Returns:
+        DataFrame with the columns namespace, source_key and source_folder.
+    """
+    return pd.concat([pd.DataFrame(columns=['namespace', 'source_key', 'source_folder'])]+[keys.assign(namespace=namespace) for namespace, keys in recorded.items()], ignore_index=True)[['namespace', 'source_key', 'source_folder']]
+
+def restore(keys):
+    """Records source keys again that were collected by capture(), e.g. from the checkpoint of a resumed stage.
+
+    Args:
+        keys (DataFrame): the source keys with the columns namespace, source_key and source_folder, see to_frame().
+    """
+    with _lock:
+        for namespace, namespace_keys in keys.groupby('namespace'):
+            _recorded[namespace]=pd.concat([_recorded.get(namespace), namespace_keys[['source_key', 'source_folder']]]).drop_duplicates(subset=['source_key'])
+
+def save_lineage(engine):
+    """Inserts the recorded source keys that are not yet present into the DB table map_source_lineage. Keys keep the folder they were first loaded from.
+
+    Args:
+        engine (SQLAlchemy engine): engine object to connect to the target DB.
+
+    Returns:
+        Dict of namespace and number of inserted source keys.
+    """
+    with _lock:
+        recorded=dict(_recorded)
+        _recorded.clear()
+    inserted={}
+    loaded_at=datetime.now()
+    for namespace, keys in recorded.items():
+        keys_in_dwh=db.load_df_from_query(engine, "select source_key from map_source_lineage where namespace='{}'".format(namespace))
+        new_keys=keys[~keys.source_key.isin(keys_in_dwh.source_key)].assign(namespace=namespace, loaded_at=loaded_at)
+        if not new_keys.empty:
+            db.insert_to_database(engine, new_keys[['namespace', 'source_key', 'source_folder', 'loaded_at']], 'map_source_lineage')
+        inserted[namespace]=len(new_keys.index)
+    return inserted
@@ -0,0 +1,60 @@
+import threading
+from variables import sourcepaths
+
+#state of the snapshot that is currently open, None if no snapshot is open
+_snapshot=None
+_lock=threading.Lock()
+
+
+def open_snapshot():
+    """Opens a snapshot over the sourcepaths. While it is open, every source file is parsed at most once
+    and all later requests for the same file are served from memory.
+    """
+    global _snapshot
+    with _lock:
+        _snapshot={'sourcepaths': sourcepaths, 'frames': {}, 'file_locks': {}, 'requests': 0, 'parses': 0}
+
+def close_snapshot():
+    """Closes the open snapshot, releases the cached DataFrames and prints how many parses were avoided.
+
+    Returns:
+        Tuple of the number of files parsed and the number of parses avoided.
+    """
+    global _snapshot
+    with _lock:
+        snapshot, _snapshot=_snapshot, None
+    if snapshot is None:
+        return 0, 0
+    avoided=snapshot['requests']-snapshot['parses']
+    print('Source snapshot of {}: {} files parsed, {} parses avoided'.format(', '.join(snapshot['sourcepaths']), snapshot['parses'], avoided))
+    return snapshot['parses'], avoided
+
+def is_open():
+    """Checks whether a snapshot is currently open.
+
+    Returns:
+        True if a snapshot is open, otherwise False.
+    """
+    return _snapshot is not None
+
+def get_sourcefile(filename, parse):
+    """Returns the content of a source file from the open snapshot, parsing it on first access.
+    Concurrent requests for the same file wait for a single parse.
+
+    Args:
+        filename (str): the name of the source file.
+        parse (function): function without arguments that parses the file into a DataFrame.
+
+    Returns:
+        A copy of the cached DataFrame, so that the pipelines can modify it without affecting other pipelines.
+    """
+    snapshot=_snapshot
+    with _lock:
+        snapshot['requests']+=1
+        file_lock=snapshot['file_locks'].setdefault(filename, threading.Lock())
+    with file_lock:
+        if filename not in snapshot['frames']:
+            snapshot['frames'][filename]=parse()
+            with _lock:
+                snapshot['parses']+=1
+    return snapshot['frames'][filename].copy()
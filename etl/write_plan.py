@@ -0,0 +1,95 @@
+import etl.database as db
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+#the DDL the foreign key graph is parsed from
+SCHEMA_FILE='schema_creation.sql'
+FOREIGN_KEY_PATTERN=re.compile(r'ALTER TABLE public\.(\w+) ADD CONSTRAINT \w+\s+FOREIGN KEY \([\w, ]+\)\s+REFERENCES public\.(\w+)')
+
+
+def load_foreign_key_graph(schema_file=SCHEMA_FILE):
+    """Parses the foreign key constraints of the schema DDL into a graph of table dependencies.
+
+    Args:
+        schema_file (str): path to the schema DDL.
+
+    Returns:
+        Dict of table name and the set of table names it references.
+    """
+    with open(schema_file) as file:
+        ddl=file.read()
+    graph={}
+    for table, referenced_table in FOREIGN_KEY_PATTERN.findall(ddl):
+        graph.setdefault(table, set()).add(referenced_table)
+    return graph
+
+def build_write_plan(tables, graph=None):
+    """Orders the target tables of a pipeline into levels: a table is in the level after the last of the tables it references among the targets.
+    The tables of one level do not depend on each other and can be written in parallel.
+
+    Args:
+        tables (list): names of the tables the pipeline writes.
+        graph (dict): the foreign key graph from load_foreign_key_graph(), parsed from SCHEMA_FILE if not given.
+
+    Returns:
+        List of levels, each a list of table names in the order they were given.
+    """
+    graph=load_foreign_key_graph() if graph is None else graph
+    levels={}
+    def level(table):
+        if table not in levels:
+            levels[table]=max((level(referenced)+1 for referenced in graph.get(table, set()) if referenced in tables and referenced!=table), default=0)
+        return levels[table]
+    for table in tables:
+        level(table)
+    return [[table for table in tables if levels[table]==number] for number in range(max(levels.values(), default=-1)+1)]
+
+def execute_write_plan(engine, plan, frames, on_committed=None):
+    """Writes the tables of a write plan level by level. The tables of a level are copied in parallel, each over its own pooled connection.
+    The tables of a level are only committed when all of them were copied, otherwise all of them are rolled back. Each table is then committed on its own
+    connection, one after another, so the commits of a level are not atomic: if a commit fails, the tables committed before it stay committed and are reported
+    to on_committed, so that a resumed run only loads the others. The next level starts after the commits, as rows of an uncommitted transaction are not visible
+    to the foreign key checks of the other connections.
+
+    Args:
+        engine (SQL Alchemy engine object): The engine for the target database.
+        plan (list): the levels from build_write_plan().
+        frames (dict): table name and DataFrame to insert. Tables of the plan that are not in frames are skipped.
+        on_committed (function): called with the table name after the table was committed.
+
+    Returns:
+        Dict of table name and the seconds it took to copy the table.
+
+    Raises:
+        The first exception raised while copying a level, after the level was rolled back, or the exception of a failed commit.
+    """
+    timings={}
+    for tables in plan:
+        tables=[table for table in tables if table in frames]
+        if not tables:
+            continue
+        connections={table: engine.raw_connection() for table in tables}
+        try:
+            with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+                futures={table: executor.submit(_timed_copy, connections[table], frames[table], table) for table in tables}
+            errors=[future.exception() for future in futures.values() if future.exception() is not None]
+            if errors:
+                for connection in connections.values():
+                    connection.rollback()
+                raise errors[0]
+            for table in tables:
+                connections[table].commit()
+                timings[table]=futures[table].result()
+                if on_committed:
+                    on_committed(table)
+        finally:
+            for connection in connections.values():
+                connection.close()
+    return timings
+
+def _timed_copy(connection, data, table):
+    """Copies a DataFrame into a table and returns the seconds it took."""
+    start=time.perf_counter()
+    db.copy_into_table(connection, data, table)
+    return time.perf_counter()-start
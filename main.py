@@ -1,92 +1,284 @@
-import etl.database as db
-import etl.dim_keyword as keyw
-import etl.dim_author as auth
-import etl.dim_journal as jour
-import etl.dim_paper as pape
-import etl.dim_paragraph as para
-import etl.dim_sentence as sent
-import etl.dim_entity as enti
-import etl.fact_entity_detection as fact
-import etl.aggregation_paper as agg_pape
-from credentials import DB_CONNECTION_PARAMS
-import pandas as pd
-pd.options.mode.chained_assignment = None  # default='warn'
+from contextlib import nullcontext
+from datetime import datetime
+import argparse
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """Imports a module lazily: it is only executed on the first attribute access, so every process step only loads the modules it uses.
+
+    Args:
+        name (str): the absolute name of the module.
+
+    Returns:
+        The module object, which is also registered in sys.modules.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec=importlib.util.find_spec(name)
+    loader=importlib.util.LazyLoader(spec.loader)
+    spec.loader=loader
+    module=importlib.util.module_from_spec(spec)
+    sys.modules[name]=module
+    loader.exec_module(module)
+    return module
+
+db=lazy_import('etl.database')
+cp=lazy_import('etl.checkpoint')
+ss=lazy_import('etl.source_snapshot')
+sl=lazy_import('etl.source_lineage')
+ql=lazy_import('etl.query_log')
+rl=lazy_import('etl.run_log')
+wp=lazy_import('etl.write_plan')
+keyw=lazy_import('etl.dim_keyword')
+auth=lazy_import('etl.dim_author')
+ares=lazy_import('etl.author_resolution')
+jour=lazy_import('etl.dim_journal')
+pape=lazy_import('etl.dim_paper')
+para=lazy_import('etl.dim_paragraph')
+sent=lazy_import('etl.dim_sentence')
+enti=lazy_import('etl.dim_entity')
+fact=lazy_import('etl.fact_entity_detection')
+agg_pape=lazy_import('etl.aggregation_paper')
+agg_ent=lazy_import('etl.aggregation_entity')
+pexp=lazy_import('etl.parquet_export')
+im=lazy_import('etl.inferred_members')
+kd=lazy_import('etl.key_dictionary')
+
+
+#every stage output (extract, transform, delta) is checkpointed under the run id, every insert is only executed once per run id
+def keyword_etl(eng, run_id, args):
+    step='Keyword ETL'
+    keywords_in_dwh = db.load_full_table(eng, 'dim_keyword')
+    unique_source_keywords=cp.run_stage(run_id, step, 'extract', keyw.extract_unique_keywords_from_file)
+    delta_keywords=cp.run_stage(run_id, step, 'delta', keyw.transform_delta_keywords, unique_source_keywords, im.known_members(keywords_in_dwh))
+    load_dimension(eng, run_id, step, delta_keywords, keywords_in_dwh, 'dim_keyword')
+
+def author_etl(eng, run_id, args):
+    step='Author ETL'
+    authors_in_dwh = db.load_full_table(eng, 'dim_author')
+    source_authors=cp.run_stage(run_id, step, 'extract', auth.extract_unique_authors_from_files)
+    #near-duplicate authors are merged before the delta, the merge map is kept to redirect their papers to the merged author
+    resolved_authors, merge_map=cp.run_stage(run_id, step, 'resolve', ares.resolve_authors, source_authors)
+    delta_authors=cp.run_stage(run_id, step, 'delta', auth.tramsform_delta_authors, resolved_authors, im.known_members(authors_in_dwh))
+    delta_merge_map=cp.run_stage(run_id, step, 'delta_merge_map', ares.find_delta_merge_map, merge_map, db.load_full_table(eng, 'map_author_merge'))
+    load_dimension(eng, run_id, step, delta_authors, authors_in_dwh, 'dim_author')
+    cp.load_stage(run_id, step, eng, delta_merge_map, 'map_author_merge')
+
+def journal_etl(eng, run_id, args):
+    step='Journal ETL'
+    journals_in_dwh=db.load_full_table(eng, 'dim_journal')
+    source_journals=cp.run_stage(run_id, step, 'extract', jour.extract_unique_journals_from_files)
+    delta_journals=cp.run_stage(run_id, step, 'delta', jour.transform_delta_journals, source_journals, im.known_members(journals_in_dwh))
+    load_dimension(eng, run_id, step, delta_journals, journals_in_dwh, 'dim_journal')
+
+def paper_etl(eng, run_id, args):
+    step='Paper ETL'
+    articles_df, references_df=cp.run_stage(run_id, step, 'extract', pape.extract_all_papers)
+    #first prepare papers from 'papers_final'. Papers, their keywords and their authors are kept in separate frames keyed by paper
+    articles_prep, article_keywords, article_authors=cp.run_stage(run_id, step, 'transform_papers', pape.transform_papers, articles_df, eng)
+    references_prep, reference_authors=cp.run_stage(run_id, step, 'transform_references', pape.transform_references, references_df, eng)
+    final_source_papers, paper_keywords, paper_authors=cp.run_stage(run_id, step, 'merge', pape.merge_all_papers, references_prep, reference_authors, articles_prep, article_keywords, article_authors)
+    papers_in_dwh=db.load_full_table(eng, 'dim_paper')
+    #existing keyword and author groups are reused for papers with the same keywords or authors
+    keyword_bridge_in_dwh=db.load_full_table(eng, 'bridge_paper_keyword')
+    author_bridge_in_dwh=db.load_full_table(eng, 'bridge_paper_author')
+    if args.pipelined:
+        updates={}
+        load_pipelined(eng, run_id, step, resolve_pipelined(run_id, step, cp.run_stage_tables(run_id, step, 'delta_tables', pape.iter_delta_papers, final_source_papers, paper_keywords, paper_authors, im.known_members(papers_in_dwh), keyword_bridge_in_dwh, author_bridge_in_dwh), papers_in_dwh, 'dim_paper', updates))
+        im.update_members(eng, 'dim_paper', updates['dim_paper'])
+        return
+    delta_papers, delta_keywordgroup, delta_keywordbridge, delta_authorgroup, delta_authorbridge=cp.run_stage(run_id, step, 'delta', pape.find_delta_papers, final_source_papers, paper_keywords, paper_authors, im.known_members(papers_in_dwh), keyword_bridge_in_dwh, author_bridge_in_dwh)
+    #papers inferred by the Paragraph or Sentence ETL are updated instead of inserted
+    delta_papers, paper_updates=cp.run_stage(run_id, step, 'resolve_inferred', im.resolve_inferred, delta_papers, papers_in_dwh, 'dim_paper')
+    #insert everything to db tables. Attention, order matters here to not violate foreign key constraints!
+    load_tables(eng, run_id, step, args, {'dim_keywordgroup': delta_keywordgroup, 'bridge_paper_keyword': delta_keywordbridge, 'dim_authorgroup': delta_authorgroup, 'bridge_paper_author': delta_authorbridge, 'dim_paper': delta_papers})
+    im.update_members(eng, 'dim_paper', paper_updates)
+
+def paragraph_etl(eng, run_id, args):
+    step='Paragraph ETL'
+    paragraphs_in_dwh=db.load_full_table(eng, 'dim_paragraph')
+    source_paragraphs=cp.run_stage(run_id, step, 'extract', para.extract_unique_paragraphs_from_file)
+    transformed_paragraphs=cp.run_stage(run_id, step, 'transform', para.transform_paragraphs, source_paragraphs, eng)
+    delta_paragraphs=cp.run_stage(run_id, step, 'delta', para.find_delta_paragraphs, transformed_paragraphs, im.known_members(paragraphs_in_dwh))
+    load_dimension(eng, run_id, step, delta_paragraphs, paragraphs_in_dwh, 'dim_paragraph')
+
+def sentence_etl(eng, run_id, args):
+    step='Sentence ETL'
+    #only the keys and the stored codes of the sentences are needed for the diff
+    sentences_in_dwh=kd.load_codes(eng, 'dim_sentence', ['citationgroup_pk'])
+    source_sentences=cp.run_stage(run_id, step, 'extract', sent.extract_sentences_from_files)
+    if args.shards>1:
+        #transform and diff in one stage, shard by shard in a process pool
+        delta_citationgroup, delta_sentence_citation_bridge, delta_sentences=cp.run_stage(run_id, step, 'delta', sent.find_delta_sentences_sharded, source_sentences, sentences_in_dwh, eng, args.shards)
+        load_tables(eng, run_id, step, args, {'dim_citationgroup': delta_citationgroup, 'bridge_sentence_citation': delta_sentence_citation_bridge, 'dim_sentence': delta_sentences})
+        return
+    transformed_sentences=cp.run_stage(run_id, step, 'transform', sent.transform_sentences, source_sentences, eng)
+    if args.pipelined:
+        load_pipelined(eng, run_id, step, cp.run_stage_tables(run_id, step, 'delta_tables', sent.iter_delta_sentences, transformed_sentences, sentences_in_dwh, eng))
+        return
+    delta_citationgroup, delta_sentence_citation_bridge, delta_sentences=cp.run_stage(run_id, step, 'delta', sent.find_delta_sentences, transformed_sentences, sentences_in_dwh, eng)
+    load_tables(eng, run_id, step, args, {'dim_citationgroup': delta_citationgroup, 'bridge_sentence_citation': delta_sentence_citation_bridge, 'dim_sentence': delta_sentences})
+
+def load_tables(eng, run_id, step, args, frames):
+    #frames are given in foreign key order. With --parallel-load, tables without foreign keys between them are copied in parallel over separate connections, then committed one by one, each table is marked loaded after its own commit
+    if args.parallel_load:
+        pending={table: data for table, data in frames.items() if not cp.is_loaded(run_id, step, table)}
+        timings=wp.execute_write_plan(eng, wp.build_write_plan(list(frames)), pending, lambda table: cp.mark_loaded(run_id, step, table))
+        for table, seconds in timings.items():
+            print('{}: {} copied in {:.2f}s'.format(step, table, seconds))
+    else:
+        for table, data in frames.items():
+            cp.load_stage(run_id, step, eng, data, table)
+
+def load_dimension(eng, run_id, step, delta, in_dwh, table):
+    #inferred members that a dependent pipeline inserted before are overwritten with the real attributes, the other delta rows are inserted
+    inserts, updates=cp.run_stage(run_id, step, 'resolve_inferred', im.resolve_inferred, delta, in_dwh, table)
+    cp.load_stage(run_id, step, eng, inserts, table)
+    im.update_members(eng, table, updates)
+
+def resolve_pipelined(run_id, step, tables, in_dwh, dimension, updates):
+    #resolves the inferred members of one dimension in a stream of delta tables, the updates are collected to be applied after the inserts
+    for table, data in tables:
+        if table==dimension:
+            data, updates[table]=cp.run_stage(run_id, step, 'resolve_inferred', im.resolve_inferred, data, in_dwh, table)
+        yield table, data
+
+def load_pipelined(eng, run_id, step, tables):
+    #the delta tables are yielded in foreign key order and written by a separate thread while the next ones are produced
+    waits=db.pipelined_insert(eng, tables, lambda data, table: cp.load_stage(run_id, step, eng, data, table))
+    print('{}: waited {:.2f}s for the writer'.format(step, sum(waits.values())))
+
+def entity_etl(eng, run_id, args):
+    step='Entity ETL'
+    entities_in_dwh=db.load_full_table(eng, 'dim_entity')
+    source_entities=cp.run_stage(run_id, step, 'extract', enti.extract_entities_from_file)
+    delta_dimension_entities, delta_entities=cp.run_stage(run_id, step, 'delta', enti.transform_delta_entities, source_entities, entities_in_dwh)
+    cp.load_stage(run_id, step, eng, delta_dimension_entities, 'dim_entity')
+    all_entities_in_dwh=db.load_full_table(eng, 'dim_entity')
+    delta_entity_hierarchy_map=cp.run_stage(run_id, step, 'delta_hierarchy', enti.transform_delta_entity_hierarchy_map, delta_entities, all_entities_in_dwh)
+    cp.load_stage(run_id, step, eng, delta_entity_hierarchy_map, 'map_entity_hierarchy')
+
+def fact_etl(eng, run_id, args):
+    step='Fact ETL'
+    source_facts=cp.run_stage(run_id, step, 'extract', fact.extract_unique_facts_from_file)
+    #not sharded with --shards: the key lookup takes well under a second, less than sending the arrays to a process pool (benchmarks/fact_sharding.py)
+    transformed_facts=cp.run_stage(run_id, step, 'transform', fact.transform_facts, source_facts, eng)
+    watermark=fact.load_fact_watermark(eng)
+    if args.fact_delta=='incremental':
+        transformed_facts=fact.filter_above_watermark(transformed_facts, watermark)
+    #the rollups over the entity hierarchy are filled from all facts once, afterwards only the delta of each partition is added
+    if not cp.is_loaded(run_id, step, 'rollup_backfill'):
+        agg_ent.backfill_rollups(eng)
+        cp.mark_loaded(run_id, step, 'rollup_backfill')
+    ancestors=agg_ent.load_entity_ancestors(eng)
+    #diff and load one partition of the fact table at a time
+    for partition_no, partition_facts in fact.split_fact_partitions(transformed_facts):
+        delta_facts=cp.run_stage(run_id, step, 'delta_p{}'.format(partition_no), fact.find_delta_fact_partition, partition_facts, partition_no, eng, args.fact_delta, watermark)
+        if not delta_facts.empty:
+            fact.create_fact_partition(eng, partition_no)
+            rollups=cp.run_stage(run_id, step, 'rollup_p{}'.format(partition_no), agg_ent.calc_rollups, delta_facts, partition_no, ancestors, eng)
+            #the facts, wide_sentence_entity, the rollups and fact_partition_log are committed together and only once per run id, as the rollup upsert adds to existing rows
+            if not cp.is_loaded(run_id, step, 'fact_entity_detection_p{}'.format(partition_no)):
+                fact.load_delta_partition(eng, delta_facts, partition_no, rollups)
+                cp.mark_loaded(run_id, step, 'fact_entity_detection_p{}'.format(partition_no))
+    if not transformed_facts.empty:
+        fact.save_fact_watermark(eng, max(watermark, transformed_facts.sentence_pk.max()))
+
+def aggregation_paper_etl(eng, run_id, args):
+    partitions=agg_pape.load_unaggregated_partitions(eng)
+    if agg_pape.is_sentence_entity_empty(eng):
+        fact.backfill_sentence_entity(eng)
+    #only recalculate the papers that have new facts in one of the partitions loaded since the last aggregation, and papers without a row yet
+    sentences_with_ents, papers_in_dwh=agg_pape.extract_source_data(eng, partitions.partition_no.to_list())
+    aggregated_papers=agg_pape.calc_agg_columns(sentences_with_ents, papers_in_dwh)
+    agg_pape.replace_aggregated_papers(eng, aggregated_papers, partitions)
+
+def full_etl(eng, run_id, args):
+    cp.register_run(run_id, 'Full ETL')
+    #all pipelines in dependency order, within one run every source file is parsed only once
+    for step in FULL_ETL_ORDER:
+        print('Executing {}'.format(step))
+        run_pipeline(eng, run_id, args, step)
+
+def run_pipeline(eng, run_id, args, step):
+    #pipelines whose source files, upstream tables and target tables are unchanged since their last successful run are skipped
+    ql.set_step(step)
+    if step not in rl.PIPELINE_INPUTS:
+        PROCESS_STEPS[step](eng, run_id, args)
+        return
+    started_at=datetime.now()
+    source, upstream=rl.input_fingerprints(eng, step)
+    if not args.force and rl.is_unchanged(eng, step, source, upstream):
+        print('{}: sources and upstream tables unchanged since the last successful run, nothing to do'.format(step))
+        rl.log_run(eng, run_id, step, source, upstream, 'skipped', started_at)
+        return
+    PROCESS_STEPS[step](eng, run_id, args)
+    rl.log_run(eng, run_id, step, source, upstream, 'success', started_at)
+
+def parquet_export(eng, run_id, args):
+    for table, rows in pexp.export_warehouse(eng).items():
+        print('{}: {} rows exported'.format(table, rows))
+
+def create_indexes(eng, run_id, args):
+    for index_name, seconds in db.create_indexes(eng).items():
+        print('{}: {:.2f}s'.format(index_name, seconds))
+
+
+PROCESS_STEPS={
+    'Keyword ETL': keyword_etl,
+    'Author ETL': author_etl,
+    'Journal ETL': journal_etl,
+    'Paper ETL': paper_etl,
+    'Paragraph ETL': paragraph_etl,
+    'Sentence ETL': sentence_etl,
+    'Entity ETL': entity_etl,
+    'Fact ETL': fact_etl,
+    'Aggregation Paper ETL': aggregation_paper_etl,
+    'Full ETL': full_etl,
+    'Parquet Export': parquet_export,
+    'Create Indexes': create_indexes
+}
+
+FULL_ETL_ORDER=['Keyword ETL', 'Author ETL', 'Journal ETL', 'Paper ETL', 'Paragraph ETL', 'Sentence ETL', 'Entity ETL', 'Fact ETL', 'Aggregation Paper ETL']
 
 
 if __name__ == "__main__":
-    
+    parser=argparse.ArgumentParser()
+    parser.add_argument('--bulk-load', action='store_true', help='drop secondary indexes and foreign keys during the load and rebuild them afterwards')
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='RUN_ID', help='resume the given run (default: the latest run of the step) from its last completed stage')
+    parser.add_argument('--fact-delta', choices=['full-diff', 'anti-join', 'incremental'], default='anti-join', help='how the Fact ETL finds new facts: compare all columns, anti-join on (sentence_pk, entity_pk), or anti-join only above the high-water mark of the last run')
+    parser.add_argument('--pipelined', action='store_true', help='Paper ETL and Sentence ETL: insert each delta table in a writer thread while the next ones are still being produced')
+    parser.add_argument('--parallel-load', action='store_true', help='Paper ETL and Sentence ETL: copy tables that do not reference each other in parallel over separate connections, level by level of the foreign key graph')
+    parser.add_argument('--shards', type=int, default=1, metavar='N', help='Sentence ETL: transform and diff the new sentences in N shards in a process pool')
+    parser.add_argument('--explain', action='store_true', help='capture EXPLAIN (ANALYZE, BUFFERS) of every read that takes longer than a second for the query report. Such reads are executed twice')
+    parser.add_argument('--force', action='store_true', help='run the pipelines even if their sources and upstream tables are unchanged since their last successful run')
+    args=parser.parse_args()
+
     process_step = input('Which process step should be executed? ')
-    #initialize engine
-    eng=db.initialize_engine(connection_params=DB_CONNECTION_PARAMS)
-
-    if process_step == 'Keyword ETL':
-        keywords_in_dwh = db.load_full_table(eng, 'dim_keyword')
-        unique_source_keywords=keyw.extract_unique_keywords_from_file()
-        delta_keywords=keyw.transform_delta_keywords(unique_source_keywords, keywords_in_dwh)
-        db.insert_to_database(eng, delta_keywords, 'dim_keyword')
-    
-    elif process_step == 'Author ETL':
-        authors_in_dwh = db.load_full_table(eng, 'dim_author')
-        source_authors=auth.extract_unique_authors_from_files()
-        delta_authors=auth.tramsform_delta_authors(source_authors, authors_in_dwh)
-        db.insert_to_database(eng, delta_authors, 'dim_author')
-            
-    elif process_step == 'Journal ETL':
-        journals_in_dwh=db.load_full_table(eng, 'dim_journal')
-        source_journals=jour.extract_unique_journals_from_files()
-        delta_journals=jour.transform_delta_journals(source_journals, journals_in_dwh)
-        db.insert_to_database(eng, delta_journals, 'dim_journal')
-        
-    elif process_step == 'Paper ETL':
-        articles_df, references_df=pape.extract_all_papers()
-        #first prepare papers from 'papers_final'
-        articles_prep=pape.transform_papers(articles_df, eng)
-        references_prep=pape.transform_references(references_df, eng)
-        final_source_papers=pape.merge_all_papers(references_prep, articles_prep)
-        papers_in_dwh=db.load_full_table(eng, 'dim_paper')
-        delta_papers, delta_keywordgroup, delta_keywordbridge, delta_authorgroup, delta_authorbridge=pape.find_delta_papers(final_source_papers, papers_in_dwh)
-        #insert everything to db tables. Attention, order matters here to not violate foreign key constraints!
-        db.insert_to_database(eng, delta_keywordgroup, 'dim_keywordgroup')
-        db.insert_to_database(eng, delta_keywordbridge, 'bridge_paper_keyword')
-        db.insert_to_database(eng, delta_authorgroup, 'dim_authorgroup')
-        db.insert_to_database(eng, delta_authorbridge, 'bridge_paper_author')
-        db.insert_to_database(eng, delta_papers, 'dim_paper')
-
-    elif process_step== 'Paragraph ETL':
-        paragraphs_in_dwh=db.load_full_table(eng, 'dim_paragraph')
-        source_paragraphs=para.extract_unique_paragraphs_from_file()
-        transformed_paragraphs=para.transform_paragraphs(source_paragraphs, eng)
-        delta_paragraphs=para.find_delta_paragraphs(transformed_paragraphs, paragraphs_in_dwh)
-        db.insert_to_database(eng, delta_paragraphs, 'dim_paragraph')
-
-    elif process_step == 'Sentence ETL':
-        sentences_in_dwh=db.load_full_table(eng, 'dim_sentence')
-        source_sentences=sent.extract_sentences_from_files()
-        transformed_sentences=sent.transform_sentences(source_sentences, eng)
-        delta_citationgroup, delta_sentence_citation_bridge, delta_sentences=sent.find_delta_sentences(transformed_sentences, sentences_in_dwh)
-        db.insert_to_database(eng, delta_citationgroup, 'dim_citationgroup')
-        db.insert_to_database(eng, delta_sentence_citation_bridge, 'bridge_sentence_citation')
-        db.insert_to_database(eng, delta_sentences, 'dim_sentence')
-
-    elif process_step == 'Entity ETL':
-        entities_in_dwh=db.load_full_table(eng, 'dim_entity')
-        source_entities=enti.extract_entities_from_file()
-        delta_dimension_entities, delta_entities=enti.transform_delta_entities(source_entities, entities_in_dwh)
-        db.insert_to_database(eng, delta_dimension_entities, 'dim_entity')
-        all_entities_in_dwh=db.load_full_table(eng, 'dim_entity')
-        delta_entity_hierarchy_map=enti.transform_delta_entity_hierarchy_map(delta_entities, all_entities_in_dwh)
-        db.insert_to_database(eng, delta_entity_hierarchy_map, 'map_entity_hierarchy')
-    
-    elif process_step == 'Fact ETL':
-        facts_in_dwh=db.load_full_table(eng, 'fact_entity_detection')
-        source_facts=fact.extract_unique_facts_from_file()
-        delta_facts=fact.transform_delta_facts(source_facts, facts_in_dwh, eng)
-        db.insert_to_database(eng, delta_facts, 'fact_entity_detection')
-
-    elif process_step == 'Aggregation Paper ETL':
-        sentences_with_ents, papers_in_dwh=agg_pape.extract_source_data(eng)
-        aggregated_papers=agg_pape.calc_agg_columns(sentences_with_ents, papers_in_dwh)
-        db.insert_to_database(eng, aggregated_papers, 'aggregation_paper', if_exists='replace')
-        
+
+    if process_step in PROCESS_STEPS:
+        #pandas, SQLAlchemy and the pipeline modules are only loaded once a valid step is chosen
+        import pandas as pd
+        pd.options.mode.chained_assignment = None  # default='warn'
+        from credentials import DB_CONNECTION_PARAMS
+        #initialize engine
+        eng=db.initialize_engine(connection_params=DB_CONNECTION_PARAMS)
+        ql.instrument_engine(eng, explain=args.explain)
+        run_id=cp.latest_run_id(process_step) if args.resume=='latest' else args.resume
+        if run_id is None:
+            run_id=cp.new_run_id()
+        print('Run id: {}'.format(run_id))
+        ss.open_snapshot()
+        try:
+            with db.bulk_load_mode(eng) if args.bulk_load else nullcontext():
+                run_pipeline(eng, run_id, args, process_step)
+            #the result folder of the source keys parsed in this run
+            for namespace, rows in sl.save_lineage(eng).items():
+                print('Lineage: {} new {} keys'.format(rows, namespace))
+        finally:
+            ss.close_snapshot()
+            print('Query report: {}'.format(ql.write_report(run_id)))
     else:
-        pass 
\ No newline at end of file
+        pass
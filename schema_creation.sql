@@ -24,6 +24,7 @@ CREATE TABLE public.dim_journal (
                 issue INTEGER NOT NULL,
                 publisher VARCHAR NOT NULL,
                 place VARCHAR NOT NULL,
+                inferred BOOLEAN DEFAULT false NOT NULL,
                 CONSTRAINT dim_journal_pk PRIMARY KEY (journal_pk)
 );
 
@@ -41,7 +42,7 @@ CREATE TABLE public.aggregation_paper (
                 article_source_id INTEGER NOT NULL,
                 model_element VARCHAR NOT NULL,
                 level VARCHAR NOT NULL,
-                partcipants VARCHAR NOT NULL,
+                participants VARCHAR NOT NULL,
                 no_of_participants INTEGER NOT NULL,
                 collection_method VARCHAR NOT NULL,
                 sampling VARCHAR NOT NULL,
@@ -64,6 +65,7 @@ CREATE TABLE public.aggregation_paper (
 CREATE TABLE public.dim_keyword (
                 keyword_pk INTEGER NOT NULL,
                 keyword_string VARCHAR NOT NULL,
+                inferred BOOLEAN DEFAULT false NOT NULL,
                 CONSTRAINT dim_keyword_pk PRIMARY KEY (keyword_pk)
 );
 
@@ -84,6 +86,7 @@ CREATE TABLE public.dim_author (
                 department VARCHAR NOT NULL,
                 institution VARCHAR NOT NULL,
                 country VARCHAR NOT NULL,
+                inferred BOOLEAN DEFAULT false NOT NULL,
                 CONSTRAINT dim_author_pk PRIMARY KEY (author_pk)
 );
 
@@ -104,9 +107,11 @@ CREATE TABLE public.dim_paper (
                 year DATE NOT NULL,
                 title VARCHAR NOT NULL,
                 citekey VARCHAR NOT NULL,
+                citekey_code INTEGER,
                 abstract TEXT NOT NULL,
                 no_of_pages INTEGER NOT NULL,
                 article_source_id INTEGER NOT NULL,
+                inferred BOOLEAN DEFAULT false NOT NULL,
                 CONSTRAINT dim_paper_pk PRIMARY KEY (paper_pk)
 );
 
@@ -125,6 +130,8 @@ CREATE TABLE public.dim_paragraph (
                 heading VARCHAR NOT NULL,
                 paragraph_type VARCHAR NOT NULL,
                 para_source_id VARCHAR NOT NULL,
+                para_code INTEGER,
+                inferred BOOLEAN DEFAULT false NOT NULL,
                 CONSTRAINT dim_paragraph_pk PRIMARY KEY (paragraph_pk)
 );
 
@@ -133,6 +140,7 @@ CREATE TABLE public.dim_entity (
                 entity_pk INTEGER NOT NULL,
                 entity_label VARCHAR NOT NULL,
                 entity_name VARCHAR NOT NULL,
+                entity_code INTEGER,
                 CONSTRAINT entity_pk PRIMARY KEY (entity_pk)
 );
 
@@ -154,6 +162,7 @@ CREATE TABLE public.dim_sentence (
                 sentence_type VARCHAR NOT NULL,
                 sentence_string VARCHAR NOT NULL,
                 sentence_source_id VARCHAR NOT NULL,
+                sentence_code INTEGER,
                 CONSTRAINT sentence_pk PRIMARY KEY (sentence_pk)
 );
 
@@ -163,6 +172,108 @@ CREATE TABLE public.fact_entity_detection (
                 sentence_pk INTEGER NOT NULL,
                 entity_count INTEGER NOT NULL,
                 CONSTRAINT fact_id PRIMARY KEY (entity_pk, sentence_pk)
+) PARTITION BY RANGE (sentence_pk);
+
+
+-- further partitions of fact_partition_size (variables.py) sentence_pks each are created by the Fact ETL
+CREATE TABLE public.fact_entity_detection_p0 PARTITION OF public.fact_entity_detection
+                FOR VALUES FROM (0) TO (500000);
+
+
+CREATE TABLE public.fact_partition_log (
+                partition_no INTEGER NOT NULL,
+                loaded_at TIMESTAMP NOT NULL,
+                aggregated_at TIMESTAMP,
+                CONSTRAINT fact_partition_log_pk PRIMARY KEY (partition_no)
+);
+
+
+-- denormalized facts with their sentence, paragraph and entity attributes, the input of the Aggregation Paper ETL. Appended by the Fact ETL
+CREATE TABLE public.wide_sentence_entity (
+                sentence_pk INTEGER NOT NULL,
+                entity_pk INTEGER NOT NULL,
+                paper_pk INTEGER,
+                heading VARCHAR,
+                paragraph_type VARCHAR,
+                sentence_type VARCHAR,
+                sentence_string VARCHAR,
+                entity_label VARCHAR NOT NULL,
+                entity_name VARCHAR NOT NULL,
+                entity_count INTEGER NOT NULL,
+                CONSTRAINT wide_sentence_entity_pk PRIMARY KEY (sentence_pk, entity_pk)
+);
+
+
+-- facts rolled up to every ancestor of their entity in map_entity_hierarchy (depth 0 is the entity itself). Upserted from the fact delta by the Fact ETL
+CREATE TABLE public.aggregation_entity_hierarchy (
+                parent_entity_pk INTEGER NOT NULL,
+                depth_from_parent INTEGER NOT NULL,
+                highest_parent_flag BOOLEAN NOT NULL,
+                entity_count BIGINT NOT NULL,
+                fact_count BIGINT NOT NULL,
+                CONSTRAINT aggregation_entity_hierarchy_pk PRIMARY KEY (parent_entity_pk, depth_from_parent)
+);
+
+
+-- the same rollup per paper, summed over all depths below the parent entity
+CREATE TABLE public.aggregation_paper_entity (
+                paper_pk INTEGER NOT NULL,
+                parent_entity_pk INTEGER NOT NULL,
+                highest_parent_flag BOOLEAN NOT NULL,
+                entity_count BIGINT NOT NULL,
+                fact_count BIGINT NOT NULL,
+                CONSTRAINT aggregation_paper_entity_pk PRIMARY KEY (paper_pk, parent_entity_pk)
+);
+
+
+-- near-duplicate authors merged by the Author ETL and the author they were merged into, applied when papers are joined with dim_author
+CREATE TABLE public.map_author_merge (
+                surname VARCHAR NOT NULL,
+                firstname VARCHAR NOT NULL,
+                middlename VARCHAR NOT NULL,
+                canonical_surname VARCHAR NOT NULL,
+                canonical_firstname VARCHAR NOT NULL,
+                canonical_middlename VARCHAR NOT NULL,
+                CONSTRAINT map_author_merge_pk PRIMARY KEY (surname, firstname, middlename)
+);
+
+
+CREATE TABLE public.map_source_key (
+                namespace VARCHAR NOT NULL,
+                key_code INTEGER NOT NULL,
+                source_key VARCHAR NOT NULL,
+                CONSTRAINT map_source_key_pk PRIMARY KEY (namespace, key_code),
+                CONSTRAINT map_source_key_source_key_uq UNIQUE (namespace, source_key)
+);
+
+
+CREATE TABLE public.map_source_lineage (
+                namespace VARCHAR NOT NULL,
+                source_key VARCHAR NOT NULL,
+                source_folder VARCHAR NOT NULL,
+                loaded_at TIMESTAMP NOT NULL,
+                CONSTRAINT map_source_lineage_pk PRIMARY KEY (namespace, source_key)
+);
+
+
+CREATE TABLE public.etl_watermark (
+                pipeline VARCHAR NOT NULL,
+                high_water_mark INTEGER NOT NULL,
+                updated_at TIMESTAMP NOT NULL,
+                CONSTRAINT etl_watermark_pk PRIMARY KEY (pipeline)
+);
+
+
+CREATE TABLE public.etl_run (
+                run_id VARCHAR NOT NULL,
+                pipeline VARCHAR NOT NULL,
+                status VARCHAR NOT NULL,
+                source_fingerprint VARCHAR NOT NULL,
+                upstream_fingerprint VARCHAR NOT NULL,
+                target_fingerprint VARCHAR NOT NULL,
+                started_at TIMESTAMP NOT NULL,
+                finished_at TIMESTAMP NOT NULL,
+                CONSTRAINT etl_run_pk PRIMARY KEY (run_id, pipeline)
 );
 
 
@@ -292,9 +403,52 @@ ON DELETE NO ACTION
 ON UPDATE NO ACTION
 NOT DEFERRABLE;
 
+ALTER TABLE public.aggregation_entity_hierarchy ADD CONSTRAINT dim_entity_aggregation_entity_hierarchy_fk
+FOREIGN KEY (parent_entity_pk)
+REFERENCES public.dim_entity (entity_pk)
+ON DELETE NO ACTION
+ON UPDATE NO ACTION
+NOT DEFERRABLE;
+
+ALTER TABLE public.aggregation_paper_entity ADD CONSTRAINT dim_entity_aggregation_paper_entity_fk
+FOREIGN KEY (parent_entity_pk)
+REFERENCES public.dim_entity (entity_pk)
+ON DELETE NO ACTION
+ON UPDATE NO ACTION
+NOT DEFERRABLE;
+
+ALTER TABLE public.aggregation_paper_entity ADD CONSTRAINT dim_paper_aggregation_paper_entity_fk
+FOREIGN KEY (paper_pk)
+REFERENCES public.dim_paper (paper_pk)
+ON DELETE NO ACTION
+ON UPDATE NO ACTION
+NOT DEFERRABLE;
+
 ALTER TABLE public.fact_entity_detection ADD CONSTRAINT dim_sentence_fact_entity_detection_fk
 FOREIGN KEY (sentence_pk)
 REFERENCES public.dim_sentence (sentence_pk)
 ON DELETE NO ACTION
 ON UPDATE NO ACTION
-NOT DEFERRABLE;
\ No newline at end of file
+NOT DEFERRABLE;
+
+CREATE INDEX dim_sentence_sentence_source_id_idx ON public.dim_sentence (sentence_source_id);
+
+CREATE INDEX dim_sentence_paragraph_pk_idx ON public.dim_sentence (paragraph_pk);
+
+CREATE INDEX dim_paragraph_para_source_id_idx ON public.dim_paragraph (para_source_id);
+
+CREATE INDEX dim_paragraph_paper_pk_idx ON public.dim_paragraph (paper_pk);
+
+CREATE INDEX dim_paper_citekey_idx ON public.dim_paper (citekey);
+
+CREATE INDEX dim_paper_article_source_id_idx ON public.dim_paper (article_source_id);
+
+CREATE INDEX dim_entity_entity_name_idx ON public.dim_entity (entity_name);
+
+CREATE INDEX dim_author_name_idx ON public.dim_author (surname, firstname, middlename);
+
+CREATE INDEX fact_entity_detection_sentence_pk_idx ON public.fact_entity_detection (sentence_pk);
+
+CREATE INDEX wide_sentence_entity_paper_pk_idx ON public.wide_sentence_entity (paper_pk);
+
+CREATE INDEX aggregation_paper_entity_parent_entity_pk_idx ON public.aggregation_paper_entity (parent_entity_pk);
@@ -0,0 +1,34 @@
+import unittest
+import pandas as pd
+import etl.aggregation_paper as agg_pape
+
+
+def _papers_in_dwh():
+    """Rows of dim_paper as loaded from the DB, including the columns that are not part of aggregation_paper."""
+    return pd.DataFrame({
+        'paper_pk': [0, 1, 2], 'authorgroup_pk': [0, 1, 1], 'keywordgroup_pk': [0, 1, 2], 'journal_pk': [0, 1, 1],
+        'year': pd.to_datetime(['1678-01-01', '2020-01-01', '2021-01-01']), 'title': ['MISSING', 'first', 'second'],
+        'citekey': ['MISSING', 'smith2020', 'miller2021'], 'abstract': ['MISSING', 'abstract', 'abstract'],
+        'no_of_pages': [0, 10, 12], 'article_source_id': [0, 1, 2],
+        'citekey_code': pd.array([pd.NA, 3, pd.NA], dtype='Int32'), 'inferred': [False, False, True]})
+
+def _sentences_with_ents():
+    #the number of participants and the metric value are read from the sentences of these entities, so the sample has one of each
+    return pd.DataFrame({
+        'paper_pk': [1, 1, 1], 'heading': ['Method', 'Method', 'Results'], 'paragraph_type': ['TEXT', 'TEXT', 'TEXT'],
+        'sentence_string': ['We use a survey.', 'We asked 120 managers.', 'The accuracy was 0.9.'], 'sentence_type': ['SENTENCE', 'SENTENCE', 'SENTENCE'],
+        'entity_count': [1, 1, 1], 'entity_label': ['COLLECTION_METHOD', 'PARTICIPANTS', 'METRIC'], 'entity_name': ['survey', 'managers', 'accuracy']})
+
+
+class TestCalcAggColumns(unittest.TestCase):
+
+    def test_dimension_columns_are_not_copied(self):
+        aggregated=agg_pape.calc_agg_columns(_sentences_with_ents(), _papers_in_dwh())
+        self.assertNotIn('citekey_code', aggregated.columns)
+        self.assertNotIn('inferred', aggregated.columns)
+        self.assertEqual(sorted(aggregated.paper_pk.to_list()), [0, 1, 2])
+        self.assertEqual(aggregated.set_index('paper_pk').collection_method.to_dict(), {0: 'MISSING', 1: 'survey', 2: 'MISSING'})
+
+
+if __name__ == '__main__':
+    unittest.main()
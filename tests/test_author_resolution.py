@@ -0,0 +1,35 @@
+import unittest
+import pandas as pd
+import etl.author_resolution as ares
+
+
+def _authors(rows):
+    return pd.DataFrame(rows, columns=ares.NAME_COLUMNS+ares.ATTRIBUTE_COLUMNS)
+
+
+class TestResolveAuthors(unittest.TestCase):
+
+    def test_different_middle_initials_are_not_merged(self):
+        resolved, merge_map=ares.resolve_authors(_authors([
+            ['Smith', 'Christopher', 'A', 'MISSING', 'MISSING', 'MISSING', 'MISSING'],
+            ['Smith', 'Christopher', 'B', 'MISSING', 'MISSING', 'MISSING', 'MISSING']]))
+        self.assertEqual(len(resolved.index), 2)
+        self.assertTrue(merge_map.empty)
+
+    def test_middle_initial_matches_full_middlename(self):
+        resolved, merge_map=ares.resolve_authors(_authors([
+            ['Smith', 'Christopher', 'Alan', 'c.smith@example.org', 'MISSING', 'MISSING', 'MISSING'],
+            ['Smith', 'Christopher', 'A', 'MISSING', 'MISSING', 'MISSING', 'MISSING']]))
+        self.assertEqual(len(resolved.index), 1)
+        self.assertEqual(merge_map.canonical_middlename.to_list(), ['Alan'])
+
+    def test_missing_middlename_is_merged(self):
+        resolved, merge_map=ares.resolve_authors(_authors([
+            ['Abbott', 'Pamela', 'Y', 'MISSING', 'MISSING', 'MISSING', 'MISSING'],
+            ['Abbott', 'Pamela', 'MISSING', 'MISSING', 'MISSING', 'MISSING', 'MISSING']]))
+        self.assertEqual(len(resolved.index), 1)
+        self.assertEqual(merge_map.middlename.to_list(), ['MISSING'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+import etl.checkpoint as cp
+import etl.source_lineage as sl
+
+
+def _extract():
+    source_df=pd.DataFrame({'sentence_id': ['s1', 's2'], 'sentence': ['a', 'b'], 'source_folder': ['run1', 'run2']})
+    sl.record('sentences.csv', source_df)
+    return source_df.drop(columns=['source_folder'])
+
+
+class TestRunStageLineage(unittest.TestCase):
+
+    def setUp(self):
+        checkpoints=tempfile.TemporaryDirectory()
+        self.addCleanup(checkpoints.cleanup)
+        patcher=mock.patch.object(cp, 'checkpointpath', checkpoints.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(sl._recorded.clear)
+
+    def test_resumed_stage_records_lineage_again(self):
+        cp.run_stage('run', 'Sentence ETL', 'extract', _extract)
+        sl._recorded.clear()
+        resumed=cp.run_stage('run', 'Sentence ETL', 'extract', lambda: self.fail('stage was executed again'))
+        self.assertEqual(resumed.sentence_id.to_list(), ['s1', 's2'])
+        self.assertEqual(sl._recorded['sentence'].source_folder.to_list(), ['run1', 'run2'])
+
+    def test_stage_without_source_files_has_no_lineage(self):
+        cp.run_stage('run', 'Sentence ETL', 'delta', lambda: pd.DataFrame({'sentence_pk': [1]}))
+        sl._recorded.clear()
+        cp.run_stage('run', 'Sentence ETL', 'delta', lambda: self.fail('stage was executed again'))
+        self.assertEqual(sl._recorded, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+import pandas as pd
+from sqlalchemy import exc
+import etl.database as db
+
+
+def _engine(violated_fk=None):
+    """An engine whose ALTER TABLE ... ADD CONSTRAINT fails for the given constraint, as if the loaded data violated it."""
+    def execute(statement, *args):
+        if violated_fk and 'ADD CONSTRAINT {} '.format(violated_fk) in str(statement):
+            raise exc.IntegrityError(str(statement), {}, Exception('violates foreign key constraint'))
+    engine=mock.MagicMock()
+    engine.begin.return_value.__enter__.return_value.execute.side_effect=execute
+    return engine
+
+
+class TestBulkLoadMode(unittest.TestCase):
+
+    def setUp(self):
+        foreign_keys=pd.DataFrame({'table_name': ['dim_paper'], 'constraint_name': ['dim_journal_dim_paper_fk'], 'definition': ['FOREIGN KEY (journal_pk) REFERENCES dim_journal(journal_pk)']})
+        for name, value in {'load_foreign_keys': foreign_keys, 'drop_indexes': None, 'create_indexes': {}}.items():
+            patcher=mock.patch.object(db, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_failed_foreign_key_raises_after_successful_load(self):
+        with redirect_stdout(StringIO()), self.assertRaisesRegex(RuntimeError, 'ALTER TABLE dim_paper ADD CONSTRAINT dim_journal_dim_paper_fk'):
+            with db.bulk_load_mode(_engine('dim_journal_dim_paper_fk')):
+                pass
+
+    def test_load_error_is_not_replaced_by_failed_foreign_key(self):
+        output=StringIO()
+        with redirect_stdout(output), self.assertRaisesRegex(ValueError, 'load failed'):
+            with db.bulk_load_mode(_engine('dim_journal_dim_paper_fk')):
+                raise ValueError('load failed')
+        self.assertIn('ALTER TABLE dim_paper ADD CONSTRAINT dim_journal_dim_paper_fk', output.getvalue())
+
+    def test_load_error_is_not_replaced_by_failed_index(self):
+        db.create_indexes.side_effect=exc.OperationalError('CREATE INDEX', {}, Exception('out of disk space'))
+        with redirect_stdout(StringIO()), self.assertRaisesRegex(ValueError, 'load failed'):
+            with db.bulk_load_mode(_engine()):
+                raise ValueError('load failed')
+
+
+if __name__ == '__main__':
+    unittest.main()
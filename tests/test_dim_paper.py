@@ -0,0 +1,45 @@
+import unittest
+import pandas as pd
+import etl.dim_paper as pape
+
+
+PAPER_COLUMNS=['article_id', 'citekey', 'abstract', 'year', 'title', 'no_of_pages', 'journal_pk']
+
+
+def _source_papers():
+    return pd.DataFrame([[1, 'smith2020', 'abstract', pd.Timestamp('2020-01-01'), 'title', 10, 0]], columns=PAPER_COLUMNS)
+
+def _papers_in_dwh():
+    papers=_source_papers().rename(columns={'article_id': 'article_source_id'}).assign(paper_pk=1, keywordgroup_pk=1, authorgroup_pk=1)
+    dummy=pd.DataFrame([{'paper_pk': 0, 'article_source_id': 0, 'citekey': 'MISSING', 'abstract': 'MISSING', 'year': pd.Timestamp('1678-01-01'), 'title': 'MISSING', 'no_of_pages': 0, 'journal_pk': 0, 'keywordgroup_pk': 0, 'authorgroup_pk': 0}])
+    return pd.concat([dummy, papers], ignore_index=True)
+
+def _bridges():
+    keyword_bridge=pd.DataFrame({'keywordgroup_pk': [0, 1, 1], 'keyword_pk': [0, 5, 6]})
+    author_bridge=pd.DataFrame({'authorgroup_pk': [0, 1], 'author_position': [0, 1], 'author_pk': [0, 7]})
+    return keyword_bridge, author_bridge
+
+
+class TestFindDeltaPapers(unittest.TestCase):
+
+    def test_unchanged_paper_is_no_delta(self):
+        keyword_bridge, author_bridge=_bridges()
+        paper_keywords=pd.DataFrame({'citekey': ['smith2020', 'smith2020'], 'keyword_pk': [6, 5]})
+        paper_authors=pd.DataFrame({'citekey': ['smith2020'], 'author_position': [1], 'author_pk': [7]})
+        delta_papers, *_=pape.find_delta_papers(_source_papers(), paper_keywords, paper_authors, _papers_in_dwh(), keyword_bridge, author_bridge)
+        self.assertTrue(delta_papers.empty)
+
+    def test_changed_keywords_make_a_delta_paper(self):
+        keyword_bridge, author_bridge=_bridges()
+        paper_keywords=pd.DataFrame({'citekey': ['smith2020'], 'keyword_pk': [5]})
+        paper_authors=pd.DataFrame({'citekey': ['smith2020'], 'author_position': [1], 'author_pk': [7]})
+        delta_papers, delta_keywordgroup, _, delta_authorgroup, _=pape.find_delta_papers(_source_papers(), paper_keywords, paper_authors, _papers_in_dwh(), keyword_bridge, author_bridge)
+        self.assertEqual(delta_papers.citekey.to_list(), ['smith2020'])
+        self.assertEqual(delta_papers.keywordgroup_pk.to_list(), [2])
+        self.assertEqual(delta_papers.authorgroup_pk.to_list(), [1])
+        self.assertEqual(delta_keywordgroup.keywordgroup_pk.to_list(), [2])
+        self.assertTrue(delta_authorgroup.empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,2 +1,14 @@
-#source path to the raw data (CauseMiner output CSVs)
-sourcepath='/home/muellerrol/causeminer2/reports/2021_12_06_153039_results'
\ No newline at end of file
+#source paths to the raw data (CauseMiner output CSVs). With several result folders, the source files of all folders are unioned and deduplicated in one run
+sourcepaths=['/home/muellerrol/causeminer2/reports/2021_12_06_153039_results']
+#number of sentence_pks per range partition of fact_entity_detection, must match the bounds of fact_entity_detection_p0 in schema_creation.sql
+fact_partition_size=500000
+#folder for the checkpoints of pipeline stages, needed to resume failed runs with main.py --resume
+checkpointpath='checkpoints'
+#CSV parser used to read the source files: 'pyarrow' (multithreaded pyarrow.csv, reads quoted newlines in values) or 'c' (pandas' default parser)
+csv_engine='pyarrow'
+#how tables and query results are read from the DB: 'copy' (COPY TO STDOUT parsed by pyarrow) or 'read_sql' (pandas.read_sql_*)
+db_read_path='copy'
+#folder for the partitioned Parquet export of the warehouse (process step 'Parquet Export')
+exportpath='export'
+#folder for the per-run reports of the query instrumentation (timings, rows and bytes per statement, query plans with main.py --explain)
+querylogpath='query_reports'